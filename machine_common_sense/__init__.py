@@ -1,24 +1,69 @@
+import importlib
 import json
 import signal
 
 from contextlib import contextmanager
 
-from .action import Action
-from .controller import Controller
-from .goal_metadata import GoalMetadata, GoalCategory
-from .material import Material
-from .object_metadata import ObjectMetadata
-from .pose import Pose
-from .return_status import ReturnStatus
-from .reward import Reward
-from .scene_history import SceneHistory
-from .history_writer import HistoryWriter
-from .step_metadata import StepMetadata
-from .util import Util
-from .getchHelper import getch
-from .serializer import SerializerMsgPack, SerializerJson
 from ._version import __version__
 
+# The public classes, by the module to import (on first use, since some
+# need slow libraries like AI2-THOR, matplotlib or OpenCV) for each
+_LAZY_IMPORTS = {
+    'Action': '.action',
+    'Controller': '.controller',
+    'DatasetReader': '.dataset',
+    'DatasetWriter': '.dataset',
+    'DebugWriter': '.debug_writer',
+    'GoalImage': '.goal_image',
+    'GoalMetadata': '.goal_metadata',
+    'GoalCategory': '.goal_metadata',
+    'Material': '.material',
+    'ObjectMaskStats': '.object_masks',
+    'ObjectMaskTable': '.object_masks',
+    'ObjectMetadata': '.object_metadata',
+    'OccupancyGrid': '.occupancy_grid',
+    'PointCloud': '.point_cloud',
+    'Pose': '.pose',
+    'ReturnStatus': '.return_status',
+    'Reward': '.reward',
+    'RewardTrajectory': '.reward_trajectory',
+    'SceneHistory': '.scene_history',
+    'HistoryWriter': '.history_writer',
+    'StreamingHistoryWriter': '.history_writer',
+    'HistoryReader': '.history_reader',
+    'HistoryReplayController': '.history_replay',
+    'HistoryColumns': '.history_columns',
+    'HistoryDatabase': '.history_database',
+    'Scoring': '.scoring',
+    'SpatialIndex': '.spatial_index',
+    'StepMetadata': '.step_metadata',
+    'Util': '.util',
+    'getch': '.getchHelper',
+    'SerializerDeltaStream': '.serializer',
+    'SerializerJson': '.serializer',
+    'SerializerMsgPack': '.serializer'
+}
+
+__all__ = sorted(_LAZY_IMPORTS) + [
+    'TIME_LIMIT_SECONDS', '__version__', 'create_controller',
+    'load_scene_json_file', 'time_limit'
+]
+
+
+def __getattr__(name):
+    module = _LAZY_IMPORTS.get(name)
+    if module is None:
+        raise AttributeError(
+            f"module '{__name__}' has no attribute '{name}'")
+    value = getattr(importlib.import_module(module, __name__), name)
+    # Cache it, so this is only called once per name
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_LAZY_IMPORTS))
+
 
 # Timeout at 3 minutes (180 seconds).  It was 60 seconds but
 # this can cause timeouts on EC2 instances
@@ -56,6 +101,7 @@ def create_controller(unity_app_file_path,
     Controller
         The MCS Controller object.
     """
+    from .controller import Controller
     try:
         with time_limit(TIME_LIMIT_SECONDS):
             return Controller(unity_app_file_path,
@@ -0,0 +1,12 @@
+# How far the player can reach.  I think this value needs to be bigger
+# than the MAX_MOVE_DISTANCE or else the player may not be able to move
+# into a position to reach some objects (it may be mathematically impossible).
+# TODO Reduce this number once the player can crouch down to reach and
+# pickup small objects on the floor.
+MAX_REACH_DISTANCE = 1.0
+
+# How far the player can move with a single step.
+MOVE_DISTANCE = 0.1
+
+# Performer camera 'y' position
+PERFORMER_CAMERA_Y = 0.4625
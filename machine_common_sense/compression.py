@@ -0,0 +1,173 @@
+import gzip
+import lzma
+import os
+import zlib
+from typing import Optional
+
+
+class Compression(object):
+    """Compresses the files and payloads written by the package (history
+    files, debug output files, and serializer payloads) with zlib, gzip or
+    lzma from the standard library.
+    Reading detects the compression from the data itself, so it works on
+    both compressed and uncompressed data."""
+
+    NONE = 'none'
+    ZLIB = 'zlib'
+    GZIP = 'gzip'
+    LZMA = 'lzma'
+
+    # File extension added to compressed files
+    EXTENSIONS = {
+        ZLIB: '.zz',
+        GZIP: '.gz',
+        LZMA: '.xz'
+    }
+    # HTTP Content-Encoding of compressed files, like for S3 uploads (xz is
+    # not a registered Content-Encoding)
+    CONTENT_ENCODINGS = {
+        ZLIB: 'deflate',
+        GZIP: 'gzip'
+    }
+    # MIME type of compressed files without a Content-Encoding
+    MIMETYPES = {
+        LZMA: 'application/x-xz'
+    }
+    DEFAULT_LEVELS = {
+        ZLIB: 6,
+        GZIP: 6,
+        LZMA: 6
+    }
+
+    GZIP_MAGIC = b'\x1f\x8b'
+    LZMA_MAGIC = b'\xfd7zXZ\x00'
+
+    def __init__(self, method: str = NONE, level: int = None):
+        method = (method or self.NONE).lower()
+        if method != self.NONE and method not in self.EXTENSIONS:
+            raise ValueError(f'Unknown compression {method}')
+        self.method = method
+        self.level = self.DEFAULT_LEVELS.get(method) if level is None \
+            else level
+
+    @property
+    def enabled(self) -> bool:
+        return self.method != self.NONE
+
+    @property
+    def extension(self) -> str:
+        return self.EXTENSIONS.get(self.method, '')
+
+    @property
+    def content_encoding(self) -> Optional[str]:
+        return self.CONTENT_ENCODINGS.get(self.method)
+
+    def compress(self, data: bytes) -> bytes:
+        """Return the given bytes compressed (unchanged if disabled)."""
+        if self.method == self.ZLIB:
+            return zlib.compress(data, self.level)
+        if self.method == self.GZIP:
+            return gzip.compress(data, self.level, mtime=0)
+        if self.method == self.LZMA:
+            return lzma.compress(data, preset=self.level)
+        return data
+
+    @staticmethod
+    def detect(data: bytes) -> str:
+        """Return the compression method of the given bytes."""
+        if data[:2] == Compression.GZIP_MAGIC:
+            return Compression.GZIP
+        if data[:6] == Compression.LZMA_MAGIC:
+            return Compression.LZMA
+        if (len(data) >= 2 and data[0] & 0x0F == 8 and
+                (data[0] << 8 | data[1]) % 31 == 0):
+            return Compression.ZLIB
+        return Compression.NONE
+
+    @staticmethod
+    def decompress(data: bytes) -> bytes:
+        """Return the given bytes decompressed, detecting the compression
+        method (returned unchanged if not compressed)."""
+        method = Compression.detect(data)
+        if method == Compression.GZIP:
+            return gzip.decompress(data)
+        if method == Compression.LZMA:
+            return lzma.decompress(data)
+        if method == Compression.ZLIB:
+            try:
+                return zlib.decompress(data)
+            except zlib.error:
+                # Uncompressed data that happens to look like a zlib header
+                return data
+        return data
+
+    @staticmethod
+    def strip_extension(path) -> str:
+        """Return the given path without any compressed file extension."""
+        path = str(path)
+        for extension in Compression.EXTENSIONS.values():
+            if path.endswith(extension):
+                return path[:-len(extension)]
+        return path
+
+    @staticmethod
+    def content_encoding_for_path(path) -> Optional[str]:
+        """Return the Content-Encoding for the given file path by its
+        compressed file extension, or None if it has none."""
+        path = str(path)
+        for method, extension in Compression.EXTENSIONS.items():
+            if path.endswith(extension):
+                return Compression.CONTENT_ENCODINGS.get(method)
+        return None
+
+    @staticmethod
+    def mimetype_for_path(path) -> Optional[str]:
+        """Return the MIME type for the given file path by its compressed
+        file extension, if it has no Content-Encoding, or else None."""
+        path = str(path)
+        for method, extension in Compression.EXTENSIONS.items():
+            if path.endswith(extension):
+                return Compression.MIMETYPES.get(method)
+        return None
+
+    @staticmethod
+    def read_bytes(path) -> bytes:
+        """Read and decompress the file at the given path."""
+        with open(path, 'rb') as input_file:
+            return Compression.decompress(input_file.read())
+
+    @staticmethod
+    def read_text(path) -> str:
+        return Compression.read_bytes(path).decode('utf-8')
+
+    def write_to(self, path, data: bytes) -> None:
+        """Compress and write the data to exactly the given path. Writes
+        then renames the file, so readers never see a partial file."""
+        path = str(path)
+        partial_path = path + '.partial'
+        with open(partial_path, 'wb') as output_file:
+            output_file.write(self.compress(data))
+        os.replace(partial_path, path)
+
+    def write_bytes(self, path, data: bytes) -> str:
+        """Compress and write the data to the given path plus the compressed
+        file extension, and return that path."""
+        path = str(path) + self.extension
+        self.write_to(path, data)
+        return path
+
+    def write_text(self, path, text: str) -> str:
+        return self.write_bytes(path, text.encode('utf-8'))
+
+    def compress_file(self, path) -> str:
+        """Compress the file at the given path into a new file with the
+        compressed file extension, delete the original, and return the new
+        path (unchanged if disabled)."""
+        path = str(path)
+        if not self.enabled:
+            return path
+        with open(path, 'rb') as input_file:
+            data = input_file.read()
+        self.write_to(path + self.extension, data)
+        os.remove(path)
+        return path + self.extension
@@ -1,6 +1,118 @@
 import os
 import configparser  # noqa: F401
 import yaml  # noqa: F401
+from typing import Dict, Optional
+
+
+class ConfigSnapshot(object):
+    """
+    The read only settings of a ConfigManager, resolved once (including
+    the environment variable overrides) into plain typed attributes, for
+    code that reads its settings often, like on every step. Get a new
+    snapshot with ConfigManager.reload().
+    """
+
+    __slots__ = (
+        'aws_access_key_id',
+        'aws_secret_access_key',
+        'compression',
+        'compression_level',
+        'dataset_directory',
+        'dataset_shard_size',
+        'debug',
+        'debug_output',
+        'debug_output_batch_size',
+        'debug_output_png_compression',
+        'debug_output_workers',
+        'evaluation',
+        'evaluation_name',
+        'history_database',
+        'history_enabled',
+        'history_streaming',
+        'metadata_tier',
+        'noise_enabled',
+        'occupancy_grid',
+        'occupancy_grid_resolution',
+        's3_bucket',
+        's3_folder',
+        'seed',
+        'size',
+        'team',
+        'upload_journal_file',
+        'upload_local_directory',
+        'video_enabled'
+    )
+
+    aws_access_key_id: Optional[str]
+    aws_secret_access_key: Optional[str]
+    compression: str
+    compression_level: Optional[int]
+    dataset_directory: Optional[str]
+    dataset_shard_size: int
+    debug: bool
+    debug_output: Optional[str]
+    debug_output_batch_size: int
+    debug_output_png_compression: int
+    debug_output_workers: int
+    evaluation: bool
+    evaluation_name: str
+    history_database: Optional[str]
+    history_enabled: bool
+    history_streaming: bool
+    metadata_tier: str
+    noise_enabled: bool
+    occupancy_grid: bool
+    occupancy_grid_resolution: float
+    s3_bucket: Optional[str]
+    s3_folder: Optional[str]
+    seed: Optional[int]
+    size: int
+    team: str
+    upload_journal_file: Optional[str]
+    upload_local_directory: Optional[str]
+    video_enabled: bool
+
+    def __init__(self, **settings):
+        missing = set(self.__slots__) - set(settings)
+        unknown = set(settings) - set(self.__slots__)
+        if missing or unknown:
+            raise TypeError(
+                f'ConfigSnapshot needs exactly its settings: missing '
+                f'{sorted(missing)}, unknown {sorted(unknown)}')
+        for name, value in settings.items():
+            object.__setattr__(self, name, value)
+
+    def __setattr__(self, name, value):
+        raise AttributeError('ConfigSnapshot is read only')
+
+    def __delattr__(self, name):
+        raise AttributeError('ConfigSnapshot is read only')
+
+    def __reduce__(self):
+        return (ConfigSnapshot.from_dict, (self.as_dict(),))
+
+    def __eq__(self, other):
+        return (isinstance(other, ConfigSnapshot) and
+                self.as_dict() == other.as_dict())
+
+    def __hash__(self):
+        return hash(tuple(getattr(self, name) for name in self.__slots__))
+
+    def __repr__(self):
+        return 'ConfigSnapshot(' + ', '.join(
+            f'{name}={getattr(self, name)!r}' for name in self.__slots__
+            if not name.startswith('aws_')) + ')'
+
+    @staticmethod
+    def from_dict(settings: Dict) -> 'ConfigSnapshot':
+        return ConfigSnapshot(**settings)
+
+    def as_dict(self) -> Dict:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def replace(self, **changes) -> 'ConfigSnapshot':
+        """Return a copy of this snapshot with the given settings changed."""
+        return ConfigSnapshot(**{**self.as_dict(), **changes})
 
 
 class ConfigManager(object):
@@ -13,18 +125,31 @@ class ConfigManager(object):
 
     CONFIG_AWS_ACCESS_KEY_ID = 'aws_access_key_id'
     CONFIG_AWS_SECRET_ACCESS_KEY = 'aws_secret_access_key'
+    CONFIG_COMPRESSION = 'compression'
+    CONFIG_COMPRESSION_LEVEL = 'compression_level'
+    CONFIG_DATASET_DIRECTORY = 'dataset_directory'
+    CONFIG_DATASET_SHARD_SIZE = 'dataset_shard_size'
     CONFIG_DEBUG = 'debug'
     CONFIG_DEBUG_OUTPUT = 'debug_output'
+    CONFIG_DEBUG_OUTPUT_BATCH_SIZE = 'debug_output_batch_size'
+    CONFIG_DEBUG_OUTPUT_PNG_COMPRESSION = 'debug_output_png_compression'
+    CONFIG_DEBUG_OUTPUT_WORKERS = 'debug_output_workers'
     CONFIG_EVALUATION = 'evaluation'
     CONFIG_EVALUATION_NAME = 'evaluation_name'
+    CONFIG_HISTORY_DATABASE = 'history_database'
     CONFIG_HISTORY_ENABLED = 'history_enabled'
+    CONFIG_HISTORY_STREAMING = 'history_streaming'
     CONFIG_METADATA_TIER = 'metadata'
     CONFIG_NOISE_ENABLED = 'noise_enabled'
+    CONFIG_OCCUPANCY_GRID = 'occupancy_grid'
+    CONFIG_OCCUPANCY_GRID_RESOLUTION = 'occupancy_grid_resolution'
     CONFIG_S3_BUCKET = 's3_bucket'
     CONFIG_S3_FOLDER = 's3_folder'
     CONFIG_SEED = 'seed'
     CONFIG_SIZE = 'size'
     CONFIG_TEAM = 'team'
+    CONFIG_UPLOAD_JOURNAL_FILE = 'upload_journal_file'
+    CONFIG_UPLOAD_LOCAL_DIRECTORY = 'upload_local_directory'
     CONFIG_VIDEO_ENABLED = 'video_enabled'
 
     # Please keep the aspect ratio as 3:2 because the IntPhys scenes are built
@@ -45,6 +170,49 @@ class ConfigManager(object):
 
         self._validate_screen_size()
 
+        self.snapshot = self._create_snapshot()
+
+    def reload(self) -> ConfigSnapshot:
+        """Read the config file and environment variables again, and return
+        (and keep as this manager's snapshot) their new settings."""
+        self._read_config_file()
+        self._validate_screen_size()
+        self.snapshot = self._create_snapshot()
+        return self.snapshot
+
+    def _create_snapshot(self) -> ConfigSnapshot:
+        return ConfigSnapshot(
+            aws_access_key_id=self.get_aws_access_key_id(),
+            aws_secret_access_key=self.get_aws_secret_access_key(),
+            compression=self.get_compression(),
+            compression_level=self.get_compression_level(),
+            dataset_directory=self.get_dataset_directory(),
+            dataset_shard_size=self.get_dataset_shard_size(),
+            debug=self.is_debug(),
+            debug_output=self.get_debug_output(),
+            debug_output_batch_size=self.get_debug_output_batch_size(),
+            debug_output_png_compression=(
+                self.get_debug_output_png_compression()),
+            debug_output_workers=self.get_debug_output_workers(),
+            evaluation=self.is_evaluation(),
+            evaluation_name=self.get_evaluation_name(),
+            history_database=self.get_history_database(),
+            history_enabled=self.is_history_enabled(),
+            history_streaming=self.is_history_streaming(),
+            metadata_tier=self.get_metadata_tier(),
+            noise_enabled=self.is_noise_enabled(),
+            occupancy_grid=self.is_occupancy_grid_enabled(),
+            occupancy_grid_resolution=self.get_occupancy_grid_resolution(),
+            s3_bucket=self.get_s3_bucket(),
+            s3_folder=self.get_s3_folder(),
+            seed=self.get_seed(),
+            size=self.get_size(),
+            team=self.get_team(),
+            upload_journal_file=self.get_upload_journal_file(),
+            upload_local_directory=self.get_upload_local_directory(),
+            video_enabled=self.is_video_enabled()
+        )
+
     def _read_config_file(self):
         self._config = configparser.ConfigParser()
         if os.path.exists(self._config_file):
@@ -91,6 +259,55 @@ class ConfigManager(object):
             fallback=None
         )
 
+    def get_debug_output_batch_size(self):
+        return self._config.getint(
+            self.CONFIG_DEFAULT_SECTION,
+            self.CONFIG_DEBUG_OUTPUT_BATCH_SIZE,
+            fallback=1
+        )
+
+    def get_debug_output_png_compression(self):
+        return self._config.getint(
+            self.CONFIG_DEFAULT_SECTION,
+            self.CONFIG_DEBUG_OUTPUT_PNG_COMPRESSION,
+            fallback=1
+        )
+
+    def get_debug_output_workers(self):
+        return self._config.getint(
+            self.CONFIG_DEFAULT_SECTION,
+            self.CONFIG_DEBUG_OUTPUT_WORKERS,
+            fallback=2
+        )
+
+    def get_compression(self):
+        return self._config.get(
+            self.CONFIG_DEFAULT_SECTION,
+            self.CONFIG_COMPRESSION,
+            fallback='none'
+        )
+
+    def get_compression_level(self):
+        return self._config.getint(
+            self.CONFIG_DEFAULT_SECTION,
+            self.CONFIG_COMPRESSION_LEVEL,
+            fallback=None
+        )
+
+    def get_dataset_directory(self):
+        return self._config.get(
+            self.CONFIG_DEFAULT_SECTION,
+            self.CONFIG_DATASET_DIRECTORY,
+            fallback=None
+        )
+
+    def get_dataset_shard_size(self):
+        return self._config.getint(
+            self.CONFIG_DEFAULT_SECTION,
+            self.CONFIG_DATASET_SHARD_SIZE,
+            fallback=1000
+        )
+
     def get_evaluation_name(self):
         return self._config.get(
             self.CONFIG_DEFAULT_SECTION,
@@ -98,6 +315,13 @@ class ConfigManager(object):
             fallback=''
         )
 
+    def get_history_database(self):
+        return self._config.get(
+            self.CONFIG_DEFAULT_SECTION,
+            self.CONFIG_HISTORY_DATABASE,
+            fallback=None
+        )
+
     def get_metadata_tier(self):
         # Environment variable override for metadata property
         metadata_env_var = os.getenv('MCS_METADATA_LEVEL', None)
@@ -111,6 +335,13 @@ class ConfigManager(object):
 
         return metadata_env_var
 
+    def get_occupancy_grid_resolution(self):
+        return self._config.getfloat(
+            self.CONFIG_DEFAULT_SECTION,
+            self.CONFIG_OCCUPANCY_GRID_RESOLUTION,
+            fallback=0.1
+        )
+
     def get_s3_bucket(self):
         return self._config.get(
             self.CONFIG_DEFAULT_SECTION,
@@ -146,6 +377,20 @@ class ConfigManager(object):
             fallback=''
         )
 
+    def get_upload_journal_file(self):
+        return self._config.get(
+            self.CONFIG_DEFAULT_SECTION,
+            self.CONFIG_UPLOAD_JOURNAL_FILE,
+            fallback=None
+        )
+
+    def get_upload_local_directory(self):
+        return self._config.get(
+            self.CONFIG_DEFAULT_SECTION,
+            self.CONFIG_UPLOAD_LOCAL_DIRECTORY,
+            fallback=None
+        )
+
     def is_debug(self):
         # Environment variable override for debug mode
         debug_env_var = os.getenv('MCS_DEBUG_MODE', None)
@@ -178,6 +423,13 @@ class ConfigManager(object):
             fallback=True
         )
 
+    def is_history_streaming(self):
+        return self._config.getboolean(
+            self.CONFIG_DEFAULT_SECTION,
+            self.CONFIG_HISTORY_STREAMING,
+            fallback=False
+        )
+
     def is_noise_enabled(self):
         return self._config.getboolean(
             self.CONFIG_DEFAULT_SECTION,
@@ -185,6 +437,13 @@ class ConfigManager(object):
             fallback=False
         )
 
+    def is_occupancy_grid_enabled(self):
+        return self._config.getboolean(
+            self.CONFIG_DEFAULT_SECTION,
+            self.CONFIG_OCCUPANCY_GRID,
+            fallback=False
+        )
+
     def is_video_enabled(self):
         return self._config.getboolean(
             self.CONFIG_DEFAULT_SECTION,
@@ -1,3 +1,4 @@
+import concurrent.futures
 import copy
 import datetime
 import glob
@@ -6,40 +7,34 @@ import numpy as np
 import os
 import random
 import pathlib
-import PIL
-import ast
+import PIL.Image
 from typing import Dict, List
 import atexit
+import threading
 
-import ai2thor.controller
-import ai2thor.server
-
-# How far the player can reach.  I think this value needs to be bigger
-# than the MAX_MOVE_DISTANCE or else the player may not be able to move
-# into a position to reach some objects (it may be mathematically impossible).
-# TODO Reduce this number once the player can crouch down to reach and
-# pickup small objects on the floor.
-MAX_REACH_DISTANCE = 1.0
-
-# How far the player can move with a single step.
-MOVE_DISTANCE = 0.1
-
-# Performer camera 'y' position
-PERFORMER_CAMERA_Y = 0.4625
-
+from .agent_limits import (  # noqa: F401
+    MAX_REACH_DISTANCE,
+    MOVE_DISTANCE,
+    PERFORMER_CAMERA_Y
+)
 from .action import Action
+from .goal_image import GoalImage
 from .goal_metadata import GoalMetadata
+from .object_masks import ObjectMaskTable
 from .object_metadata import ObjectMetadata
-from .plotter import TopDownPlotter
+from .occupancy_grid import OccupancyGrid
 from .pose import Pose
 from .return_status import ReturnStatus
 from .reward import Reward
 from .scene_history import SceneHistory
+from .spatial_index import SpatialIndex
 from .step_metadata import StepMetadata
-from .recorder import VideoRecorder
-from .uploader import S3Uploader
 from .util import Util
-from .history_writer import HistoryWriter
+from .compression import Compression
+from .debug_writer import DebugWriter
+from .dataset import DatasetWriter
+from .history_database import HistoryDatabase
+from .history_writer import HistoryWriter, StreamingHistoryWriter
 from .config_manager import ConfigManager
 
 
@@ -55,13 +50,11 @@ def __reset_override(self, scene):
     return self.last_event
 
 
-ai2thor.controller.Controller.reset = __reset_override
-
-
 def __image_depth_override(self, image_depth_data, **kwargs):
     # From https://github.com/NextCenturyCorporation/ai2thor/blob/47a9d0802861ba8d7a2a7a6d943a46db28ddbaab/ai2thor/server.py#L232-L240 # noqa: E501
     # The MCS depth shader in Unity is completely different now, so override
     # the original AI2-THOR depth image code. Just return what Unity sends us.
+    import ai2thor.server
     image_depth = ai2thor.server.read_buffer_image(
         image_depth_data,
         self.screen_width,
@@ -70,9 +63,6 @@ def __image_depth_override(self, image_depth_data, **kwargs):
     return image_depth
 
 
-ai2thor.server.Event._image_depth = __image_depth_override
-
-
 class NumpyAwareEncoderOverride(json.JSONEncoder):
     # From https://github.com/allenai/ai2thor/blob/bd35d2cb887faee8b87aa04bd9373b027eb39f17/ai2thor/server.py#L17-L24 # noqa: E501
     def default(self, obj):
@@ -83,7 +73,22 @@ class NumpyAwareEncoderOverride(json.JSONEncoder):
         return super(NumpyAwareEncoderOverride, self).default(obj)
 
 
-ai2thor.server.NumpyAwareEncoder = NumpyAwareEncoderOverride
+def import_ai2thor():
+    """
+    Import the AI2-THOR library (which takes a while, so not until a
+    Controller starts Unity) and apply the MCS overrides to it.
+
+    Returns
+    -------
+    module
+        The ai2thor.controller module.
+    """
+    import ai2thor.controller
+    import ai2thor.server
+    ai2thor.controller.Controller.reset = __reset_override
+    ai2thor.server.Event._image_depth = __image_depth_override
+    ai2thor.server.NumpyAwareEncoder = NumpyAwareEncoderOverride
+    return ai2thor.controller
 
 
 class Controller():
@@ -177,6 +182,10 @@ class Controller():
     AWS_ACCESS_KEY_ID = 'aws_access_key_id'
     AWS_SECRET_ACCESS_KEY = 'aws_secret_access_key'
 
+    # How many scenes may wait on background finalization (history file,
+    # videos, uploads) before end_scene(wait=False) blocks the caller.
+    MAX_PENDING_FINALIZATIONS = 2
+
     def __init__(self, unity_app_file_path, config_file_path=None):
 
         self._end_scene_not_registered = True
@@ -185,7 +194,7 @@ class Controller():
 
         self._update_screen_size()
 
-        self._controller = ai2thor.controller.Controller(
+        self._controller = import_ai2thor().Controller(
             quality='Medium',
             fullscreen=False,
             # The headless flag does not work for me
@@ -214,7 +223,7 @@ class Controller():
             return y_coord
 
     def _update_screen_size(self):
-        size = self._config.get_size()
+        size = self._config.snapshot.size
 
         self.__screen_width = size
         self.__screen_height = int(size / 3 * 2)
@@ -238,15 +247,15 @@ class Controller():
     def _on_init(self, config_file_path=None):
 
         self.__debug_to_file = True if (
-            self._config.is_debug() is True or
-            self._config.get_debug_output() == 'file') else False
+            self._config.snapshot.debug is True or
+            self._config.snapshot.debug_output == 'file') else False
         self.__debug_to_terminal = True if (
-            self._config.is_debug() is True or
-            self._config.get_debug_output() == 'terminal') else False
+            self._config.snapshot.debug is True or
+            self._config.snapshot.debug_output == 'terminal') else False
 
-        self.__noise_enabled = self._config.is_noise_enabled()
-        self.__seed = self._config.get_seed()
-        self.__history_enabled = self._config.is_history_enabled()
+        self.__noise_enabled = self._config.snapshot.noise_enabled
+        self.__seed = self._config.snapshot.seed
+        self.__history_enabled = self._config.snapshot.history_enabled
 
         if self.__seed:
             random.seed(self.__seed)
@@ -259,9 +268,30 @@ class Controller():
         self.__step_number = 0
         self.__history_writer = None
         self.__history_item = None
-        self.__uploader = None
+        self.__history_database = None
+        self.__dataset_writer = None
+        # Object footprints of the current scene for the rewards
+        self.__spatial_index = SpatialIndex()
+        self.__occupancy_grid = None
+        # Object mask colors of the current scene
+        self.__object_mask_table = ObjectMaskTable()
+        self.__upload_manager = None
+        self.__compression = Compression(
+            self._config.snapshot.compression,
+            self._config.snapshot.compression_level
+        )
+        self.__debug_writer = DebugWriter(
+            self.__compression,
+            self._config.snapshot.debug_output_workers,
+            self._config.snapshot.debug_output_png_compression,
+            self._config.snapshot.debug_output_batch_size
+        )
+        self.__scene_ended = False
+        self.__finalization_executor = None
+        self.__finalization_slots = threading.BoundedSemaphore(
+            self.MAX_PENDING_FINALIZATIONS)
 
-        self._metadata_tier = self._config.get_metadata_tier()
+        self._metadata_tier = self._config.snapshot.metadata_tier
 
         # Whether or not to show depth maps or object masks is based on
         # metadata tier (the default for these if no metadata level is
@@ -277,8 +307,8 @@ class Controller():
             self.__depth_maps = True
             self.__object_masks = True
 
-        if ((self._config.get_aws_access_key_id() is not None) and
-                (self._config.get_aws_secret_access_key() is not None)):
+        if ((self._config.snapshot.aws_access_key_id is not None) and
+                (self._config.snapshot.aws_secret_access_key is not None)):
             if not os.path.exists(self.AWS_CREDENTIALS_FOLDER):
                 os.makedirs(self.AWS_CREDENTIALS_FOLDER)
             # From https://boto3.amazonaws.com/v1/documentation/api/latest/guide/quickstart.html # noqa: E501
@@ -287,20 +317,22 @@ class Controller():
                     '[default]\n' +
                     self.AWS_ACCESS_KEY_ID +
                     ' = ' +
-                    self._config.get_aws_access_key_id() +
+                    self._config.snapshot.aws_access_key_id +
                     '\n' +
                     self.AWS_SECRET_ACCESS_KEY +
                     ' = ' +
-                    self._config.get_aws_secret_access_key() +
+                    self._config.snapshot.aws_secret_access_key +
                     '\n'
                 )
 
     def _create_video_recorders(self, timestamp):
         '''Create video recorders used to capture evaluation scenes for review
         '''
+        from .recorder import VideoRecorder
+
         output_folder = pathlib.Path(self.__output_folder)
-        eval_name = self._config.get_evaluation_name()
-        team = self._config.get_team()
+        eval_name = self._config.snapshot.evaluation_name
+        team = self._config.snapshot.team
         scene_name = self.__scene_configuration.get(
             'name', '').replace('json', '')
         # strip prefix in scene_name
@@ -353,7 +385,7 @@ class Controller():
                 height=self.__screen_height,
                 fps=self.FPS_FRAME_RATE)
 
-    def end_scene(self, choice, confidence=1.0):
+    def end_scene(self, choice, confidence=1.0, wait=True):
         """
         Ends the current scene.
 
@@ -371,83 +403,173 @@ class Controller():
             Note: when an issue causes the program to exit prematurely or
             end_scene isn't properly called but history_enabled is true,
             this value will be written to file as -1.
+        wait : bool, optional
+            Whether to wait for the scene's history file and videos to be
+            written (and uploaded, during evaluations) before returning. If
+            False, this work runs in the background and you may start the
+            next scene immediately. (default True)
+
+        Returns
+        -------
+        concurrent.futures.Future or None
+            If wait is False, a handle to the background finalization: use
+            done() to check for completion, and result() or exception() to
+            wait for it and see any error. Otherwise None.
         """
         if (self._end_scene_not_registered is False and
-                (self.__history_enabled or self._config.is_evaluation())):
+                (self.__history_enabled or self._config.snapshot.evaluation)):
             atexit.unregister(self.end_scene)
             self._end_scene_not_registered = True
 
+        history_writer = None
         if self.__history_enabled:
             self.__history_writer.add_step(self.__history_item)
-            self.__history_writer.write_history_file(choice, confidence)
-
-        if self._config.is_evaluation() or self._config.is_video_enabled():
-            self.__topdown_recorder.finish()
-            self.__image_recorder.finish()
-            self.__heatmap_recorder.finish()
+            history_writer = self.__history_writer
+
+        recorders = []
+        if (self._config.snapshot.evaluation or
+                self._config.snapshot.video_enabled):
+            recorders = [
+                self.__topdown_recorder,
+                self.__image_recorder,
+                self.__heatmap_recorder
+            ]
             if self.__depth_maps:
-                self.__depth_recorder.finish()
+                recorders.append(self.__depth_recorder)
             if self.__object_masks:
-                self.__segmentation_recorder.finish()
+                recorders.append(self.__segmentation_recorder)
 
-        if self._config.is_evaluation():
-            self.__uploader = S3Uploader(
-                s3_bucket=self._config.get_s3_bucket()
-            )
+        self.__scene_ended = True
+        self._flush_debug_output(wait)
 
-            folder_prefix = self._config.get_s3_folder()
+        if wait:
+            self._finalize_scene(history_writer, recorders, choice,
+                                 confidence)
+            return None
 
-            if self.__history_enabled:
+        # Block if too many previous scenes are still being finalized.
+        self.__finalization_slots.acquire()
+        if self.__finalization_executor is None:
+            self.__finalization_executor = (
+                concurrent.futures.ThreadPoolExecutor(max_workers=1))
+        try:
+            future = self.__finalization_executor.submit(
+                self._finalize_scene, history_writer, recorders, choice,
+                confidence)
+        except Exception:
+            self.__finalization_slots.release()
+            raise
+        future.add_done_callback(
+            lambda _: self.__finalization_slots.release())
+        return future
+
+    def _finalize_scene(self, history_writer, recorders, choice, confidence):
+        '''Write the history file, finish the videos, and upload them during
+        evaluations. Only uses the given scene objects, so that it may run
+        in the background while the next scene starts.'''
+        if history_writer is not None:
+            history_writer.write_history_file(choice, confidence)
+
+        for recorder in recorders:
+            recorder.finish()
+
+        if self._config.snapshot.evaluation:
+            upload_manager = self._get_upload_manager()
+            folder_prefix = self._config.snapshot.s3_folder
+            upload_list = []
+
+            if history_writer is not None:
                 history_filename = self._get_filename_without_timestamp(
-                    pathlib.Path(self.__history_writer.scene_history_file))
-                self.__uploader.upload_history(
-                    history_path=self.__history_writer.scene_history_file,
+                    pathlib.Path(history_writer.scene_history_file))
+                upload_list.append(upload_manager.submit(
+                    filepath=history_writer.scene_history_file,
                     s3_filename=(folder_prefix + '/' +
-                                 self._config.get_evaluation_name() +
+                                 self._config.snapshot.evaluation_name +
                                  '_' + self._metadata_tier +
-                                 '_' + self._config.get_team() +
-                                 '_' + history_filename)
-                )
-
-            topdown_filename = self._get_filename_without_timestamp(
-                self.__topdown_recorder.path)
-            self.__uploader.upload_video(
-                video_path=self.__topdown_recorder.path,
-                s3_filename=folder_prefix + '/' + topdown_filename
-            )
+                                 '_' + self._config.snapshot.team +
+                                 '_' + history_filename),
+                    mimetype=history_writer.MIMETYPE
+                ))
 
-            video_filename = self._get_filename_without_timestamp(
-                self.__image_recorder.path)
-            self.__uploader.upload_video(
-                video_path=self.__image_recorder.path,
-                s3_filename=folder_prefix + '/' + video_filename
-            )
-
-            video_filename = self._get_filename_without_timestamp(
-                self.__heatmap_recorder.path)
-            self.__uploader.upload_video(
-                video_path=self.__heatmap_recorder.path,
-                s3_filename=folder_prefix + '/' + video_filename
-            )
-
-            if self.__depth_maps:
-                video_filename = self._get_filename_without_timestamp(
-                    self.__depth_recorder.path)
-                self.__uploader.upload_video(
-                    video_path=self.__depth_recorder.path,
-                    s3_filename=folder_prefix + '/' + video_filename
-                )
-
-            if self.__object_masks:
+            for recorder in recorders:
                 video_filename = self._get_filename_without_timestamp(
-                    self.__segmentation_recorder.path)
-                self.__uploader.upload_video(
-                    video_path=self.__segmentation_recorder.path,
-                    s3_filename=folder_prefix + '/' + video_filename
-                )
+                    recorder.path)
+                upload_list.append(upload_manager.submit(
+                    filepath=recorder.path,
+                    s3_filename=folder_prefix + '/' + video_filename,
+                    mimetype='video/mp4'
+                ))
+
+            # Raise the first failure; failed uploads stay in the journal.
+            for upload in upload_list:
+                upload.result()
+
+    def _get_upload_manager(self):
+        '''Return this controller's upload manager, creating it (and
+        resuming any uploads left pending by a previous run) on first use.'''
+        if self.__upload_manager is None:
+            from .uploader import LocalUploader, S3Uploader, UploadManager
+            local_directory = self._config.snapshot.upload_local_directory
+            if local_directory:
+                uploader = LocalUploader(
+                    local_directory,
+                    self._config.snapshot.s3_bucket or 'local')
+            else:
+                uploader = S3Uploader(
+                    s3_bucket=self._config.snapshot.s3_bucket)
+            self.__upload_manager = UploadManager(
+                uploader, self._config.snapshot.upload_journal_file)
+            for upload in self.__upload_manager.resume():
+                upload.add_done_callback(self._report_resumed_upload)
+        return self.__upload_manager
+
+    @staticmethod
+    def _report_resumed_upload(upload):
+        '''Print the failure of an upload resumed from the journal (where it
+        stays pending), since nothing waits for its result.'''
+        error = upload.exception()
+        if error is not None:
+            print('Failed to resume an upload: ' + str(error))
+
+    def _get_history_database(self):
+        '''Return this controller's history database, opening it on first
+        use, or None if the history_database config option is not set.'''
+        if self.__history_database is None:
+            database_path = self._config.snapshot.history_database
+            if database_path:
+                self.__history_database = HistoryDatabase(database_path)
+        return self.__history_database
+
+    def _get_dataset_writer(self):
+        '''Return this controller's dataset writer, creating it on first
+        use, or None if the dataset_directory config option is not set.'''
+        if self.__dataset_writer is None:
+            dataset_directory = self._config.snapshot.dataset_directory
+            if dataset_directory:
+                self.__dataset_writer = DatasetWriter(
+                    dataset_directory,
+                    self._config.snapshot.dataset_shard_size)
+        return self.__dataset_writer
+
+    def _export_dataset_step(self, output, action, params=None):
+        dataset_writer = self._get_dataset_writer()
+        if dataset_writer is not None:
+            dataset_writer.add_step(
+                self.__scene_configuration.get('name'), output, action,
+                params)
+
+    def wait_for_finalization(self):
+        """Wait for all scenes ended with end_scene(wait=False) to finish
+        writing (and uploading) their history files and videos."""
+        if self.__finalization_executor is not None:
+            self.__finalization_executor.shutdown(wait=True)
+            self.__finalization_executor = None
 
     def _get_filename_without_timestamp(self, filepath: pathlib.Path):
-        return filepath.stem[:-16] + filepath.suffix
+        compression_extension = str(filepath)[
+            len(Compression.strip_extension(filepath)):]
+        filepath = pathlib.Path(Compression.strip_extension(filepath))
+        return filepath.stem[:-16] + filepath.suffix + compression_extension
 
     def start_scene(self, config_data):
         """
@@ -470,31 +592,47 @@ class Controller():
         self.__habituation_trial = 1
         self.__step_number = 0
         self._goal = self.retrieve_goal(self.__scene_configuration)
+        self.__spatial_index.clear()
+        self.__occupancy_grid = self._create_occupancy_grid(config_data)
+        self.__object_mask_table = ObjectMaskTable()
         timestamp = self.generate_time()
 
+        scene_ended = self.__scene_ended
+        self.__scene_ended = False
+
         if self.__history_enabled:
-            # Ensure the previous scene history writer has saved its file.
-            if self.__history_writer:
+            # Ensure the previous scene history writer has saved its file,
+            # unless end_scene has already written it (maybe in the
+            # background).
+            if self.__history_writer and not scene_ended:
                 self.__history_writer.check_file_written()
 
             hist_info = {}
             hist_info[
                 self._config.CONFIG_EVALUATION_NAME
-            ] = self._config.get_evaluation_name()
+            ] = self._config.snapshot.evaluation_name
             hist_info[
                 self._config.CONFIG_EVALUATION
-            ] = self._config.is_evaluation()
+            ] = self._config.snapshot.evaluation
             hist_info[
                 self._config.CONFIG_METADATA_TIER
             ] = self._metadata_tier
             hist_info[
                 self._config.CONFIG_TEAM
-            ] = self._config.get_team()
+            ] = self._config.snapshot.team
             # Create a new scene history writer with each new scene (config
             # data) so we always create a new, separate scene history file.
-            self.__history_writer = HistoryWriter(config_data,
-                                                  hist_info,
-                                                  timestamp)
+            history_writer_class = (
+                StreamingHistoryWriter
+                if self._config.snapshot.history_streaming
+                else HistoryWriter)
+            self.__history_writer = history_writer_class(
+                config_data,
+                hist_info,
+                timestamp,
+                self._get_history_database(),
+                self.__compression
+            )
 
         skip_preview_phase = (True if 'goal' in config_data and
                               'skip_preview_phase' in config_data['goal']
@@ -512,19 +650,24 @@ class Controller():
             print("ACTION: Initialize")
 
         if (config_data['name'] is not None and (
-            self.__debug_to_file or self._config.is_evaluation() or
-            self._config.is_video_enabled()
+            self.__debug_to_file or self._config.snapshot.evaluation or
+            self._config.snapshot.video_enabled
         )):
+            # Finish writing any debug output of a previous scene first,
+            # in case it is in the same folder.
+            self._flush_debug_output()
             os.makedirs('./' + config_data['name'], exist_ok=True)
             self.__output_folder = './' + config_data['name'] + '/'
             file_list = glob.glob(self.__output_folder + '*')
             for file_path in file_list:
                 os.remove(file_path)
 
-        if self._config.is_evaluation() or self._config.is_video_enabled():
-            team = self._config.get_team()
+        if (self._config.snapshot.evaluation or
+                self._config.snapshot.video_enabled):
+            team = self._config.snapshot.team
             scene = self.__scene_configuration.get(
                 'name', '').replace('json', '')
+            from .plotter import TopDownPlotter
             self.__plotter = TopDownPlotter(
                 team, scene, self.__screen_width, self.__screen_height)
             self._create_video_recorders(timestamp)
@@ -535,6 +678,7 @@ class Controller():
         output = self.restrict_step_output_metadata(pre_restrict_output)
 
         self.write_debug_output(output)
+        self._export_dataset_step(output, 'Initialize')
 
         if not skip_preview_phase:
             if (self._goal is not None and
@@ -557,8 +701,8 @@ class Controller():
                     print('ENDING PREVIEW PHASE')
 
                 if (
-                    self._config.is_evaluation() or
-                    self._config.is_video_enabled()
+                    self._config.snapshot.evaluation or
+                    self._config.snapshot.video_enabled
                 ):
                     self.__image_recorder.add(image_list[0])
 
@@ -569,7 +713,8 @@ class Controller():
                 print('NO PREVIEW PHASE')
 
             if(self._end_scene_not_registered is True and
-                    (self.__history_enabled or self._config.is_evaluation())):
+                    (self.__history_enabled or
+                     self._config.snapshot.evaluation)):
                 # make sure history file is written when program exits
                 atexit.register(self.end_scene, choice="", confidence=-1)
                 self._end_scene_not_registered = False
@@ -830,6 +975,7 @@ class Controller():
         output = self.restrict_step_output_metadata(pre_restrict_output)
 
         self.write_debug_output(output)
+        self._export_dataset_step(output, action, params)
 
         return output
 
@@ -881,7 +1027,8 @@ class Controller():
         if(
             heatmap_img is not None and
             isinstance(heatmap_img, PIL.Image.Image) and
-            (self._config.is_evaluation() or self._config.is_video_enabled())
+            (self._config.snapshot.evaluation or
+             self._config.snapshot.video_enabled)
         ):
             self.__heatmap_recorder.add(heatmap_img)
 
@@ -913,15 +1060,14 @@ class Controller():
         target_name_list = ['target', 'target_1', 'target_2']
 
         for target_name in target_name_list:
-            # need to convert goal image data from string to array
+            # Decode the goal image data (a PNG, raw bytes, or a string or
+            # nested list of numbers) into an array
             if (
                 target_name in goal_output.metadata and
-                'image' in goal_output.metadata[target_name] and
-                isinstance(goal_output.metadata[target_name]['image'], str)
+                'image' in goal_output.metadata[target_name]
             ):
-                image_list_string = goal_output.metadata[target_name]['image']
-                goal_output.metadata[target_name]['image'] = np.array(
-                    ast.literal_eval(image_list_string)).tolist()
+                goal_output.metadata[target_name]['image'] = GoalImage.decode(
+                    goal_output.metadata[target_name]['image'])
 
         return goal_output
 
@@ -1192,13 +1338,17 @@ class Controller():
         image_list = []
         depth_map_list = []
         object_mask_list = []
+        recording = (self._config.snapshot.evaluation or
+                     self._config.snapshot.video_enabled)
 
         for index, event in enumerate(scene_event.events):
             scene_image = PIL.Image.fromarray(event.frame)
             image_list.append(scene_image)
 
-            if self._config.is_evaluation() or self._config.is_video_enabled():
-                self.__image_recorder.add(scene_image)
+            if recording:
+                # Feed the raw event frames to the recorders; they convert
+                # to BGR on their own writer threads.
+                self.__image_recorder.add(event.frame)
                 goal_id = None
                 # Is there a better way to do this test?
                 if (self._goal is not None and
@@ -1220,26 +1370,20 @@ class Controller():
                     (unity_depth_array[:, :, 2] * (max_depth / 3.0) / 255.0)
                 )
                 # Convert to pixel values for saving debug image.
-                depth_pixel_array = depth_float_array * 255 / max_depth
-                depth_map = PIL.Image.fromarray(
-                    depth_pixel_array.astype(np.uint8)
-                )
-                if (
-                    self._config.is_evaluation() or
-                    self._config.is_video_enabled()
-                ):
-                    self.__depth_recorder.add(depth_map)
+                depth_pixel_array = (
+                    depth_float_array * 255 / max_depth
+                ).astype(np.uint8)
+                if recording:
+                    self.__depth_recorder.add(depth_pixel_array)
                 depth_map_list.append(np.array(depth_float_array))
 
             if self.__object_masks:
                 object_mask = PIL.Image.fromarray(
                     event.instance_segmentation_frame)
                 object_mask_list.append(object_mask)
-                if (
-                    self._config.is_evaluation() or
-                    self._config.is_video_enabled()
-                ):
-                    self.__segmentation_recorder.add(object_mask)
+                if recording:
+                    self.__segmentation_recorder.add(
+                        event.instance_segmentation_frame)
 
             if self.__debug_to_file and self.__output_folder is not None:
                 step_plus_substep_index = 0 if self.__step_number == 0 else (
@@ -1247,29 +1391,44 @@ class Controller():
                     (index + 1)
                 )
                 suffix = '_' + str(step_plus_substep_index) + '.png'
-                scene_image.save(fp=self.__output_folder +
-                                 'frame_image' + suffix)
+                self.__debug_writer.write_image(
+                    self.__output_folder + 'frame_image' + suffix,
+                    scene_image)
                 if self.__depth_maps:
-                    depth_map.save(fp=self.__output_folder +
-                                   'depth_map' + suffix)
+                    self.__debug_writer.write_image(
+                        self.__output_folder + 'depth_map' + suffix,
+                        depth_pixel_array)
                 if self.__object_masks:
-                    object_mask.save(fp=self.__output_folder +
-                                     'object_mask' + suffix)
+                    self.__debug_writer.write_image(
+                        self.__output_folder + 'object_mask' + suffix,
+                        object_mask)
 
         return image_list, depth_map_list, object_mask_list
 
     def stop_simulation(self):
         """Stop the 3D simulation environment. This controller won't work any
         more."""
+        self.wait_for_finalization()
+        if self.__upload_manager is not None:
+            self.__upload_manager.shutdown()
+        if self.__history_database is not None:
+            self.__history_database.close()
+        if self.__dataset_writer is not None:
+            self.__dataset_writer.close()
+        for error in self.__debug_writer.shutdown():
+            print('Failed to write a debug output file: ' + str(error))
         self._controller.stop()
 
+    def _flush_debug_output(self, wait=True):
+        for error in self.__debug_writer.flush(wait):
+            print('Failed to write a debug output file: ' + str(error))
+
     def wrap_output(self, scene_event):
         if self.__debug_to_file and self.__output_folder is not None:
-            with open(self.__output_folder + 'ai2thor_output_' +
-                      str(self.__step_number) + '.json', 'w') as json_file:
-                json.dump({
-                    "metadata": scene_event.metadata
-                }, json_file, sort_keys=True, indent=4)
+            self.__debug_writer.write_json(
+                self.__output_folder + 'ai2thor_output_' +
+                str(self.__step_number) + '.json',
+                {"metadata": scene_event.metadata})
 
         image_list, depth_map_list, object_mask_list = self.save_images(
             scene_event,
@@ -1281,6 +1440,15 @@ class Controller():
 
         objects = scene_event.metadata.get('objects', None)
         agent = scene_event.metadata.get('agent', None)
+        if self._goal.metadata and self._goal.metadata.get(
+                'category') in Reward.GEOMETRY_CATEGORIES:
+            self.__spatial_index.update_from_metadata(objects)
+        object_mask_table = None
+        if (self.__object_masks and
+                self._metadata_tier == self.CONFIG_METADATA_TIER_ORACLE):
+            self.__object_mask_table.update(
+                self.retrieve_object_colors(scene_event))
+            object_mask_table = self.__object_mask_table
         step_output = StepMetadata(
             action_list=self.retrieve_action_list(
                 self._goal, self.__step_number),
@@ -1303,11 +1471,13 @@ class Controller():
             image_list=image_list,
             object_list=self.retrieve_object_list(scene_event),
             object_mask_list=object_mask_list,
+            object_mask_table=object_mask_table,
             pose=self.retrieve_pose(scene_event),
             position=self.retrieve_position(scene_event),
             return_status=self.retrieve_return_status(scene_event),
             reward=Reward.calculate_reward(
-                self._goal, objects, agent, self.__step_number),
+                self._goal, objects, agent, self.__step_number,
+                self.__spatial_index),
             rotation=self.retrieve_rotation(scene_event),
             step_number=self.__step_number,
             structural_object_list=self.retrieve_structural_object_list(
@@ -1315,9 +1485,39 @@ class Controller():
         )
 
         self.__head_tilt = step_output.head_tilt
+        step_output.occupancy_grid = self._update_occupancy_grid(step_output)
 
         return step_output
 
+    def _create_occupancy_grid(self, config_data):
+        if not self._config.snapshot.occupancy_grid:
+            return None
+        resolution = self._config.snapshot.occupancy_grid_resolution
+        if self._metadata_tier == self.CONFIG_METADATA_TIER_ORACLE:
+            return OccupancyGrid.for_room(
+                config_data.get('roomDimensions'), resolution)
+        if self.__depth_maps:
+            return OccupancyGrid.egocentric(
+                self.DEFAULT_CLIPPING_PLANE_FAR, resolution)
+        return None
+
+    def _update_occupancy_grid(self, step_output):
+        grid = self.__occupancy_grid
+        if grid is None:
+            return None
+        if self._metadata_tier == self.CONFIG_METADATA_TIER_ORACLE:
+            grid.update_from_objects(step_output.object_list,
+                                     step_output.structural_object_list)
+        elif step_output.depth_map_list:
+            # Without the agent's position or rotation at this metadata
+            # tier, just the current view, in front of the agent
+            grid.update_from_depth(
+                step_output.depth_map_list[-1], {'x': 0.0, 'z': 0.0}, 0.0,
+                step_output.head_tilt, step_output.camera_height,
+                step_output.camera_field_of_view,
+                step_output.camera_clipping_planes[1], replace=True)
+        return grid.grid.copy()
+
     def write_debug_output(self, step_output):
         if self.__debug_to_terminal:
             print("RETURN STATUS: " + step_output.return_status)
@@ -1334,9 +1534,9 @@ class Controller():
                     print("    " + line)
 
         if self.__debug_to_file and self.__output_folder is not None:
-            with open(self.__output_folder + 'mcs_output_' +
-                      str(self.__step_number) + '.json', 'w') as json_file:
-                json_file.write(str(step_output))
+            self.__debug_writer.write_json(
+                self.__output_folder + 'mcs_output_' +
+                str(self.__step_number) + '.json', dict(step_output))
 
     def wrap_step(self, **kwargs):
         # whether or not to randomize segmentation mask colors
@@ -1361,9 +1561,9 @@ class Controller():
         )
 
         if self.__debug_to_file and self.__output_folder is not None:
-            with open(self.__output_folder + 'ai2thor_input_' +
-                      str(self.__step_number) + '.json', 'w') as json_file:
-                json.dump(step_data, json_file, sort_keys=True, indent=4)
+            self.__debug_writer.write_json(
+                self.__output_folder + 'ai2thor_input_' +
+                str(self.__step_number) + '.json', step_data)
 
         return step_data
 
@@ -0,0 +1,294 @@
+import atexit
+import glob
+import json
+import os
+import queue
+import socket
+import threading
+import uuid
+from typing import Dict, Iterator, List, Sequence
+
+import numpy as np
+
+from .step_metadata import StepMetadata
+from .util import Util
+
+
+class DatasetWriter(object):
+    """Exports the frames of MCS scenes as a training dataset: the RGB
+    images, depth maps and object masks of each step (with one frame per
+    image in its image_list) go into fixed size shards of contiguous .npy
+    arrays, and the rest of each frame (scene, step, action, params,
+    reward, return status, agent pose and object metadata) into the
+    shard's index. A background thread does all the writing.
+
+    Each writer names its shards and manifest with its own writer ID, so
+    many writers (like one per process of a controller pool) can export
+    into the same directory. Read the dataset with DatasetReader.
+
+    A shard's index (and the manifest) is only written once the shard is
+    full or the writer is closed, so the writer closes itself at exit if
+    it is still open."""
+
+    RGB = 'rgb'
+    DEPTH = 'depth'
+    MASK = 'mask'
+    ARRAY_NAMES = (RGB, DEPTH, MASK)
+
+    INDEX_FILE = 'index.json'
+    MANIFEST_PREFIX = 'manifest_'
+
+    DEFAULT_SHARD_SIZE = 1000
+
+    def __init__(self, directory: str, shard_size: int = DEFAULT_SHARD_SIZE,
+                 writer_id: str = None, max_pending_steps: int = 64):
+        self.directory = directory
+        self.shard_size = shard_size
+        self.writer_id = writer_id or (
+            f'{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}')
+        os.makedirs(directory, exist_ok=True)
+
+        self._shard_list = []
+        self._shard = None
+        self._error = None
+        self._closed = False
+        self._queue = queue.Queue(max_pending_steps)
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    @property
+    def manifest_path(self) -> str:
+        return os.path.join(self.directory,
+                            self.MANIFEST_PREFIX + self.writer_id + '.json')
+
+    def add_step(self, scene_name: str, step_metadata: StepMetadata,
+                 action: str = None, params: Dict = None) -> None:
+        """Queue the frames of the given step output for writing. Blocks if
+        the background thread falls max_pending_steps behind."""
+        self._raise_error()
+        if self._closed:
+            raise ValueError('The dataset writer is closed')
+
+        record = {
+            'scene': scene_name,
+            'step': step_metadata.step_number,
+            'action': action,
+            'params': params,
+            'reward': step_metadata.reward,
+            'return_status': step_metadata.return_status,
+            'position': step_metadata.position,
+            'rotation': step_metadata.rotation,
+            'head_tilt': step_metadata.head_tilt,
+            'objects': [dict(obj) for obj in step_metadata.object_list or []]
+        }
+        image_list = step_metadata.image_list or []
+        depth_map_list = step_metadata.depth_map_list or []
+        object_mask_list = step_metadata.object_mask_list or []
+        for index, image in enumerate(image_list):
+            frame = {
+                self.RGB: np.asarray(image),
+                self.DEPTH: (np.asarray(depth_map_list[index], np.float32)
+                             if index < len(depth_map_list) else None),
+                self.MASK: (np.asarray(object_mask_list[index])
+                            if index < len(object_mask_list) else None)
+            }
+            self._queue.put((frame, dict(record, substep=index)))
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            try:
+                if item is None:
+                    self._close_shard()
+                elif self._error is None:
+                    self._write_frame(*item)
+            except Exception as error:
+                self._error = error
+            finally:
+                self._queue.task_done()
+            if item is None:
+                return
+
+    def _frame_layout(self, frame: Dict) -> Dict:
+        return {name: (array.shape, array.dtype.str)
+                for name, array in frame.items() if array is not None}
+
+    def _open_shard(self, layout: Dict) -> None:
+        name = f'{self.writer_id}_{len(self._shard_list):05d}'
+        path = os.path.join(self.directory, name)
+        os.makedirs(path, exist_ok=True)
+        # Preallocated (sparse) arrays; the index records how many frames
+        # were written.
+        arrays = {
+            array_name: np.lib.format.open_memmap(
+                os.path.join(path, array_name + '.npy'), mode='w+',
+                dtype=np.dtype(dtype), shape=(self.shard_size,) + shape)
+            for array_name, (shape, dtype) in layout.items()
+        }
+        self._shard = {
+            'name': name,
+            'path': path,
+            'layout': layout,
+            'arrays': arrays,
+            'records': []
+        }
+
+    def _write_frame(self, frame: Dict, record: Dict) -> None:
+        layout = self._frame_layout(frame)
+        if self._shard is not None and self._shard['layout'] != layout:
+            # Frame size or metadata tier changed: start a new shard
+            self._close_shard()
+        if self._shard is None:
+            self._open_shard(layout)
+        index = len(self._shard['records'])
+        for array_name, array in self._shard['arrays'].items():
+            array[index] = frame[array_name]
+        self._shard['records'].append(record)
+        if len(self._shard['records']) >= self.shard_size:
+            self._close_shard()
+
+    def _close_shard(self) -> None:
+        if self._shard is None:
+            return
+        shard, self._shard = self._shard, None
+        for array in shard['arrays'].values():
+            array.flush()
+        count = len(shard['records'])
+        self._write_json(os.path.join(shard['path'], self.INDEX_FILE), {
+            'count': count,
+            'arrays': list(shard['arrays']),
+            'records': shard['records']
+        })
+        self._shard_list.append({'name': shard['name'], 'count': count})
+        self._write_json(self.manifest_path, {
+            'writer_id': self.writer_id,
+            'shards': self._shard_list
+        })
+
+    @staticmethod
+    def _write_json(path: str, data: Dict) -> None:
+        partial_path = path + '.partial'
+        with open(partial_path, 'w') as json_file:
+            json.dump(data, json_file, default=Util.json_default)
+        os.replace(partial_path, path)
+
+    def _raise_error(self) -> None:
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise error
+
+    def flush(self) -> None:
+        """Wait until every queued frame is written (the current shard is
+        still open)."""
+        self._queue.join()
+        self._raise_error()
+
+    def close(self) -> None:
+        """Write all queued frames and the last (partial) shard."""
+        if not self._closed:
+            self._closed = True
+            atexit.unregister(self.close)
+            self._queue.put(None)
+            self._thread.join()
+        self._raise_error()
+
+
+class DatasetReader(object):
+    """Reads a dataset exported by any number of DatasetWriters, memory
+    mapping the shard arrays, and serves frames by global index, either
+    one at a time or in random access batches."""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self._shards = []
+        manifest_list = sorted(glob.glob(os.path.join(
+            directory, DatasetWriter.MANIFEST_PREFIX + '*.json')))
+        for manifest_path in manifest_list:
+            with open(manifest_path) as manifest_file:
+                manifest = json.load(manifest_file)
+            for shard in manifest['shards']:
+                self._shards.append(self._open_shard(shard['name']))
+        self._offsets = np.cumsum(
+            [0] + [shard['count'] for shard in self._shards])
+
+    def _open_shard(self, name: str) -> Dict:
+        path = os.path.join(self.directory, name)
+        with open(os.path.join(path, DatasetWriter.INDEX_FILE)) as index_file:
+            index = json.load(index_file)
+        return {
+            'name': name,
+            'count': index['count'],
+            'records': index['records'],
+            'arrays': {
+                array_name: np.load(
+                    os.path.join(path, array_name + '.npy'), mmap_mode='r'
+                )[:index['count']]
+                for array_name in index['arrays']
+            }
+        }
+
+    def __len__(self) -> int:
+        return int(self._offsets[-1])
+
+    def _locate(self, index: int):
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(f'Frame {index} is out of range')
+        shard_index = int(np.searchsorted(self._offsets, index,
+                                          side='right')) - 1
+        return shard_index, index - int(self._offsets[shard_index])
+
+    def __getitem__(self, index: int) -> Dict:
+        shard_index, frame_index = self._locate(index)
+        shard = self._shards[shard_index]
+        frame = {name: array[frame_index]
+                 for name, array in shard['arrays'].items()}
+        frame['record'] = shard['records'][frame_index]
+        return frame
+
+    def get_batch(self, index_list: Sequence[int]) -> Dict:
+        """Return the frames at the given indexes as a dict of stacked
+        arrays (rgb, depth and/or mask) plus a list of their records. All
+        the frames must have the same arrays and shapes."""
+        located = [self._locate(int(index)) for index in index_list]
+        batch = {'record': [None] * len(located)}
+        shard_positions = {}
+        for position, (shard_index, frame_index) in enumerate(located):
+            shard_positions.setdefault(shard_index, []).append(
+                (position, frame_index))
+        for shard_index, position_list in shard_positions.items():
+            shard = self._shards[shard_index]
+            positions = [position for position, _ in position_list]
+            frame_indexes = np.array([index for _, index in position_list])
+            # One sorted, fancy indexed read per shard
+            order = np.argsort(frame_indexes)
+            for name, array in shard['arrays'].items():
+                if name not in batch:
+                    batch[name] = np.empty(
+                        (len(located),) + array.shape[1:], array.dtype)
+                values = array[frame_indexes[order]]
+                batch[name][np.array(positions)[order]] = values
+            for position, frame_index in position_list:
+                batch['record'][position] = shard['records'][frame_index]
+        return batch
+
+    def iter_batches(self, batch_size: int, shuffle: bool = False,
+                     seed: int = None) -> Iterator[Dict]:
+        """Yield batches (see get_batch) covering every frame once, in order
+        or shuffled."""
+        index_list = np.arange(len(self))
+        if shuffle:
+            np.random.default_rng(seed).shuffle(index_list)
+        for start in range(0, len(index_list), batch_size):
+            yield self.get_batch(index_list[start:start + batch_size])
+
+    def iter_records(self) -> Iterator[Dict]:
+        """Yield the record of every frame in index order, without reading
+        any arrays."""
+        for shard in self._shards:
+            yield from shard['records']
+
+    def scene_names(self) -> List[str]:
+        return sorted({record['scene'] for record in self.iter_records()})
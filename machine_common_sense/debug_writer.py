@@ -0,0 +1,162 @@
+import concurrent.futures
+import json
+import os
+import threading
+from typing import Dict, Iterator, List, Tuple
+
+import numpy as np
+import PIL.Image
+
+from .compression import Compression
+from .util import Util
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class DebugWriter(object):
+    """
+    Writes the debug output files of the debug_output = file setting (the
+    AI2-THOR input and output JSON, the MCS output JSON, and the frame,
+    depth map and object mask PNG images) on a pool of background threads,
+    so the step loop only hands over each file's data rather than encoding
+    and writing it.
+
+    JSON files are encoded compactly, with orjson if it is installed. With
+    a batch size over one, the JSON files are instead coalesced into JSON
+    Lines batch files ("debug_output_N.jsonl", one {"file": name, "data":
+    data} record per line, read with read_batch) to write fewer small
+    files. The data handed over must not be changed afterwards.
+    """
+
+    BATCH_FILE_PREFIX = 'debug_output_'
+    BATCH_FILE_EXTENSION = '.jsonl'
+
+    # Writes to queue before the step loop waits for the workers, to bound
+    # the memory held when the disk cannot keep up
+    MAX_PENDING_WRITES = 64
+
+    def __init__(self, compression: Compression = None, workers: int = 2,
+                 png_compression: int = 1, batch_size: int = 1):
+        self.compression = compression or Compression()
+        self.workers = max(1, workers)
+        self.png_compression = png_compression
+        self.batch_size = max(1, batch_size)
+        self._executor = None
+        self._futures = []
+        self._lock = threading.RLock()
+        self._slots = threading.BoundedSemaphore(self.MAX_PENDING_WRITES)
+        self._batch = []
+        self._batch_folder = None
+        self._batch_number = 0
+
+    @staticmethod
+    def dumps(data) -> bytes:
+        """Return the given data encoded as compact JSON bytes, converting
+        numpy arrays and numbers to lists and numbers, and any other value
+        JSON does not support to a string."""
+        if orjson is not None:
+            return orjson.dumps(
+                data, default=Util.json_default,
+                option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS)
+        return json.dumps(data, default=Util.json_default,
+                          separators=(',', ':')).encode('utf-8')
+
+    @staticmethod
+    def read_batch(path) -> Iterator[Tuple[str, Dict]]:
+        """Yield the file name and data of each JSON file in the batch file
+        at the given path."""
+        for line in Compression.read_text(path).splitlines():
+            if line:
+                record = json.loads(line)
+                yield record['file'], record['data']
+
+    def write_json(self, path, data) -> None:
+        """Write the data to the JSON file at the given path (plus the
+        compressed file extension), or add it to the current batch."""
+        path = str(path)
+        if self.batch_size == 1:
+            self._submit(self._write_json, path, data)
+            return
+        folder, name = os.path.split(path)
+        with self._lock:
+            if self._batch and folder != self._batch_folder:
+                self._submit_batch()
+            if folder != self._batch_folder:
+                self._batch_folder = folder
+                self._batch_number = 0
+            self._batch.append((name, data))
+            if len(self._batch) >= self.batch_size:
+                self._submit_batch()
+
+    def write_image(self, path, image) -> None:
+        """Write the given PIL image or uint8 image array to the PNG file at
+        the given path."""
+        self._submit(self._write_png, str(path), image)
+
+    def flush(self, wait: bool = True) -> List[Exception]:
+        """Write the current batch, and (if wait) wait for all the queued
+        writes to finish and return the errors of any that failed."""
+        with self._lock:
+            if self._batch:
+                self._submit_batch()
+            if not wait:
+                return []
+            futures, self._futures = self._futures, []
+        return [future.exception() for future in futures
+                if future.exception() is not None]
+
+    def shutdown(self) -> List[Exception]:
+        errors = self.flush()
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown()
+                self._executor = None
+        return errors
+
+    def _submit_batch(self) -> None:
+        # Called with the lock held
+        path = os.path.join(
+            self._batch_folder, self.BATCH_FILE_PREFIX +
+            str(self._batch_number) + self.BATCH_FILE_EXTENSION)
+        self._batch_number += 1
+        records, self._batch = self._batch, []
+        self._submit(self._write_batch, path, records)
+
+    def _submit(self, function, *args) -> None:
+        # Block if the workers have too many queued writes.
+        self._slots.acquire()
+        try:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = concurrent.futures.ThreadPoolExecutor(
+                        max_workers=self.workers,
+                        thread_name_prefix='mcs-debug')
+                self._futures = [future for future in self._futures
+                                 if not future.done() or future.exception()]
+                future = self._executor.submit(function, *args)
+                self._futures.append(future)
+        except Exception:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+
+    def _write_json(self, path: str, data) -> None:
+        self.compression.write_to(
+            path + self.compression.extension, self.dumps(data))
+
+    def _write_batch(self, path: str, records: List) -> None:
+        self.compression.write_to(
+            path + self.compression.extension, b''.join(
+                self.dumps({'file': name, 'data': data}) + b'\n'
+                for name, data in records))
+
+    def _write_png(self, path: str, image) -> None:
+        if isinstance(image, np.ndarray):
+            image = PIL.Image.fromarray(image)
+        partial_path = path + '.partial'
+        image.save(partial_path, format='PNG',
+                   compress_level=self.png_compression)
+        os.replace(partial_path, path)
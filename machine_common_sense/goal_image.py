@@ -0,0 +1,128 @@
+import base64
+import collections
+import hashlib
+import io
+import json
+from typing import Dict, Union
+
+import numpy as np
+import PIL.Image
+
+
+class GoalImage(object):
+    """
+    Decodes the goal target images of scene files into numpy arrays. Scene
+    files may give each image as:
+
+    - a PNG data URI string ("data:image/png;base64,...")
+    - a dict of raw pixel bytes: {"data": <base64 string>, "shape":
+      [height, width, channels], "dtype": "uint8" (the default)}
+    - a (legacy) string of a nested list of numbers, like "[[[0, 0, 0]]]"
+    - a nested list of numbers, or a numpy array
+
+    Decoded images are cached by the hash of their encoding, since the same
+    scene file (and its same images) is often run many times.
+    """
+
+    PNG_PREFIX = 'data:image/png;base64,'
+
+    # Decoded images to keep (a few scenes' worth of targets)
+    CACHE_SIZE = 16
+
+    _cache = collections.OrderedDict()
+
+    @staticmethod
+    def clear_cache() -> None:
+        GoalImage._cache.clear()
+
+    @staticmethod
+    def encode(image: np.ndarray, png: bool = True) -> Union[str, Dict]:
+        """Return the given uint8 RGB image array in a compact scene file
+        encoding: a PNG data URI string, or a dict of its raw bytes."""
+        image = np.ascontiguousarray(image, dtype=np.uint8)
+        if png:
+            buffer = io.BytesIO()
+            PIL.Image.fromarray(image).save(buffer, format='PNG')
+            return GoalImage.PNG_PREFIX + base64.b64encode(
+                buffer.getvalue()).decode('ascii')
+        return {
+            'data': base64.b64encode(image.tobytes()).decode('ascii'),
+            'shape': list(image.shape),
+            'dtype': str(image.dtype)
+        }
+
+    @staticmethod
+    def decode(value) -> np.ndarray:
+        """
+        Return the given encoded goal target image as a numpy array, which
+        is shared with other decodings of the same encoding (so is read
+        only), or the value itself if it is not an encoded image (like None).
+        """
+        if value is None or isinstance(value, np.ndarray):
+            return value
+        if isinstance(value, list):
+            return np.array(value)
+        if isinstance(value, dict):
+            if 'data' not in value:
+                return value
+            text = value['data'] + json.dumps(
+                [value.get('shape'), value.get('dtype')])
+        elif isinstance(value, str):
+            text = value
+        else:
+            return value
+
+        key = hashlib.sha1(text.encode('utf-8')).hexdigest()
+        image = GoalImage._cache.get(key)
+        if image is not None:
+            GoalImage._cache.move_to_end(key)
+            return image
+        if isinstance(value, dict):
+            image = np.frombuffer(
+                base64.b64decode(value['data']),
+                dtype=np.dtype(value.get('dtype', 'uint8'))
+            ).reshape(value['shape'])
+        elif value.startswith(GoalImage.PNG_PREFIX):
+            image = np.array(PIL.Image.open(io.BytesIO(base64.b64decode(
+                value[len(GoalImage.PNG_PREFIX):]))).convert('RGB'))
+        else:
+            image = GoalImage.parse_list(value)
+        image.setflags(write=False)
+        GoalImage._cache[key] = image
+        if len(GoalImage._cache) > GoalImage.CACHE_SIZE:
+            GoalImage._cache.popitem(last=False)
+        return image
+
+    @staticmethod
+    def parse_list(text: str) -> np.ndarray:
+        """
+        Return the given string of a nested list of numbers, like
+        "[[1, 2], [3, 4]]", as a numpy array, finding its shape from the
+        brackets and commas and parsing all its numbers in one pass (or, if
+        its lists are not all the same length, with a JSON parser).
+        """
+        characters = np.frombuffer(text.encode('ascii'), dtype=np.uint8)
+        opens = characters == ord('[')
+        depth = np.cumsum(opens.astype(np.int32) - (characters == ord(']')))
+        commas = characters == ord(',')
+        shape = []
+        # The number of lists at each depth, and commas in each list
+        lists = np.bincount(depth[opens])
+        for level in range(1, len(lists)):
+            at_level = depth == level
+            list_index = np.cumsum(opens & at_level) - 1
+            list_commas = np.bincount(list_index[commas & at_level],
+                                      minlength=lists[level])
+            if not list_commas.size or np.any(list_commas != list_commas[0]):
+                return np.array(json.loads(text))
+            shape.append(int(list_commas[0]) + 1)
+        numbers = text.translate(GoalImage._BRACKETS)
+        integers = not any(letter in numbers for letter in '.eE')
+        values = np.fromstring(
+            numbers, dtype=np.int64 if integers else np.float64, sep=',')
+        if (not shape or depth[-1] != 0 or values.size != np.prod(shape) or
+                '[]' in text.replace(' ', '')):
+            return np.array(json.loads(text))
+        return values.reshape(shape)
+
+    _BRACKETS = str.maketrans({'[': ' ', ']': ' '})
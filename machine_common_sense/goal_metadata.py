@@ -154,7 +154,7 @@ class GoalCategory(Enum):
     target.id : string
         The objectId of the target object to retrieve.
 
-    target.image : list of numpy arrays
+    target.image : numpy array
         An image of the target object to retrieve, given as a 3D RGB pixel
         array.
 
@@ -241,7 +241,7 @@ class GoalCategory(Enum):
     target.id : string
         The objectId of the target object to find and move next to.
 
-    target.image : list of numpy arrays
+    target.image : numpy array
         An image of the target object to find and move next to, given as a 3D
         RGB pixel array.
 
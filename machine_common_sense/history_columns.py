@@ -0,0 +1,195 @@
+import json
+import pathlib
+import zipfile
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from .compression import Compression
+from .history_reader import HistoryReader
+
+
+class HistoryColumns(object):
+    """Converts scene history files into a columnar NumPy .npz format, with
+    one typed array per step field, and loads those columns back (memory
+    mapped by default) for analysis across many scenes.
+
+    Missing numbers are NaN and missing strings are empty. The scene info,
+    and the params and args of each step, are kept as JSON strings."""
+
+    EXTENSION = ".npz"
+
+    # Per-step columns: name to (dtype, function of the step dict)
+    NUMBER_COLUMNS = {
+        'step': (np.int32, lambda step: step.get('step')),
+        'delta_time_millis': (
+            np.float64, lambda step: step.get('delta_time_millis')),
+        'confidence': (np.float32, lambda step: step.get('confidence')),
+        'head_tilt': (
+            np.float32, lambda step: (step.get('output') or {}).get(
+                'head_tilt')),
+        'reward': (
+            np.float32, lambda step: (step.get('output') or {}).get(
+                'reward')),
+        'rotation': (
+            np.float32, lambda step: (step.get('output') or {}).get(
+                'rotation')),
+    }
+    STRING_COLUMNS = {
+        'action': lambda step: step.get('action'),
+        'classification': lambda step: step.get('classification'),
+        'pose': lambda step: (step.get('output') or {}).get('pose'),
+        'return_status': lambda step: (step.get('output') or {}).get(
+            'return_status'),
+        'params': lambda step: HistoryColumns._to_json(step.get('params')),
+        'args': lambda step: HistoryColumns._to_json(step.get('args')),
+    }
+    POSITION_AXES = ('x', 'y', 'z')
+
+    @staticmethod
+    def _to_json(value) -> Optional[str]:
+        return None if value is None else json.dumps(value)
+
+    @staticmethod
+    def _number(value) -> float:
+        try:
+            return np.nan if value is None else float(value)
+        except (TypeError, ValueError):
+            return np.nan
+
+    @staticmethod
+    def _string_array(value_list: List) -> np.ndarray:
+        # Fixed width unicode (not object) arrays, so they can be mapped
+        return np.array(
+            ['' if value is None else str(value) for value in value_list],
+            dtype=np.str_
+        )
+
+    @staticmethod
+    def from_history(history: Dict) -> Dict[str, np.ndarray]:
+        """Return the columns for the given history document
+        ({"info", "steps", "score"})."""
+        steps = history.get('steps') or []
+        columns = {}
+        for name, (dtype, getter) in HistoryColumns.NUMBER_COLUMNS.items():
+            values = [HistoryColumns._number(getter(step)) for step in steps]
+            if np.issubdtype(dtype, np.integer):
+                values = [-1 if np.isnan(value) else value
+                          for value in values]
+            columns[name] = np.array(values, dtype=dtype)
+        for name, getter in HistoryColumns.STRING_COLUMNS.items():
+            columns[name] = HistoryColumns._string_array(
+                [getter(step) for step in steps])
+
+        position = np.full((len(steps), 3), np.nan, dtype=np.float32)
+        for index, step in enumerate(steps):
+            step_position = (step.get('output') or {}).get('position') or {}
+            for axis, key in enumerate(HistoryColumns.POSITION_AXES):
+                position[index, axis] = HistoryColumns._number(
+                    step_position.get(key))
+        columns['position'] = position
+
+        score = history.get('score') or {}
+        columns['info'] = np.array(json.dumps(history.get('info') or {}))
+        columns['score_classification'] = np.array(
+            str(score.get('classification') or ''))
+        columns['score_confidence'] = np.array(
+            HistoryColumns._number(score.get('confidence') or None),
+            dtype=np.float32)
+        return columns
+
+    @staticmethod
+    def save(columns: Dict[str, np.ndarray], npz_path) -> pathlib.Path:
+        """Write the columns to an uncompressed .npz file (uncompressed so
+        that load can memory map them)."""
+        npz_path = pathlib.Path(npz_path)
+        npz_path.parent.mkdir(parents=True, exist_ok=True)
+        partial_path = npz_path.with_name(npz_path.name + '.partial')
+        with open(partial_path, 'wb') as npz_file:
+            np.savez(npz_file, **columns)
+        partial_path.replace(npz_path)
+        return npz_path
+
+    @staticmethod
+    def convert_file(history_path, npz_path=None) -> pathlib.Path:
+        """Convert a JSON (or JSON lines) history file into a columnar .npz
+        file, by default next to it with the .npz extension."""
+        history_path = pathlib.Path(history_path)
+        if npz_path is None:
+            npz_path = HistoryColumns._npz_path(history_path)
+        return HistoryColumns.save(
+            HistoryColumns.from_history(HistoryReader.read(history_path)),
+            npz_path
+        )
+
+    @staticmethod
+    def _npz_path(history_path: pathlib.Path) -> pathlib.Path:
+        return pathlib.Path(Compression.strip_extension(
+            history_path)).with_suffix(HistoryColumns.EXTENSION)
+
+    @staticmethod
+    def convert_directory(directory,
+                          output_directory=None) -> List[pathlib.Path]:
+        """Convert every history file under the given directory, keeping
+        their relative paths under the output directory (by default, the
+        same directory). Returns the paths of the .npz files."""
+        directory = pathlib.Path(directory)
+        output_directory = pathlib.Path(output_directory or directory)
+        return [
+            HistoryColumns.convert_file(
+                history_path,
+                HistoryColumns._npz_path(
+                    output_directory / history_path.relative_to(directory))
+            )
+            for history_path in HistoryReader.iter_history_files(directory)
+        ]
+
+    @staticmethod
+    def load(npz_path, mmap: bool = True) -> Dict[str, np.ndarray]:
+        """Return the columns from a .npz file. With mmap (the default),
+        each column of an uncompressed file is a read only memory map of
+        the file, so only the parts of the columns used are read."""
+        if not mmap:
+            with np.load(npz_path) as npz_file:
+                return {name: npz_file[name] for name in npz_file.files}
+
+        columns = {}
+        with zipfile.ZipFile(npz_path) as zip_file, \
+                open(npz_path, 'rb') as raw_file:
+            for member in zip_file.infolist():
+                name = member.filename[:-len('.npy')]
+                if member.compress_type != zipfile.ZIP_STORED:
+                    with zip_file.open(member) as member_file:
+                        columns[name] = np.lib.format.read_array(member_file)
+                    continue
+                columns[name] = HistoryColumns._map_member(
+                    npz_path, raw_file, member)
+        return columns
+
+    @staticmethod
+    def _map_member(npz_path, raw_file, member: zipfile.ZipInfo):
+        # Skip the zip local file header to the start of the .npy data
+        raw_file.seek(member.header_offset)
+        header = raw_file.read(zipfile.sizeFileHeader)
+        name_length = int.from_bytes(header[26:28], 'little')
+        extra_length = int.from_bytes(header[28:30], 'little')
+        raw_file.seek(member.header_offset + zipfile.sizeFileHeader +
+                      name_length + extra_length)
+
+        version = np.lib.format.read_magic(raw_file)
+        read_header = (np.lib.format.read_array_header_1_0
+                       if version == (1, 0)
+                       else np.lib.format.read_array_header_2_0)
+        shape, fortran_order, dtype = read_header(raw_file)
+        if dtype.hasobject:
+            raise ValueError(
+                f'Cannot memory map object column {member.filename}')
+        if 0 in shape:
+            return np.zeros(shape, dtype=dtype)
+        if not shape:
+            # np.memmap needs at least one dimension; read scalars directly
+            return np.frombuffer(
+                raw_file.read(dtype.itemsize), dtype=dtype).reshape(())
+        return np.memmap(npz_path, dtype=dtype, mode='r',
+                         offset=raw_file.tell(), shape=shape,
+                         order='F' if fortran_order else 'C')
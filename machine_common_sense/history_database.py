@@ -0,0 +1,210 @@
+import json
+import pathlib
+import sqlite3
+import threading
+from typing import Dict, List
+
+from .history_reader import HistoryReader
+from .util import Util
+
+
+class HistoryDatabase(object):
+    """Stores scene histories from any number of evaluation runs in one
+    local SQLite database, indexed by evaluation name, team, metadata tier,
+    scene name and step, so they can be queried without reading every
+    history file. For example:
+
+        SELECT scenes.name FROM steps JOIN scenes ON scenes.id = steps.scene
+        WHERE scenes.team = 'X' AND steps.step = 40 AND steps.confidence < 0.5
+
+    Steps are buffered and inserted in batched transactions. The database
+    may be shared by threads (like the controller's background scene
+    finalization)."""
+
+    # Insert buffered steps in one transaction after this many steps.
+    BATCH_STEPS = 100
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS scenes (
+            id INTEGER PRIMARY KEY,
+            evaluation_name TEXT,
+            evaluation INTEGER,
+            team TEXT,
+            metadata_tier TEXT,
+            name TEXT,
+            timestamp TEXT,
+            classification TEXT,
+            confidence REAL,
+            info TEXT,
+            source TEXT UNIQUE
+        );
+        CREATE TABLE IF NOT EXISTS steps (
+            scene INTEGER NOT NULL REFERENCES scenes(id),
+            step INTEGER,
+            action TEXT,
+            classification TEXT,
+            confidence REAL,
+            return_status TEXT,
+            reward REAL,
+            delta_time_millis REAL,
+            position_x REAL,
+            position_y REAL,
+            position_z REAL,
+            rotation REAL,
+            head_tilt REAL,
+            data TEXT
+        );
+        CREATE INDEX IF NOT EXISTS scenes_run ON scenes (
+            evaluation_name, team, metadata_tier, name);
+        CREATE INDEX IF NOT EXISTS scenes_team ON scenes (team);
+        CREATE INDEX IF NOT EXISTS scenes_name ON scenes (name);
+        CREATE INDEX IF NOT EXISTS steps_scene ON steps (scene, step);
+        CREATE INDEX IF NOT EXISTS steps_step ON steps (step);
+    """
+
+    STEP_INSERT = """
+        INSERT INTO steps VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    """
+
+    def __init__(self, database_path):
+        self.path = pathlib.Path(database_path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.RLock()
+        self._connection = sqlite3.connect(
+            str(self.path), check_same_thread=False)
+        self._connection.execute('PRAGMA journal_mode=WAL')
+        self._connection.execute('PRAGMA synchronous=NORMAL')
+        self._connection.executescript(self.SCHEMA)
+        self._pending_steps = []
+
+    @staticmethod
+    def _number(value):
+        try:
+            return None if value is None else float(value)
+        except (TypeError, ValueError):
+            return None
+
+    @staticmethod
+    def _step_row(scene_id: int, step: Dict) -> tuple:
+        output = step.get('output') or {}
+        position = output.get('position') or {}
+        number = HistoryDatabase._number
+        return (
+            scene_id,
+            step.get('step'),
+            step.get('action'),
+            step.get('classification'),
+            number(step.get('confidence')),
+            output.get('return_status'),
+            number(output.get('reward')),
+            number(step.get('delta_time_millis')),
+            number(position.get('x')),
+            number(position.get('y')),
+            number(position.get('z')),
+            number(output.get('rotation')),
+            number(output.get('head_tilt')),
+            json.dumps(step, default=Util.json_default)
+        )
+
+    def _insert_scene(self, info: Dict, source: str = None) -> int:
+        cursor = self._connection.execute(
+            'INSERT INTO scenes (evaluation_name, evaluation, team, '
+            'metadata_tier, name, timestamp, info, source) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+            (
+                info.get('evaluation_name'),
+                info.get('evaluation'),
+                info.get('team'),
+                info.get('metadata'),
+                info.get('name'),
+                info.get('timestamp'),
+                json.dumps(info, default=Util.json_default),
+                source
+            )
+        )
+        return cursor.lastrowid
+
+    def _update_score(self, scene_id: int, score: Dict) -> None:
+        self._connection.execute(
+            'UPDATE scenes SET classification = ?, confidence = ? '
+            'WHERE id = ?',
+            (
+                score.get('classification'),
+                self._number(score.get('confidence')),
+                scene_id
+            )
+        )
+
+    def begin_scene(self, info: Dict, source: str = None) -> int:
+        """Add a scene with the given history info and return its ID."""
+        with self._lock, self._connection:
+            return self._insert_scene(info, source)
+
+    def add_step(self, scene_id: int, step: Dict) -> None:
+        """Buffer a history step dict of the given scene, inserting the
+        buffered steps once there are BATCH_STEPS of them."""
+        with self._lock:
+            self._pending_steps.append(self._step_row(scene_id, step))
+            if len(self._pending_steps) >= self.BATCH_STEPS:
+                self.flush()
+
+    def _insert_pending_steps(self) -> None:
+        self._connection.executemany(self.STEP_INSERT, self._pending_steps)
+        self._pending_steps = []
+
+    def end_scene(self, scene_id: int, score: Dict,
+                  source: str = None) -> None:
+        """Save the end score (and, if given, the final history file path)
+        of the given scene and insert its steps."""
+        with self._lock, self._connection:
+            self._insert_pending_steps()
+            self._update_score(scene_id, score)
+            if source is not None:
+                self._connection.execute(
+                    'UPDATE scenes SET source = ? WHERE id = ?',
+                    (source, scene_id))
+
+    def flush(self) -> None:
+        """Insert all buffered steps in one transaction."""
+        with self._lock, self._connection:
+            self._insert_pending_steps()
+
+    def import_history(self, history: Dict, source: str = None) -> int:
+        """Add a whole history document ({"info", "steps", "score"}) in
+        one transaction and return the scene ID."""
+        with self._lock, self._connection:
+            scene_id = self._insert_scene(history.get('info') or {}, source)
+            self._connection.executemany(self.STEP_INSERT, (
+                self._step_row(scene_id, step)
+                for step in history.get('steps') or []
+            ))
+            self._update_score(scene_id, history.get('score') or {})
+        return scene_id
+
+    def import_directory(self, directory) -> List[pathlib.Path]:
+        """Import every history file under the given (SCENE_HISTORY)
+        directory, skipping files imported before. Returns the paths of
+        the imported files."""
+        imported = []
+        for history_path in HistoryReader.iter_history_files(directory):
+            source = str(history_path.resolve())
+            with self._lock:
+                exists = self._connection.execute(
+                    'SELECT 1 FROM scenes WHERE source = ?', (source,)
+                ).fetchone()
+            if exists:
+                continue
+            self.import_history(HistoryReader.read(history_path), source)
+            imported.append(history_path)
+        return imported
+
+    def query(self, sql: str, parameters=()) -> List[tuple]:
+        """Return all rows from the given SQL query."""
+        with self._lock:
+            self.flush()
+            return self._connection.execute(sql, parameters).fetchall()
+
+    def close(self) -> None:
+        with self._lock:
+            self.flush()
+            self._connection.close()
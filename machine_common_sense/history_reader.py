@@ -0,0 +1,76 @@
+import json
+import pathlib
+from typing import Dict, Iterator
+
+from .compression import Compression
+from .history_writer import HistoryWriter, StreamingHistoryWriter
+
+
+class HistoryReader(object):
+    """Reads scene history files written by either the HistoryWriter (one
+    JSON document) or the StreamingHistoryWriter (JSON lines), compressed
+    or not."""
+
+    @staticmethod
+    def is_streaming(history_path: str) -> bool:
+        return Compression.strip_extension(history_path).endswith(
+            StreamingHistoryWriter.EXTENSION)
+
+    @staticmethod
+    def is_history_file(history_path) -> bool:
+        return Compression.strip_extension(history_path).endswith((
+            HistoryWriter.EXTENSION, StreamingHistoryWriter.EXTENSION))
+
+    @staticmethod
+    def iter_history_files(directory) -> Iterator[pathlib.Path]:
+        """Yield every history file under the given (SCENE_HISTORY)
+        directory, including its prefix subdirectories, in sorted order."""
+        for path in sorted(pathlib.Path(directory).rglob('*')):
+            if path.is_file() and HistoryReader.is_history_file(path):
+                yield path
+
+    @staticmethod
+    def iter_records(history_path: str) -> Iterator[Dict]:
+        """Yield each record of a JSON lines history file in order. Stops at
+        a partial last line, left if the scene was interrupted mid-write."""
+        if Compression.strip_extension(history_path) == str(history_path):
+            with open(history_path) as history_file:
+                yield from HistoryReader._parse_records(history_file)
+        else:
+            yield from HistoryReader._parse_records(
+                Compression.read_text(history_path).splitlines(True))
+
+    @staticmethod
+    def _parse_records(lines) -> Iterator[Dict]:
+        for line in lines:
+            if not line.endswith("\n"):
+                break
+            yield json.loads(line)
+
+    @staticmethod
+    def iter_steps(history_path: str) -> Iterator[Dict]:
+        """Yield each step dict of a history file in order, without holding
+        the other steps of a JSON lines history in memory."""
+        if not HistoryReader.is_streaming(history_path):
+            yield from HistoryReader.read(history_path).get("steps", [])
+            return
+        for record in HistoryReader.iter_records(history_path):
+            if record["type"] == StreamingHistoryWriter.RECORD_STEP:
+                yield record[StreamingHistoryWriter.RECORD_STEP]
+
+    @staticmethod
+    def read(history_path: str) -> Dict:
+        """Return the history document ({"info", "steps", "score"}) from a
+        history file of either format. A JSON lines history without a score
+        trailer (the scene never ended) has an empty score."""
+        if not HistoryReader.is_streaming(history_path):
+            return json.loads(Compression.read_text(history_path))
+
+        history = {"info": {}, "steps": [], "score": {}}
+        for record in HistoryReader.iter_records(history_path):
+            record_type = record["type"]
+            if record_type == StreamingHistoryWriter.RECORD_STEP:
+                history["steps"].append(record[record_type])
+            else:
+                history[record_type] = record[record_type]
+        return history
@@ -0,0 +1,316 @@
+import io
+import json
+from types import SimpleNamespace
+from typing import Dict, List, Optional
+
+import PIL.Image
+
+from .compression import Compression
+from .dataset import DatasetReader
+from .goal_metadata import GoalMetadata
+from .history_reader import HistoryReader
+from .history_writer import StreamingHistoryWriter
+from .object_metadata import ObjectMetadata
+from .step_metadata import StepMetadata
+
+
+class HistoryReplayController(object):
+    """Replays a scene history file through the public API of the
+    Controller, without Unity: start_scene and step return the recorded
+    StepMetadata of each step in turn (ignoring the given actions), so
+    scoring, plotting and agent-side analytics can re-run on old runs.
+
+    History files do not keep images or object lists. If given the
+    directory of a dataset exported during the same run (see
+    DatasetWriter), the replayed output includes the recorded images,
+    depth maps, object masks and object metadata.
+
+    The first call opens the history file and builds an index of its
+    steps; JSON lines history files are then read one step at a time by
+    byte offset, so seek to any step is cheap."""
+
+    # How StreamingHistoryWriter starts each step record
+    STEP_RECORD_PREFIX = b'{"type": "step", "step": {"step": '
+
+    # The StepMetadata fields kept in history steps
+    OUTPUT_FIELDS = frozenset(dict(StepMetadata()))
+
+    def __init__(self, history_path, dataset_directory=None):
+        self.history_path = str(history_path)
+        self.dataset_directory = dataset_directory
+        self._info = None
+        self._score = {}
+        self._steps = None
+        self._step_offsets = None
+        self._file = None
+        self._frames = None
+        self._dataset = None
+        self._step_number = 0
+        self._predictions = {}
+        self._end_score = None
+
+    def _open(self) -> None:
+        if self._info is not None:
+            return
+        if not HistoryReader.is_streaming(self.history_path):
+            history = HistoryReader.read(self.history_path)
+            self._info = history.get('info') or {}
+            self._score = history.get('score') or {}
+            self._steps = {
+                step['step']: step for step in history.get('steps') or []
+            }
+        else:
+            self._index_streaming_file()
+        if self.dataset_directory:
+            self._index_dataset()
+
+    def _index_streaming_file(self) -> None:
+        if Compression.strip_extension(self.history_path) == \
+                self.history_path:
+            self._file = open(self.history_path, 'rb')
+        else:
+            self._file = io.BytesIO(Compression.read_bytes(self.history_path))
+        self._info = {}
+        self._step_offsets = {}
+        offset = 0
+        for line in self._file:
+            if not line.endswith(b'\n'):
+                # Partial last line of an interrupted scene
+                break
+            # Only parse the small info and score records (and any step
+            # record not formatted like the history writer's) up front
+            if line.startswith(self.STEP_RECORD_PREFIX):
+                step_number = self._step_number_of(line)
+                self._step_offsets[step_number] = (offset, len(line))
+            else:
+                record = json.loads(line)
+                if record['type'] == StreamingHistoryWriter.RECORD_INFO:
+                    self._info = record['info']
+                elif record['type'] == StreamingHistoryWriter.RECORD_SCORE:
+                    self._score = record['score']
+                elif record['type'] == StreamingHistoryWriter.RECORD_STEP:
+                    # Written by something other than the history writer
+                    self._step_offsets[record['step']['step']] = (
+                        offset, len(line))
+            offset += len(line)
+
+    def _step_number_of(self, line: bytes) -> int:
+        number = line[len(self.STEP_RECORD_PREFIX):].split(b',', 1)[0]
+        try:
+            return int(number)
+        except ValueError:
+            return json.loads(line)['step']['step']
+
+    def _index_dataset(self) -> None:
+        self._dataset = DatasetReader(self.dataset_directory)
+        scene_name = self._info.get('name')
+        self._frames = {}
+        for index, record in enumerate(self._dataset.iter_records()):
+            if record['scene'].replace('.json', '') != scene_name:
+                continue
+            # With many runs of this scene, keep the frames of the last
+            if record['substep'] == 0:
+                self._frames[record['step']] = []
+            self._frames.setdefault(record['step'], []).append(index)
+
+    @property
+    def info(self) -> Dict:
+        """The history info (scene name, team, metadata tier...)."""
+        self._open()
+        return self._info
+
+    @property
+    def score(self) -> Dict:
+        """The recorded end score of the scene."""
+        self._open()
+        return self._score
+
+    @property
+    def step_count(self) -> int:
+        self._open()
+        return len(self._step_offsets if self._steps is None
+                   else self._steps)
+
+    def get_step(self, step_number: int) -> Optional[Dict]:
+        """Return the recorded history step dict (with the action, params,
+        output, classification, confidence...) of the given step number,
+        or None if there is none."""
+        self._open()
+        if self._steps is not None:
+            return self._steps.get(step_number)
+        if step_number not in self._step_offsets:
+            return None
+        offset, length = self._step_offsets[step_number]
+        self._file.seek(offset)
+        return json.loads(self._file.read(length))['step']
+
+    def _step_output(self, step_number: int) -> StepMetadata:
+        step = self.get_step(step_number)
+        output = {
+            key: value
+            for key, value in ((step or {}).get('output') or {}).items()
+            if key in self.OUTPUT_FIELDS
+        }
+        output['step_number'] = step_number
+        goal = output.pop('goal', None)
+        output['goal'] = GoalMetadata(**goal) if goal else GoalMetadata()
+        output['structural_object_list'] = None
+        output['object_list'] = None
+
+        frame_list = [self._dataset[index]
+                      for index in (self._frames or {}).get(step_number, [])]
+        if frame_list:
+            record = frame_list[0]['record']
+            output['object_list'] = [
+                ObjectMetadata(**obj) for obj in record['objects']]
+            output['image_list'] = [
+                PIL.Image.fromarray(frame['rgb']) for frame in frame_list]
+            output['depth_map_list'] = [
+                frame['depth'] for frame in frame_list if 'depth' in frame]
+            output['object_mask_list'] = [
+                PIL.Image.fromarray(frame['mask'])
+                for frame in frame_list if 'mask' in frame]
+            if step is None:
+                output['reward'] = record['reward']
+                output['return_status'] = record['return_status']
+                output['position'] = record['position']
+                output['rotation'] = record['rotation']
+                output['head_tilt'] = record['head_tilt']
+        return StepMetadata(**output)
+
+    def start_scene(self, config_data=None) -> StepMetadata:
+        """
+        Restarts the replay and returns the output of step 0. The history
+        does not record the output of the "Initialize" action, so it only
+        has any images and objects from the dataset.
+
+        Parameters
+        ----------
+        config_data : dict, optional
+            Ignored; the scene is always the recorded scene.
+
+        Returns
+        -------
+        StepMetadata
+            The recorded output data object from the start of the scene.
+        """
+        self._open()
+        self._step_number = 0
+        self._predictions = {}
+        self._end_score = None
+        return self._step_output(0)
+
+    def step(self, action: str = None, **kwargs) -> Optional[StepMetadata]:
+        """
+        Returns the recorded output of the next step.
+
+        Parameters
+        ----------
+        action : string, optional
+            Ignored, but warns if it differs from the recorded action.
+        **kwargs
+            Ignored.
+
+        Returns
+        -------
+        StepMetadata
+            The recorded output data object of the next step. Returns None
+            after the last recorded step.
+        """
+        return self.seek(self._step_number + 1, action)
+
+    def seek(self, step_number: int, action: str = None
+             ) -> Optional[StepMetadata]:
+        """
+        Jumps to the given step and returns its recorded output; the next
+        call to step returns the step after it.
+
+        Parameters
+        ----------
+        step_number : int
+            The step number (0 is the start of the scene).
+
+        Returns
+        -------
+        StepMetadata
+            The recorded output data object of the step, or None if the
+            history has no such step.
+        """
+        self._open()
+        if step_number == 0:
+            self._step_number = 0
+            return self._step_output(0)
+        step = self.get_step(step_number)
+        if step is None:
+            return None
+        if action is not None and action != step.get('action'):
+            print(
+                f"MCS Warning: The given action '{action}' differs from the "
+                f"recorded action '{step.get('action')}' of step "
+                f"{step_number}. Replaying the recorded step.")
+        self._step_number = step_number
+        return self._step_output(step_number)
+
+    def make_step_prediction(self, choice: str = None,
+                             confidence: float = None,
+                             violations_xy_list: List[Dict[str,
+                                                           float]] = None,
+                             heatmap_img: PIL.Image.Image = None,
+                             internal_state: object = None) -> None:
+        """Record a new prediction for the current step, to compare with the
+        recorded one (see predictions)."""
+        self._predictions[self._step_number] = {
+            'classification': choice,
+            'confidence': confidence,
+            'violations_xy_list': violations_xy_list,
+            'internal_state': internal_state
+        }
+
+    @property
+    def predictions(self) -> Dict[int, Dict]:
+        """The predictions made during this replay, by step number."""
+        return self._predictions
+
+    def end_scene(self, choice=None, confidence=1.0, wait=True):
+        """Record the new end score of the replay (see end_score); nothing
+        is written."""
+        self._end_score = {
+            'classification': choice,
+            'confidence': confidence
+        }
+
+    @property
+    def end_score(self) -> Optional[Dict]:
+        """The end score given to end_scene during this replay."""
+        return self._end_score
+
+    def wait_for_finalization(self) -> None:
+        pass
+
+    def get_plot_event(self, step_number: int = None) -> SimpleNamespace:
+        """Return a stand-in for the AI2-THOR event of the given (by default,
+        the current) step that TopDownPlotter.plot accepts: the agent, plus
+        the objects if replaying with a dataset."""
+        output = self._step_output(
+            self._step_number if step_number is None else step_number)
+        return SimpleNamespace(metadata={
+            'agent': {
+                'position': output.position or None,
+                'rotation': {'y': output.rotation}
+            },
+            'objects': [{
+                'objectId': obj.uuid,
+                'isPickedUp': obj.held,
+                'visibleInCamera': obj.visible,
+                'position': obj.position,
+                'objectBounds': {
+                    'objectBoundsCorners': obj.dimensions or None
+                }
+            } for obj in output.object_list]
+        })
+
+    def stop_simulation(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        self._info = None
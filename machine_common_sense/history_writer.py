@@ -1,3 +1,4 @@
+from .compression import Compression
 from .util import Util
 from .scene_history import SceneHistory
 from typing import Dict
@@ -9,9 +10,13 @@ from time import perf_counter
 class HistoryWriter(object):
 
     HISTORY_DIRECTORY = "SCENE_HISTORY"
+    EXTENSION = ".json"
+    MIMETYPE = "application/json"
 
-    def __init__(self, scene_config_data=None, hist_info={}, timestamp=''):
+    def __init__(self, scene_config_data=None, hist_info={}, timestamp='',
+                 database=None, compression=None):
         self.info_obj = hist_info
+        self.compression = compression or Compression()
         self.current_steps = []
         self.end_score = {}
         self.scene_history_file = None
@@ -34,27 +39,49 @@ class HistoryWriter(object):
                 not scene_config_data['screenshot']):
             self.scene_history_file = os.path.join(
                 self.HISTORY_DIRECTORY, scene_config_data['name'].replace(
-                    '.json', '') + "-" + timestamp + ".json")
+                    '.json', '') + "-" + timestamp + self.EXTENSION +
+                self._file_compression_extension())
 
         self.info_obj['name'] = scene_config_data['name'].replace(
             '.json', '')
         self.info_obj['timestamp'] = timestamp
 
+        # Optional HistoryDatabase that also receives the scene history
+        self.database = database
+        self.database_scene_id = None
+        if self.database is not None:
+            self.database_scene_id = self.database.begin_scene(
+                self.info_obj,
+                os.path.abspath(self.scene_history_file)
+                if self.scene_history_file else None
+            )
+
+    def _file_compression_extension(self):
+        return self.compression.extension
+
     def write_file(self):
         if self.scene_history_file:
+            if self.compression.enabled:
+                self.compression.write_to(
+                    self.scene_history_file,
+                    json.dumps(self.history_obj,
+                               default=Util.json_default).encode('utf-8'))
+                return
             with open(self.scene_history_file, "a+") as history_file:
-                history_file.write(json.dumps(self.history_obj))
+                history_file.write(json.dumps(self.history_obj,
+                                              default=Util.json_default))
 
     def filter_history_output(
             self,
             history: SceneHistory) -> SceneHistory:
         """ filter out images from the step history data and
-            object lists and action list """
-        targets = ['target', 'target_1', 'target2']
+            object lists, occupancy grid and action list """
+        targets = ['target', 'target_1', 'target_2']
         if history.output:
             history.output.action_list = None
             history.output.object_list = None
             history.output.structural_object_list = None
+            history.output.occupancy_grid = None
             for target in targets:
                 if target in history.output.goal.metadata.keys():
                     if history.output.goal.metadata[target].get(
@@ -74,8 +101,14 @@ class HistoryWriter(object):
             step_obj.delta_time_millis = current_time - \
                 self.last_step_time_millis
             self.last_step_time_millis = current_time
-            self.current_steps.append(
-                dict(self.filter_history_output(step_obj)))
+            step = dict(self.filter_history_output(step_obj))
+            self.write_step(step)
+            if self.database is not None:
+                self.database.add_step(self.database_scene_id, step)
+
+    def write_step(self, step: Dict):
+        """Keep the filtered step dict until the history file is written"""
+        self.current_steps.append(step)
 
     def write_history_file(self, classification, confidence):
         """ Add the end score obj, create the object
@@ -88,6 +121,16 @@ class HistoryWriter(object):
         self.history_obj["score"] = self.end_score
 
         self.write_file()
+        self.write_database_score()
+
+    def write_database_score(self):
+        if self.database is not None:
+            self.database.end_scene(
+                self.database_scene_id,
+                self.end_score,
+                os.path.abspath(self.scene_history_file)
+                if self.scene_history_file else None
+            )
 
     def check_file_written(self):
         """ Will check to see if the file has been written, if not,
@@ -97,3 +140,82 @@ class HistoryWriter(object):
 
     def __str__(self):
         return Util.class_to_str(self)
+
+
+class StreamingHistoryWriter(HistoryWriter):
+    """Writes the scene history as JSON lines while the scene runs: an
+    "info" header record, one "step" record per step, and a "score" trailer
+    record. Steps are not kept in memory, and a crash loses at most the
+    steps since the last sync. Use HistoryReader to load the file as the
+    usual history document."""
+
+    EXTENSION = ".jsonl"
+    MIMETYPE = "application/x-ndjson"
+
+    # Sync the file to disk after this many step records.
+    FSYNC_STEP_INTERVAL = 20
+
+    RECORD_INFO = "info"
+    RECORD_STEP = "step"
+    RECORD_SCORE = "score"
+
+    def __init__(self, scene_config_data=None, hist_info={}, timestamp='',
+                 database=None, compression=None):
+        super().__init__(scene_config_data, hist_info, timestamp, database,
+                         compression)
+        self.step_count = 0
+        self._history_file = None
+        self._unsynced_steps = 0
+        self._score_written = False
+        if self.scene_history_file:
+            self._history_file = open(self.scene_history_file, "w")
+            self._write_record(self.RECORD_INFO, self.info_obj)
+
+    def _file_compression_extension(self):
+        # Written uncompressed during the scene, then compressed at the end
+        return ''
+
+    def _write_record(self, record_type: str, data: Dict):
+        self._history_file.write(json.dumps(
+            {"type": record_type, record_type: data},
+            default=Util.json_default) + "\n")
+        # Hand each record to the OS so it survives a process crash.
+        self._history_file.flush()
+
+    def _sync(self):
+        os.fsync(self._history_file.fileno())
+        self._unsynced_steps = 0
+
+    def write_step(self, step: Dict):
+        """Append the filtered step dict to the history file"""
+        self.step_count += 1
+        if self._history_file is None:
+            return
+        self._write_record(self.RECORD_STEP, step)
+        self._unsynced_steps += 1
+        if self._unsynced_steps >= self.FSYNC_STEP_INTERVAL:
+            self._sync()
+
+    def write_history_file(self, classification, confidence):
+        """ Write the end score trailer and close the history file"""
+        self.end_score["classification"] = classification
+        self.end_score["confidence"] = str(confidence)
+
+        self.history_obj["info"] = self.info_obj
+        self.history_obj["score"] = self.end_score
+
+        if self._history_file is not None and not self._score_written:
+            self._write_record(self.RECORD_SCORE, self.end_score)
+            self._sync()
+            self._history_file.close()
+            self.scene_history_file = self.compression.compress_file(
+                self.scene_history_file)
+        if not self._score_written:
+            self.write_database_score()
+        self._score_written = True
+
+    def check_file_written(self):
+        """ Will check to see if the score has been written, if not,
+            it will write an empty score and close the file"""
+        if not self._score_written:
+            self.write_history_file("", "")
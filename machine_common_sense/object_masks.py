@@ -0,0 +1,215 @@
+from typing import Dict, List, Optional
+
+import numpy as np
+
+
+class ObjectMaskStats(object):
+    """
+    The pixels of each object in an object mask (instance segmentation)
+    image, from ObjectMaskTable.analyze. Each array has a row for each
+    object in the table, in the order of its uuids (objects not in the
+    mask have a pixel count of 0, and a bounding box and centroid of -1).
+
+    Attributes
+    ----------
+    uuids : list of string or None
+        The ID of each object, or None for colors not matched to an object.
+    colors : (K, 3) numpy array
+        The RGB color of each object.
+    labels : 2D numpy array
+        The index (into uuids) of the object at each pixel, or -1.
+    pixel_counts : (K,) numpy array
+        The number of pixels of each object.
+    bounding_boxes : (K, 4) numpy array
+        The minimum column (X) and row (Y) and maximum column and row of
+        the pixels of each object, inclusive.
+    centroids : (K, 2) numpy array
+        The mean column (X) and row (Y) of the pixels of each object.
+    """
+
+    def __init__(self, uuids: List[Optional[str]], colors: np.ndarray,
+                 labels: np.ndarray, pixel_counts: np.ndarray,
+                 bounding_boxes: np.ndarray, centroids: np.ndarray):
+        self.uuids = uuids
+        self.colors = colors
+        self.labels = labels
+        self.pixel_counts = pixel_counts
+        self.bounding_boxes = bounding_boxes
+        self.centroids = centroids
+        self._indexes = None
+
+    def __len__(self) -> int:
+        return len(self.uuids)
+
+    def visible(self) -> List[Optional[str]]:
+        """Return the IDs of the objects in the mask."""
+        return [self.uuids[index]
+                for index in np.flatnonzero(self.pixel_counts)]
+
+    def get(self, uuid: str) -> Optional[Dict]:
+        """Return the "pixel_count", "bounding_box" and "centroid" of the
+        object with the given ID, or None if it is not in the mask."""
+        if self._indexes is None:
+            self._indexes = {
+                object_id: index for index, object_id in enumerate(self.uuids)
+            }
+        index = self._indexes.get(uuid)
+        if index is None or not self.pixel_counts[index]:
+            return None
+        return {
+            'pixel_count': int(self.pixel_counts[index]),
+            'bounding_box': tuple(int(value) for value in
+                                  self.bounding_boxes[index]),
+            'centroid': tuple(float(value) for value in
+                              self.centroids[index])
+        }
+
+
+class ObjectMaskTable(object):
+    """
+    A lookup table of object mask colors (packed into 24-bit RGB integers)
+    to object indexes, to label each pixel of an object mask image with
+    its object in one vectorized pass. Build one per scene (object colors
+    do not change during a scene) and update it with any new objects.
+
+    Attributes
+    ----------
+    uuids : list of string
+        The ID of each object in the table, in index order.
+    """
+
+    def __init__(self, object_id_to_color: Dict = None):
+        """
+        Parameters
+        ----------
+        object_id_to_color : dict, optional
+            Each object ID to its color, as an (R, G, B) sequence or an
+            ObjectMetadata "color" dict.
+        """
+        self.uuids = []
+        self._colors = {}
+        self._packed = np.zeros(0, dtype=np.uint32)
+        self._order = np.zeros(0, dtype=np.intp)
+        if object_id_to_color:
+            self.update(object_id_to_color)
+
+    def __len__(self) -> int:
+        return len(self.uuids)
+
+    @staticmethod
+    def from_objects(object_list: List) -> 'ObjectMaskTable':
+        """Return a table of the colors of the given ObjectMetadata."""
+        return ObjectMaskTable({
+            obj.uuid: obj.color for obj in object_list
+            if obj.color and obj.color.get('r') is not None
+        })
+
+    @staticmethod
+    def pack(colors: np.ndarray) -> np.ndarray:
+        """Return each RGB color in the (..., 3) array, or image, as one
+        24-bit integer."""
+        colors = np.asarray(colors)
+        return ((colors[..., 0].astype(np.uint32) << 16) |
+                (colors[..., 1].astype(np.uint32) << 8) |
+                colors[..., 2].astype(np.uint32))
+
+    @staticmethod
+    def _pack_color(color) -> int:
+        if isinstance(color, dict):
+            color = (color['r'], color['g'], color['b'])
+        return (int(color[0]) << 16) | (int(color[1]) << 8) | int(color[2])
+
+    def update(self, object_id_to_color: Dict) -> bool:
+        """
+        Add any new objects (or changed colors) from the given object ID
+        to color dict, keeping the index of each object already in the
+        table. Return whether anything changed.
+        """
+        changed = False
+        for uuid, color in object_id_to_color.items():
+            packed = self._pack_color(color)
+            old = self._colors.get(uuid)
+            if old == packed:
+                continue
+            if old is None:
+                self.uuids.append(uuid)
+            self._colors[uuid] = packed
+            changed = True
+        if changed:
+            packed = np.array([self._colors[uuid] for uuid in self.uuids],
+                              dtype=np.uint32)
+            self._order = np.argsort(packed, kind='stable')
+            self._packed = packed[self._order]
+        return changed
+
+    def lookup(self, packed: np.ndarray) -> np.ndarray:
+        """Return the object index of each packed color in the array, or
+        -1 if no object in the table has the color."""
+        packed = np.asarray(packed, dtype=np.uint32)
+        if not len(self._packed):
+            return np.full(packed.shape, -1, dtype=np.intp)
+        position = np.searchsorted(self._packed, packed)
+        position = np.minimum(position, len(self._packed) - 1)
+        return np.where(self._packed[position] == packed,
+                        self._order[position], -1)
+
+    def label(self, mask) -> np.ndarray:
+        """Return the object index (or -1) of each pixel of the given
+        object mask image (a Pillow.Image or (H, W, 3) numpy array)."""
+        return self.lookup(self.pack(np.asarray(mask)[..., :3]))
+
+    def analyze(self, mask) -> ObjectMaskStats:
+        """
+        Return the pixel count, bounding box and centroid of each object in
+        the table in the given object mask image, from one pass over its
+        labels. If the table is empty (like at metadata tiers without
+        object IDs), return them for each distinct color in the mask.
+        """
+        mask = np.asarray(mask)[..., :3]
+        if not len(self.uuids):
+            unique, inverse = np.unique(self.pack(mask),
+                                        return_inverse=True)
+            labels = inverse.reshape(mask.shape[:2]).astype(np.intp)
+            uuids = [None] * len(unique)
+            colors = unique
+        else:
+            labels = self.label(mask)
+            uuids = list(self.uuids)
+            colors = np.array([self._colors[uuid] for uuid in self.uuids],
+                              dtype=np.uint32)
+        colors = np.stack([(colors >> 16) & 255, (colors >> 8) & 255,
+                           colors & 255], axis=1).astype(np.uint8)
+        return ObjectMaskStats(uuids, colors, labels,
+                               *self._label_stats(labels, len(uuids)))
+
+    @staticmethod
+    def _label_stats(labels: np.ndarray, count: int):
+        height, width = labels.shape
+        flat = labels.ravel()
+        pixels = np.flatnonzero(flat >= 0)
+        flat = flat[pixels]
+        rows = pixels // width
+        columns = pixels % width
+
+        pixel_counts = np.bincount(flat, minlength=count)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            centroids = np.stack([
+                np.bincount(flat, weights=columns, minlength=count),
+                np.bincount(flat, weights=rows, minlength=count)
+            ], axis=1) / pixel_counts[:, None]
+        centroids[pixel_counts == 0] = -1
+
+        # Which rows and columns have pixels of each object
+        in_rows = np.bincount(rows * count + flat, minlength=height * count
+                              ).reshape(height, count) > 0
+        in_columns = np.bincount(columns * count + flat,
+                                 minlength=width * count
+                                 ).reshape(width, count) > 0
+        bounding_boxes = np.stack([
+            np.argmax(in_columns, axis=0),
+            np.argmax(in_rows, axis=0),
+            width - 1 - np.argmax(in_columns[::-1], axis=0),
+            height - 1 - np.argmax(in_rows[::-1], axis=0)
+        ], axis=1)
+        bounding_boxes[pixel_counts == 0] = -1
+        return pixel_counts, bounding_boxes, centroids
@@ -0,0 +1,240 @@
+import math
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from .point_cloud import PointCloud
+from .reward_geometry import RewardGeometry
+
+
+class OccupancyGrid(object):
+    '''
+    A 2D occupancy grid of the floor of a scene, as an int8 NumPy array
+    (rows along Z, columns along X) of UNKNOWN, FREE and OCCUPIED cells,
+    updated incrementally:
+
+    - from object bounds (update_from_objects): each object that may
+      block the agent (its bounds reach between MIN_OBSTACLE_HEIGHT and
+      MAX_OBSTACLE_HEIGHT) marks the cells under its XZ hull, and only the
+      cells under objects that moved are redrawn; every other cell is free
+    - from depth maps (update_from_depth): the depth pixels are projected
+      back into the scene, and only the cells they land in (the current
+      view) are redrawn, as occupied if any point in the cell is at an
+      obstacle height, or else free if any point is on the floor
+    '''
+
+    UNKNOWN = -1
+    FREE = 0
+    OCCUPIED = 1
+
+    # Meters per cell
+    DEFAULT_RESOLUTION = 0.1
+
+    # Heights (in meters above the floor) of anything blocking the agent
+    MIN_OBSTACLE_HEIGHT = 0.05
+    MAX_OBSTACLE_HEIGHT = 1.0
+
+    # Structural objects that never block the agent
+    IGNORED_PREFIXES = ('ceiling', 'floor')
+
+    # Depth pixels to use along each image axis (1 is every pixel)
+    DEFAULT_DEPTH_STRIDE = 4
+
+    def __init__(self, bounds: Tuple[float, float, float, float],
+                 resolution: float = DEFAULT_RESOLUTION):
+        '''
+        Args:
+            bounds: (min x, min z, max x, max z) of the grid in meters
+            resolution: size of each (square) cell in meters
+        '''
+        self.resolution = resolution
+        self.min_x, self.min_z = bounds[0], bounds[1]
+        self.grid = np.full((
+            max(1, math.ceil((bounds[3] - bounds[1]) / resolution)),
+            max(1, math.ceil((bounds[2] - bounds[0]) / resolution))
+        ), self.UNKNOWN, dtype=np.int8)
+        # Per cell, the number of objects on it
+        self._counts = np.zeros(self.grid.shape, dtype=np.int16)
+        # Object ID to its (corners key, rows, columns) of occupied cells
+        self._footprints = {}
+        self._objects_known = False
+        # The cells seen in the last depth map
+        self._last_seen = None
+
+    @staticmethod
+    def for_room(room_dimensions: Dict = None,
+                 resolution: float = DEFAULT_RESOLUTION,
+                 margin: float = 1.0) -> 'OccupancyGrid':
+        '''Return a grid over a room centered on the origin, with the given
+        "x" and "z" roomDimensions (default 10 by 10) and a margin for the
+        walls.'''
+        room_dimensions = room_dimensions or {}
+        half_x = (room_dimensions.get('x') or 10) / 2.0 + margin
+        half_z = (room_dimensions.get('z') or 10) / 2.0 + margin
+        return OccupancyGrid((-half_x, -half_z, half_x, half_z), resolution)
+
+    @staticmethod
+    def egocentric(max_depth: float,
+                   resolution: float = DEFAULT_RESOLUTION
+                   ) -> 'OccupancyGrid':
+        '''Return a grid of what is in front of an agent at the origin
+        facing positive Z (rotation 0), up to the given depth: the agent
+        is at the middle of row 0.'''
+        return OccupancyGrid((-max_depth, 0.0, max_depth, max_depth),
+                             resolution)
+
+    @property
+    def shape(self) -> Tuple[int, int]:
+        return self.grid.shape
+
+    def cell_of(self, x: float, z: float) -> Tuple[int, int]:
+        '''Return the (row, column) of the cell at the XZ point.'''
+        return (int((z - self.min_z) // self.resolution),
+                int((x - self.min_x) // self.resolution))
+
+    def reset(self) -> None:
+        self.grid.fill(self.UNKNOWN)
+        self._counts.fill(0)
+        self._footprints.clear()
+        self._objects_known = False
+        self._last_seen = None
+
+    def _is_obstacle(self, uuid: str, corners: List[Dict],
+                     held: bool) -> bool:
+        if not corners or held or uuid.startswith(self.IGNORED_PREFIXES):
+            return False
+        heights = [corner['y'] for corner in corners]
+        return (max(heights) > self.MIN_OBSTACLE_HEIGHT and
+                min(heights) < self.MAX_OBSTACLE_HEIGHT)
+
+    def _rasterize(self, corners: List[Dict], key: tuple
+                   ) -> Tuple[np.ndarray, np.ndarray]:
+        hull = RewardGeometry.corners_hull(corners, key)
+        # Cells within half a cell of the hull, so thin walls still show
+        half = self.resolution / 2.0
+        row_start, column_start = self.cell_of(*(hull.min(axis=0) - half))
+        row_end, column_end = self.cell_of(*(hull.max(axis=0) + half))
+        row_start, column_start = max(row_start, 0), max(column_start, 0)
+        row_end = min(row_end, self.grid.shape[0] - 1)
+        column_end = min(column_end, self.grid.shape[1] - 1)
+        if row_start > row_end or column_start > column_end:
+            return np.zeros(0, np.intp), np.zeros(0, np.intp)
+        rows, columns = np.mgrid[row_start:row_end + 1,
+                                 column_start:column_end + 1]
+        rows = rows.ravel()
+        columns = columns.ravel()
+        centers = np.stack([
+            self.min_x + (columns + 0.5) * self.resolution,
+            self.min_z + (rows + 0.5) * self.resolution
+        ], axis=1)
+        inside = RewardGeometry.points_distance(centers, hull) <= half
+        return rows[inside], columns[inside]
+
+    def _update_footprints(self, object_list: List[Tuple[str, List, bool]]
+                           ) -> Tuple[List[str], List[np.ndarray]]:
+        changed = []
+        cell_list = []
+        seen = set()
+        width = self.grid.shape[1]
+        for uuid, corners, held in object_list:
+            if uuid in seen:
+                continue
+            seen.add(uuid)
+            obstacle = self._is_obstacle(uuid, corners, held)
+            key = RewardGeometry.corners_key(corners) if obstacle else None
+            old = self._footprints.get(uuid)
+            if (old[0] if old else None) == key:
+                continue
+            changed.append(uuid)
+            if old:
+                self._footprints.pop(uuid)
+                np.subtract.at(self._counts, (old[1], old[2]), 1)
+                cell_list.append(old[1] * width + old[2])
+            if obstacle:
+                rows, columns = self._rasterize(corners, key)
+                np.add.at(self._counts, (rows, columns), 1)
+                self._footprints[uuid] = (key, rows, columns)
+                cell_list.append(rows * width + columns)
+        for uuid in [uuid for uuid in self._footprints if uuid not in seen]:
+            _, rows, columns = self._footprints.pop(uuid)
+            np.subtract.at(self._counts, (rows, columns), 1)
+            cell_list.append(rows * width + columns)
+            changed.append(uuid)
+        return changed, cell_list
+
+    def update_from_objects(self, object_list: List,
+                            structural_object_list: List = None
+                            ) -> List[str]:
+        '''
+        Update the grid to the given (complete, like at the oracle metadata
+        tier) ObjectMetadata lists, redrawing only the cells under objects
+        that were added, moved or removed.
+
+        Returns:
+            list: the IDs of the changed objects
+        '''
+        changed, cell_list = self._update_footprints(
+            [(obj.uuid, obj.dimensions, obj.held)
+             for obj in (object_list or []) +
+             (structural_object_list or [])])
+        if not self._objects_known:
+            # Nothing under any object is free
+            self._objects_known = True
+            self.grid[...] = np.where(self._counts > 0, self.OCCUPIED,
+                                      self.FREE)
+        elif cell_list:
+            cells = np.unique(np.concatenate(cell_list))
+            self.grid.flat[cells] = np.where(
+                self._counts.flat[cells] > 0, self.OCCUPIED, self.FREE)
+        return changed
+
+    def update_from_depth(self, depth_map: np.ndarray, position: Dict,
+                          rotation: float, head_tilt: float,
+                          camera_height: float, field_of_view: float,
+                          max_depth: float = None,
+                          stride: int = DEFAULT_DEPTH_STRIDE,
+                          replace: bool = False) -> int:
+        '''
+        Update the cells seen in the given depth map.
+
+        Args:
+            depth_map: (height, width) depth in meters, like a depth map
+                from the StepMetadata depth_map_list
+            position: the agent's "x" and "z" position
+            rotation: the agent's rotation in degrees
+            head_tilt: the agent's head tilt in degrees (down is positive)
+            camera_height: the camera's height above the floor
+            field_of_view: the camera's vertical field of view in degrees
+            max_depth: skip pixels at this depth or more (nothing seen, like
+                the far clipping plane)
+            stride: use every stride-th pixel along each image axis
+            replace: forget (make unknown) the cells seen in the last
+                depth map but not this one, like for an egocentric grid
+
+        Returns:
+            int: the number of cells updated
+        '''
+        if not 0 < field_of_view < 180:
+            # No camera to project from
+            return 0
+        points = PointCloud.from_depth(
+            depth_map, field_of_view, stride, max_depth
+        ).to_world(position, rotation, head_tilt, camera_height).points
+        x, y, z = points[:, 0], points[:, 1], points[:, 2]
+
+        rows = np.floor((z - self.min_z) / self.resolution).astype(np.intp)
+        columns = np.floor((x - self.min_x) / self.resolution).astype(
+            np.intp)
+        inside = ((rows >= 0) & (rows < self.grid.shape[0]) &
+                  (columns >= 0) & (columns < self.grid.shape[1]) &
+                  (y < self.MAX_OBSTACLE_HEIGHT))
+        cells = rows[inside] * self.grid.shape[1] + columns[inside]
+        obstacle = y[inside] >= self.MIN_OBSTACLE_HEIGHT
+
+        seen = np.unique(cells)
+        if replace and self._last_seen is not None:
+            self.grid.flat[self._last_seen] = self.UNKNOWN
+        self.grid.flat[seen] = self.FREE
+        self.grid.flat[np.unique(cells[obstacle])] = self.OCCUPIED
+        self._last_seen = seen
+        return len(seen)
@@ -1,7 +1,7 @@
 import io
 import math
-import PIL
-import ai2thor
+import PIL.Image
+import ai2thor.server
 import matplotlib
 matplotlib.use('Agg')
 import matplotlib.pyplot as plt
@@ -0,0 +1,221 @@
+import math
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from .object_masks import ObjectMaskTable
+from .step_metadata import StepMetadata
+
+
+class PointCloud(object):
+    """
+    The points seen in a depth map, in camera space (X right, Y up and Z
+    forward, in meters from the camera) or world space (the scene's X, Y
+    and Z), from one vectorized pass over the whole (or decimated) depth
+    map.
+
+    Attributes
+    ----------
+    points : (N, 3) numpy array
+        The X, Y and Z of each point.
+    rows : (N,) numpy array
+        The image row of each point.
+    columns : (N,) numpy array
+        The image column of each point.
+    colors : (N, 3) numpy array or None
+        The object mask (segmentation) color of each point, if given.
+    uuids : (N,) numpy array or None
+        The ID of the object at each point (None if no object in the given
+        object list has its color), if given the object mask and objects.
+    """
+
+    # Pixel ray grids by image size, field of view and stride
+    _ray_cache = {}
+
+    def __init__(self, points: np.ndarray, rows: np.ndarray,
+                 columns: np.ndarray, colors: np.ndarray = None,
+                 uuids: np.ndarray = None):
+        self.points = points
+        self.rows = rows
+        self.columns = columns
+        self.colors = colors
+        self.uuids = uuids
+
+    def __len__(self) -> int:
+        return len(self.points)
+
+    @staticmethod
+    def camera_rays(height: int, width: int, field_of_view: float,
+                    stride: int = 1) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Return the X (right) and Y (up) camera space offsets, at a depth of
+        1, of the centers of every stride-th pixel (starting from the
+        middle of the first stride) of an image of the given size and
+        vertical field of view in degrees. Cached by size; do not modify.
+        """
+        key = (height, width, field_of_view, stride)
+        rays = PointCloud._ray_cache.get(key)
+        if rays is None:
+            focal = (height / 2.0) / math.tan(math.radians(field_of_view) / 2)
+            columns = np.arange(stride // 2, width, stride)
+            rows = np.arange(stride // 2, height, stride)
+            ray_x = (columns + 0.5 - width / 2.0) / focal
+            ray_y = (height / 2.0 - rows - 0.5) / focal
+            shape = (len(rows), len(columns))
+            rays = (np.broadcast_to(ray_x, shape),
+                    np.broadcast_to(ray_y[:, None], shape))
+            PointCloud._ray_cache[key] = rays
+        return rays
+
+    @staticmethod
+    def from_depth(depth_map: np.ndarray, field_of_view: float,
+                   stride: int = 1, max_depth: float = None,
+                   object_mask: np.ndarray = None,
+                   object_list: List = None) -> 'PointCloud':
+        """
+        Return the camera space point cloud of the given depth map.
+
+        Parameters
+        ----------
+        depth_map : 2D numpy array
+            The depth of each pixel in meters, like a depth map from the
+            StepMetadata's "depth_map_list".
+        field_of_view : float
+            The camera's vertical field of view in degrees.
+        stride : int, optional
+            Use every stride-th pixel along each image axis (default 1).
+        max_depth : float, optional
+            Skip pixels at this depth or more (nothing seen there, like at
+            the far clipping plane).
+        object_mask : PIL.Image or 3D numpy array, optional
+            The object mask image, to give the color of each point.
+        object_list : list of ObjectMetadata, optional
+            The objects, to give the object ID of each point by its color.
+
+        Returns
+        -------
+        PointCloud
+        """
+        depth_map = np.asarray(depth_map)
+        ray_x, ray_y = PointCloud.camera_rays(
+            depth_map.shape[0], depth_map.shape[1], field_of_view, stride)
+        start = stride // 2
+        depth = depth_map[start::stride, start::stride]
+        valid = depth > 0
+        if max_depth:
+            valid &= depth < max_depth * 0.999
+        rows, columns = np.nonzero(valid)
+        depth = depth[valid]
+        points = np.stack([ray_x[valid] * depth, ray_y[valid] * depth,
+                           depth], axis=1)
+        rows = rows * stride + start
+        columns = columns * stride + start
+
+        colors = None
+        uuids = None
+        if object_mask is not None:
+            colors = np.asarray(object_mask)[rows, columns, :3]
+            if object_list is not None:
+                uuids = PointCloud.color_uuids(colors, object_list)
+        return PointCloud(points, rows, columns, colors, uuids)
+
+    @staticmethod
+    def color_uuids(colors: np.ndarray, object_list: List) -> np.ndarray:
+        """Return the ID of the object with each of the (N, 3) RGB colors
+        (from the "color" of each ObjectMetadata), or None."""
+        table = ObjectMaskTable.from_objects(object_list)
+        uuids = np.array(table.uuids + [None], dtype=object)
+        # Unmatched colors (-1) get the None at the end
+        return uuids[table.lookup(ObjectMaskTable.pack(colors))]
+
+    def to_world(self, position: Dict, rotation: float, head_tilt: float,
+                 camera_height: float) -> 'PointCloud':
+        """
+        Return this camera space point cloud in world space.
+
+        Parameters
+        ----------
+        position : dict
+            The agent's "x" and "z" position.
+        rotation : float
+            The agent's rotation in degrees.
+        head_tilt : float
+            The agent's head tilt in degrees (down is positive).
+        camera_height : float
+            The camera's height (its Y position).
+
+        Returns
+        -------
+        PointCloud
+        """
+        camera_x = self.points[:, 0]
+        camera_y = self.points[:, 1]
+        depth = self.points[:, 2]
+        # Tilt the head down, then turn to the agent's rotation
+        tilt = math.radians(head_tilt)
+        up = camera_y * math.cos(tilt) - depth * math.sin(tilt)
+        forward = camera_y * math.sin(tilt) + depth * math.cos(tilt)
+        turn = math.radians(rotation)
+        sin_turn = math.sin(turn)
+        cos_turn = math.cos(turn)
+        points = np.stack([
+            position['x'] + camera_x * cos_turn + forward * sin_turn,
+            camera_height + up,
+            position['z'] - camera_x * sin_turn + forward * cos_turn
+        ], axis=1)
+        return PointCloud(points, self.rows, self.columns, self.colors,
+                          self.uuids)
+
+    @staticmethod
+    def from_step(step_metadata: StepMetadata, index: int = -1,
+                  world: bool = True, stride: int = 1,
+                  position: Dict = None, rotation: float = None,
+                  with_objects: bool = True) -> 'PointCloud':
+        """
+        Return the point cloud of a depth map of the given step output.
+
+        Parameters
+        ----------
+        step_metadata : StepMetadata
+            The step output, with depth maps (metadata tier level1 or more).
+        index : int, optional
+            Which depth map in the "depth_map_list" (default the last).
+        world : bool, optional
+            Whether to return world space points (default) or camera space
+            points. World space needs the agent's position and rotation,
+            from the step output (metadata tier oracle) or given.
+        stride : int, optional
+            Use every stride-th pixel along each image axis (default 1).
+        position : dict, optional
+            The agent's position, instead of the step output's.
+        rotation : float, optional
+            The agent's rotation, instead of the step output's.
+        with_objects : bool, optional
+            Whether to give the color and object ID of each point from the
+            "object_mask_list" and "object_list", if any (default True).
+
+        Returns
+        -------
+        PointCloud
+        """
+        object_mask = None
+        if with_objects and step_metadata.object_mask_list:
+            object_mask = step_metadata.object_mask_list[index]
+        cloud = PointCloud.from_depth(
+            step_metadata.depth_map_list[index],
+            step_metadata.camera_field_of_view,
+            stride=stride,
+            max_depth=step_metadata.camera_clipping_planes[1],
+            object_mask=object_mask,
+            object_list=step_metadata.object_list if object_mask is not None
+            else None)
+        if not world:
+            return cloud
+        position = position or step_metadata.position
+        rotation = step_metadata.rotation if rotation is None else rotation
+        if not position or rotation is None:
+            raise ValueError(
+                'World space points need the position and rotation, which '
+                'are not in the step output at this metadata tier')
+        return cloud.to_world(position, rotation, step_metadata.head_tilt,
+                              step_metadata.camera_height)
@@ -3,8 +3,10 @@ import pathlib
 import threading
 import queue
 
+from typing import Union
+
 import cv2
-import PIL
+import PIL.Image
 import numpy as np
 
 
@@ -53,22 +55,43 @@ class VideoRecorder():
         self.thread.daemon = True
         self.thread.start()
 
-    def add(self, frame: PIL.Image.Image) -> None:
+    def add(self, frame: Union[np.ndarray, PIL.Image.Image]) -> None:
         '''Adds the video frame to the queue.
 
         Requires that the start function was called
-        otherwise the frame is ignored.
+        otherwise the frame is ignored. The frame is queued as-is; the color
+        conversion for opencv happens on the writer thread.
 
         Args:
-            frame (np.ndarray): RGB video frame to be written
+            frame (np.ndarray or PIL.Image.Image): RGB, RGBA, or
+                single-channel (depth / mask) video frame to be written
 
         Returns:
             None
         '''
         if self.active:
-            # convert BGR PIL image to RGB for opencv
-            cv_frame = np.array(frame.convert('RGB'))[:, :, ::-1]
-            self.frame_queue.put(cv_frame)
+            if isinstance(frame, PIL.Image.Image):
+                if frame.mode not in ('RGB', 'RGBA', 'L'):
+                    frame = frame.convert('RGB')
+                frame = np.asarray(frame)
+            self.frame_queue.put(frame)
+
+    @staticmethod
+    def _to_bgr(frame: np.ndarray) -> np.ndarray:
+        '''Convert an RGB, RGBA, or single-channel frame to opencv BGR in a
+        single pass.'''
+        if frame.dtype != np.uint8:
+            frame = frame.astype(np.uint8)
+        if frame.ndim == 2 or frame.shape[2] == 1:
+            return cv2.cvtColor(frame, cv2.COLOR_GRAY2BGR)
+        if frame.shape[2] == 4:
+            return cv2.cvtColor(frame, cv2.COLOR_RGBA2BGR)
+        return cv2.cvtColor(frame, cv2.COLOR_RGB2BGR)
+
+    def _write_frame(self, frame: np.ndarray) -> None:
+        '''Convert and write a single frame to the video file.'''
+        self.writer.write(self._to_bgr(frame))
+        self._frames_written = self._frames_written + 1
 
     def _write(self) -> None:
         '''Loop forever waiting for frames to enter the queue.'''
@@ -76,17 +99,14 @@ class VideoRecorder():
             if not self.active:
                 return
             if not self.frame_queue.empty():
-                frame = self.frame_queue.get()
-                self.writer.write(frame)
-                self._frames_written = self._frames_written + 1
+                self._write_frame(self.frame_queue.get())
             else:
                 time.sleep(self.timeout)
 
     def flush(self) -> None:
         '''Write the remaining video frames in the the queue.'''
         while not self.frame_queue.empty():
-            frame = self.frame_queue.get()
-            self.writer.write(frame)
+            self._write_frame(self.frame_queue.get())
 
     def finish(self) -> None:
         '''Deactivate the recorder so that it does not accept more frames.
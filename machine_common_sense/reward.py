@@ -1,9 +1,12 @@
-from typing import List, Dict
-
-from shapely import geometry
+from typing import TYPE_CHECKING, List, Dict
 
 from .goal_metadata import GoalMetadata, GoalCategory
-from .controller import MAX_REACH_DISTANCE, MOVE_DISTANCE
+from .agent_limits import MAX_REACH_DISTANCE, MOVE_DISTANCE
+from .reward_geometry import RewardGeometry
+from .spatial_index import SpatialIndex
+
+if TYPE_CHECKING:
+    from shapely import geometry
 
 GOAL_ACHIEVED = 1
 GOAL_NOT_ACHIEVED = 0
@@ -12,12 +15,20 @@ STEP_PENALTY = 0.001
 
 class Reward(object):
     '''Reward utility class'''
+
+    # Goal categories with rewards from the object hulls
+    GEOMETRY_CATEGORIES = (
+        GoalCategory.TRANSFERRAL.value,
+        GoalCategory.TRAVERSAL.value
+    )
+
     @staticmethod
     def __get_object_from_list(objects: List[Dict],
                                target_id: str) -> Dict:
         '''
-        Finds an object in a list. Uses a generator to return the first item
-        or defaults to None if the target isn't found.
+        Finds an object in a list by its objectId, using an index of the
+        list built once per step. Returns the first match or defaults to
+        None if the target isn't found.
 
         Args:
             objects: list of object dictionaries
@@ -26,13 +37,28 @@ class Reward(object):
         Returns:
             target: object dictionary if found or None
         '''
-        return next((o for o in objects if o['objectId'] == target_id), None)
+        return RewardGeometry.get_object(objects, target_id)
+
+    @staticmethod
+    def __get_object_hull(goal_object: Dict,
+                          spatial_index: SpatialIndex = None):
+        '''
+        Returns the XZ hull of the object's bounds, from the spatial index
+        (kept up to date with the same objects) if given.
+        '''
+        if spatial_index is not None:
+            hull = spatial_index.hull(goal_object['objectId'])
+            if hull is not None:
+                return hull
+        return RewardGeometry.xz_hull(goal_object)
 
     @staticmethod
     def _convert_object_to_planar_polygon(
-            goal_object: Dict) -> geometry.Polygon:
+            goal_object: Dict) -> 'geometry.Polygon':
         '''
-        Project goal object bounds (x,y,z) to an XZ planar polygon.
+        Project goal object bounds (x,y,z) to an XZ planar polygon. The
+        reward calculations use the cached NumPy hulls of RewardGeometry
+        instead; this shapely version is the reference for its tests.
 
         Args:
             goal_object: dict
@@ -40,6 +66,8 @@ class Reward(object):
         Returns:
             polygons: shapely.geometry.Polygon
         '''
+        from shapely import geometry
+
         bbox3d = goal_object['objectBounds']['objectBoundsCorners']
         # project to XZ plane
         xz_pts = [(pt['x'], pt['z']) for pt in bbox3d]
@@ -51,7 +79,8 @@ class Reward(object):
     def _calc_retrieval_reward(
             goal: GoalMetadata,
             objects: Dict,
-            agent: Dict) -> int:
+            agent: Dict,
+            spatial_index: SpatialIndex = None) -> int:
         '''
         Calculate the reward for the retrieval goal.
 
@@ -61,6 +90,7 @@ class Reward(object):
             goal: GoalMetadata
             objects: Dict
             agent: Dict
+            spatial_index: SpatialIndex of the objects, optional
 
         Returns:
             int: 1 for goal achieved, 0 otherwise
@@ -78,7 +108,8 @@ class Reward(object):
     def _calc_traversal_reward(
             goal: GoalMetadata,
             objects: Dict,
-            agent: Dict) -> int:
+            agent: Dict,
+            spatial_index: SpatialIndex = None) -> int:
         '''
         Calculate the reward for the traversal goal.
 
@@ -89,6 +120,7 @@ class Reward(object):
             goal: GoalMetadata
             objects: Dict
             agent: Dict
+            spatial_index: SpatialIndex of the objects, optional
 
         Returns:
             int: 1 for goal achieved, 0 otherwise
@@ -99,12 +131,12 @@ class Reward(object):
         goal_object = Reward.__get_object_from_list(objects, goal_id)
 
         agent_pos = agent['position']
-        agent_xz = geometry.Point(agent_pos['x'], agent_pos['z'])
+        agent_xz = (agent_pos['x'], agent_pos['z'])
 
         if goal_object is not None:
-            goal_polygon = Reward._convert_object_to_planar_polygon(
-                goal_object)
-            polygonal_distance = agent_xz.distance(goal_polygon)
+            goal_polygon = Reward.__get_object_hull(goal_object, spatial_index)
+            polygonal_distance = RewardGeometry.point_distance(
+                agent_xz, goal_polygon)
             reward = int(polygonal_distance <= MAX_REACH_DISTANCE)
 
         return reward
@@ -113,7 +145,8 @@ class Reward(object):
     def _calc_transferral_reward(
             goal: GoalMetadata,
             objects: Dict,
-            agent: Dict) -> int:
+            agent: Dict,
+            spatial_index: SpatialIndex = None) -> int:
         '''
         Calculate the reward for the transferral goal.
 
@@ -124,6 +157,7 @@ class Reward(object):
             goal: GoalMetadata
             objects: Dict
             agent: Dict
+            spatial_index: SpatialIndex of the objects, optional
 
         Returns:
             int: 1 for goal achieved, 0 otherwise
@@ -153,19 +187,20 @@ class Reward(object):
         if action_object is None or action_object.get('isPickedUp', False):
             return GOAL_NOT_ACHIEVED
 
-        goal_polygon = Reward._convert_object_to_planar_polygon(
-            goal_object)
-        action_polygon = Reward._convert_object_to_planar_polygon(
-            action_object)
+        goal_polygon = Reward.__get_object_hull(goal_object, spatial_index)
+        action_polygon = Reward.__get_object_hull(
+            action_object, spatial_index)
 
         # actions are next_to or on_top_of (ie; action obj next to goal obj)
         if action == 'next to':
-            polygonal_distance = action_polygon.distance(goal_polygon)
+            polygonal_distance = RewardGeometry.polygon_distance(
+                action_polygon, goal_polygon)
             reward = int(polygonal_distance <= MOVE_DISTANCE)
         elif action == 'on top of':
             # check that the action object center intersects the goal object
             # bounds and the y dimension of the target is above the goal
-            action_obj_within_goal = action_polygon.intersects(goal_polygon)
+            action_obj_within_goal = RewardGeometry.intersects(
+                action_polygon, goal_polygon)
             action_obj_above_goal = (action_object['position']['y'] >
                                      goal_object['position']['y'])
             if action_obj_within_goal and action_obj_above_goal:
@@ -200,7 +235,8 @@ class Reward(object):
     def _calculate_default_reward(
             goal: GoalMetadata,
             objects: Dict,
-            agent: Dict) -> int:
+            agent: Dict,
+            spatial_index: SpatialIndex = None) -> int:
         '''Returns the default reward of 0; not achieved.'''
         return GOAL_NOT_ACHIEVED
 
@@ -209,7 +245,8 @@ class Reward(object):
             goal: GoalMetadata,
             objects: Dict,
             agent: Dict,
-            number_steps: int) -> float:
+            number_steps: int,
+            spatial_index: SpatialIndex = None) -> float:
         '''
         Determine if the agent achieved the objective/task/goal.
 
@@ -217,6 +254,8 @@ class Reward(object):
             goal: GoalMetadata
             objects: Dict
             agent: Dict
+            spatial_index: SpatialIndex updated with the same objects,
+                optional; if given, object hulls come from the index
 
         Returns:
             int: reward is 1 if goal achieved, 0 otherwise
@@ -234,7 +273,6 @@ class Reward(object):
         }
 
         current_score = switch.get(category,
-                                   Reward._calculate_default_reward)(goal,
-                                                                     objects,
-                                                                     agent)
+                                   Reward._calculate_default_reward)(
+            goal, objects, agent, spatial_index)
         return Reward._adjust_score_penalty(current_score, number_steps)
@@ -0,0 +1,301 @@
+import collections
+import threading
+from typing import Dict, List, Optional
+
+import numpy as np
+
+
+class RewardGeometry(object):
+    '''
+    NumPy geometry for reward calculations: an object ID index per step
+    (object list), XZ convex hulls cached by object bounds so that objects
+    that do not move are never hulled again, and vectorized point and
+    polygon distances. Hulls are (N, 2) arrays of XZ points in counter
+    clockwise order; degenerate bounds give a segment (2 points) or a
+    single point. Results match the shapely implementation in Reward.
+    '''
+
+    # Hulls to keep in the cache, least recently used first out
+    HULL_CACHE_SIZE = 4096
+
+    _hull_cache = collections.OrderedDict()
+    _edge_cache = {}
+    _index_objects = None
+    _index_length = 0
+    _index = {}
+    _lock = threading.Lock()
+
+    @staticmethod
+    def object_index(objects: List[Dict]) -> Dict[str, Dict]:
+        '''
+        Return a dict of the given objects by their objectId (the first
+        object with each ID), reusing the index of the last object list
+        while it is the same list.
+
+        Args:
+            objects: list of object dictionaries
+
+        Returns:
+            dict: objectId to object dictionary
+        '''
+        with RewardGeometry._lock:
+            if (RewardGeometry._index_objects is objects and
+                    RewardGeometry._index_length == len(objects)):
+                return RewardGeometry._index
+            index = {}
+            for obj in objects:
+                index.setdefault(obj['objectId'], obj)
+            RewardGeometry._index_objects = objects
+            RewardGeometry._index_length = len(objects)
+            RewardGeometry._index = index
+            return index
+
+    @staticmethod
+    def get_object(objects: List[Dict], target_id: str) -> Optional[Dict]:
+        '''
+        Return the object with the given objectId from the object list, or
+        None if it is not there.
+
+        Args:
+            objects: list of object dictionaries
+            target_id: str objectId of the object to find
+
+        Returns:
+            target: object dictionary if found or None
+        '''
+        obj = RewardGeometry.object_index(objects).get(target_id)
+        if obj is not None and obj.get('objectId') == target_id:
+            return obj
+        # The list may have changed in place since it was indexed
+        with RewardGeometry._lock:
+            RewardGeometry._index_objects = None
+        return RewardGeometry.object_index(objects).get(target_id)
+
+    @staticmethod
+    def convex_hull(points: np.ndarray) -> np.ndarray:
+        '''
+        Return the convex hull of the given (N, 2) points in counter
+        clockwise order, without collinear points (monotone chain).
+        '''
+        points = np.unique(np.asarray(points, dtype=np.float64), axis=0)
+        if len(points) <= 2:
+            return points
+
+        def half_hull(point_list):
+            hull = []
+            for point in point_list:
+                while len(hull) >= 2 and (
+                    (hull[-1][0] - hull[-2][0]) * (point[1] - hull[-2][1]) -
+                    (hull[-1][1] - hull[-2][1]) * (point[0] - hull[-2][0])
+                ) <= 0:
+                    hull.pop()
+                hull.append(point)
+            return hull
+
+        # np.unique sorts the points by x then z
+        point_list = points.tolist()
+        lower = half_hull(point_list)
+        upper = half_hull(reversed(point_list))
+        return np.array(lower[:-1] + upper[:-1])
+
+    @staticmethod
+    def xz_hull(obj: Dict) -> np.ndarray:
+        '''
+        Return the XZ convex hull of the given object's bounds corners,
+        from the cache if the object has the same bounds as before.
+
+        Args:
+            obj: object dictionary with objectBounds
+
+        Returns:
+            np.ndarray: (N, 2) hull points
+        '''
+        return RewardGeometry.corners_hull(
+            obj['objectBounds']['objectBoundsCorners'])
+
+    @staticmethod
+    def corners_key(corners: List[Dict]) -> tuple:
+        '''Return the hull cache key of the given bounds corners (dicts
+        with "x" and "z"): their flattened XZ values.'''
+        return tuple(value for corner in corners
+                     for value in (corner['x'], corner['z']))
+
+    @staticmethod
+    def corners_hull(corners: List[Dict], key: tuple = None) -> np.ndarray:
+        '''
+        Return the XZ convex hull of the given bounds corners (dicts with
+        "x" and "z"), from the cache if the same as before.
+
+        Args:
+            corners: list of corner dictionaries
+            key: the corners_key of the corners, if already known
+
+        Returns:
+            np.ndarray: (N, 2) hull points
+        '''
+        if key is None:
+            key = RewardGeometry.corners_key(corners)
+        cache = RewardGeometry._hull_cache
+        with RewardGeometry._lock:
+            entry = cache.get(key)
+            if entry is not None:
+                cache.move_to_end(key)
+                return entry[0]
+        hull = RewardGeometry.convex_hull(np.array(key).reshape(-1, 2))
+        hull.setflags(write=False)
+        with RewardGeometry._lock:
+            cache[key] = (hull, RewardGeometry._edge_data(hull))
+            RewardGeometry._edge_cache[id(hull)] = cache[key]
+            if len(cache) > RewardGeometry.HULL_CACHE_SIZE:
+                _, (old_hull, _) = cache.popitem(last=False)
+                RewardGeometry._edge_cache.pop(id(old_hull), None)
+        return hull
+
+    @staticmethod
+    def clear_cache() -> None:
+        with RewardGeometry._lock:
+            RewardGeometry._hull_cache.clear()
+            RewardGeometry._edge_cache.clear()
+            RewardGeometry._index_objects = None
+            RewardGeometry._index = {}
+
+    @staticmethod
+    def _edge_data(hull: np.ndarray) -> tuple:
+        # Edge start x and z, direction x and z, and squared length (1 for
+        # zero length edges, so that their nearest point is the start)
+        start_x = hull[:, 0]
+        start_z = hull[:, 1]
+        direction_x = np.roll(start_x, -1) - start_x
+        direction_z = np.roll(start_z, -1) - start_z
+        length_squared = direction_x * direction_x + direction_z * direction_z
+        length_squared[length_squared == 0] = 1.0
+        return start_x, start_z, direction_x, direction_z, length_squared
+
+    @staticmethod
+    def _edges(hull: np.ndarray) -> tuple:
+        entry = RewardGeometry._edge_cache.get(id(hull))
+        if entry is not None and entry[0] is hull:
+            return entry[1]
+        return RewardGeometry._edge_data(
+            np.asarray(hull, dtype=np.float64).reshape(-1, 2))
+
+    @staticmethod
+    def _edge_distances(points: np.ndarray, edges: tuple) -> np.ndarray:
+        start_x, start_z, direction_x, direction_z, length_squared = edges
+        offset_x = points[:, 0:1] - start_x
+        offset_z = points[:, 1:2] - start_z
+        t = (offset_x * direction_x + offset_z * direction_z) / length_squared
+        np.clip(t, 0.0, 1.0, out=t)
+        offset_x -= t * direction_x
+        offset_z -= t * direction_z
+        return np.sqrt(offset_x * offset_x + offset_z * offset_z)
+
+    @staticmethod
+    def _edge_cross(points: np.ndarray, edges: tuple) -> np.ndarray:
+        # (N, M) cross products of each edge with each point: positive if
+        # the point is left of (inside, for counter clockwise hulls) it
+        start_x, start_z, direction_x, direction_z, _ = edges
+        return (direction_x * (points[:, 1:2] - start_z) -
+                direction_z * (points[:, 0:1] - start_x))
+
+    @staticmethod
+    def points_to_segments(points: np.ndarray, start: np.ndarray,
+                           end: np.ndarray) -> np.ndarray:
+        '''
+        Return the (N, M) distances from each of the (N, 2) points to each
+        of the M segments from the (M, 2) start points to the (M, 2) end
+        points.
+        '''
+        start = np.asarray(start, dtype=np.float64)
+        end = np.asarray(end, dtype=np.float64)
+        direction_x = end[:, 0] - start[:, 0]
+        direction_z = end[:, 1] - start[:, 1]
+        length_squared = direction_x * direction_x + direction_z * direction_z
+        length_squared[length_squared == 0] = 1.0
+        return RewardGeometry._edge_distances(
+            np.asarray(points, dtype=np.float64).reshape(-1, 2),
+            (start[:, 0], start[:, 1], direction_x, direction_z,
+             length_squared))
+
+    @staticmethod
+    def points_in_polygon(points: np.ndarray, hull: np.ndarray) -> np.ndarray:
+        '''
+        Return whether each of the (N, 2) points is inside or on the
+        boundary of the convex hull (always False for degenerate hulls).
+        '''
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        if len(hull) < 3:
+            return np.zeros(len(points), dtype=bool)
+        return (RewardGeometry._edge_cross(
+            points, RewardGeometry._edges(hull)) >= 0).all(axis=1)
+
+    @staticmethod
+    def points_distance(points: np.ndarray, hull: np.ndarray) -> np.ndarray:
+        '''
+        Return the distances from each of the (N, 2) XZ points to the
+        convex hull (0 for points inside it).
+        '''
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        edges = RewardGeometry._edges(hull)
+        distances = RewardGeometry._edge_distances(points, edges).min(axis=1)
+        if len(hull) >= 3:
+            distances[(RewardGeometry._edge_cross(points, edges) >= 0).all(
+                axis=1)] = 0.0
+        return distances
+
+    @staticmethod
+    def point_distance(point, hull: np.ndarray) -> float:
+        '''
+        Return the distance from the XZ point to the convex hull (0 if the
+        point is inside it).
+        '''
+        return float(RewardGeometry.points_distance(point, hull)[0])
+
+    @staticmethod
+    def _segments_intersect(hull_a: np.ndarray, hull_b: np.ndarray) -> bool:
+        # Whether any edge of A properly crosses any edge of B
+        edges_a = RewardGeometry._edges(hull_a)
+        edges_b = RewardGeometry._edges(hull_b)
+        cross_a = np.sign(RewardGeometry._edge_cross(hull_b, edges_a))
+        cross_b = np.sign(RewardGeometry._edge_cross(hull_a, edges_b))
+        # Sides of the start and end of each B edge relative to each A edge
+        sides_a = cross_a * np.roll(cross_a, -1, axis=0)
+        sides_b = cross_b * np.roll(cross_b, -1, axis=0)
+        return bool(((sides_a < 0) & (sides_b.T < 0)).any())
+
+    @staticmethod
+    def _separated(hull_a: np.ndarray, hull_b: np.ndarray) -> bool:
+        if len(hull_a) < 3 and len(hull_b) < 3:
+            # Points and segments have no inside to separate
+            return not RewardGeometry._segments_intersect(hull_a, hull_b)
+        # Separating axis: all of one hull strictly outside an edge of
+        # the other (a segment's two edges face both ways)
+        outside_a = RewardGeometry._edge_cross(
+            hull_b, RewardGeometry._edges(hull_a)) < 0
+        outside_b = RewardGeometry._edge_cross(
+            hull_a, RewardGeometry._edges(hull_b)) < 0
+        return bool(outside_a.all(axis=0).any() or
+                    outside_b.all(axis=0).any())
+
+    @staticmethod
+    def intersects(hull_a: np.ndarray, hull_b: np.ndarray) -> bool:
+        '''Return whether the two convex hulls touch or overlap.'''
+        return RewardGeometry.polygon_distance(hull_a, hull_b) == 0.0
+
+    @staticmethod
+    def polygon_distance(hull_a: np.ndarray, hull_b: np.ndarray) -> float:
+        '''
+        Return the distance between the two convex hulls (0 if they touch
+        or overlap).
+        '''
+        distance = min(
+            RewardGeometry._edge_distances(
+                np.asarray(hull_a, dtype=np.float64).reshape(-1, 2),
+                RewardGeometry._edges(hull_b)).min(),
+            RewardGeometry._edge_distances(
+                np.asarray(hull_b, dtype=np.float64).reshape(-1, 2),
+                RewardGeometry._edges(hull_a)).min()
+        )
+        if distance == 0.0 or not RewardGeometry._separated(hull_a, hull_b):
+            return 0.0
+        return float(distance)
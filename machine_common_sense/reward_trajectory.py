@@ -0,0 +1,297 @@
+import itertools
+import multiprocessing
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from .agent_limits import MAX_REACH_DISTANCE, MOVE_DISTANCE
+from .goal_metadata import GoalCategory, GoalMetadata
+from .history_replay import HistoryReplayController
+from .reward import GOAL_ACHIEVED, GOAL_NOT_ACHIEVED, STEP_PENALTY
+from .reward_geometry import RewardGeometry
+from .step_metadata import StepMetadata
+
+
+class RewardTrajectory(object):
+    '''
+    Recalculates the rewards of a whole recorded scene at once, like after
+    a change of the reward rules or of the STEP_PENALTY: the same rules as
+    Reward.calculate_reward, vectorized over the steps of a trajectory (the
+    agent XZ positions, and the bounds, held states and heights of the goal
+    objects, at each step). Distances are calculated once for each
+    distinct object bounds (or pair of bounds), so static goal objects cost
+    one hull however long the trajectory.
+    '''
+
+    # Bounds corners per object and step (padded if fewer)
+    CORNERS = 8
+
+    def __init__(self, goal: GoalMetadata, step_numbers: np.ndarray,
+                 agent_xz: np.ndarray, objects: Dict[str, Dict]):
+        '''
+        Args:
+            goal: GoalMetadata
+            step_numbers: (T,) step number of each step
+            agent_xz: (T, 2) agent XZ position at each step
+            objects: objectId to a dict of "corners" (T, CORNERS, 2) XZ
+                bounds corners (NaN where missing), "held" (T,) bool, and
+                "y" (T,) position height of the object at each step
+        '''
+        self.goal = goal
+        self.step_numbers = np.asarray(step_numbers, dtype=np.int64)
+        self.agent_xz = np.asarray(agent_xz, dtype=np.float64).reshape(-1, 2)
+        self.objects = objects
+
+    @staticmethod
+    def _corners(corner_list) -> np.ndarray:
+        corners = np.full((RewardTrajectory.CORNERS, 2), np.nan)
+        if corner_list:
+            points = [(corner['x'], corner['z'])
+                      for corner in corner_list[:RewardTrajectory.CORNERS]]
+            corners[:len(points)] = points
+            corners[len(points):] = points[-1]
+        return corners
+
+    @staticmethod
+    def _goal_ids(goal: GoalMetadata) -> List[str]:
+        metadata = goal.metadata if goal is not None else {}
+        return [
+            (metadata.get(name) or {}).get('id')
+            for name in ('target', 'target_1', 'target_2')
+            if (metadata.get(name) or {}).get('id') is not None
+        ]
+
+    @staticmethod
+    def from_events(goal: GoalMetadata,
+                    event_list: Iterable[Tuple[int, Dict, List[Dict]]]
+                    ) -> 'RewardTrajectory':
+        '''
+        Create a trajectory from (step number, agent, objects) tuples, with
+        the agent and objects as given to Reward.calculate_reward.
+        '''
+        return RewardTrajectory._from_steps(goal, (
+            (
+                step_number,
+                (agent['position']['x'], agent['position']['z']),
+                {
+                    obj['objectId']: (
+                        obj['objectBounds']['objectBoundsCorners'],
+                        obj.get('isPickedUp', False),
+                        obj['position']['y'] if 'y' in obj['position']
+                        else np.nan
+                    )
+                    for obj in reversed(objects)
+                }
+            )
+            for step_number, agent, objects in event_list
+        ))
+
+    @staticmethod
+    def from_outputs(goal: Optional[GoalMetadata],
+                     output_list: Iterable[StepMetadata]
+                     ) -> 'RewardTrajectory':
+        '''
+        Create a trajectory from step outputs, like those replayed by the
+        HistoryReplayController with a recorded dataset (the objects come
+        from the object_list, so this needs oracle metadata to see every
+        goal object at every step). Without a goal, use the goal of the
+        first output.
+        '''
+        output_list = iter(output for output in output_list
+                           if output is not None)
+        if goal is None:
+            first = next(output_list, None)
+            goal = first.goal if first is not None else GoalMetadata()
+            if first is not None:
+                output_list = itertools.chain([first], output_list)
+        return RewardTrajectory._from_steps(goal, (
+            (
+                output.step_number,
+                ((output.position or {}).get('x', np.nan),
+                 (output.position or {}).get('z', np.nan)),
+                {
+                    obj.uuid: (
+                        obj.dimensions,
+                        obj.held,
+                        (obj.position or {}).get('y', np.nan)
+                    )
+                    for obj in reversed(output.object_list or [])
+                }
+            )
+            for output in output_list
+        ))
+
+    @staticmethod
+    def from_replay(history_path: str, dataset_directory: str
+                    ) -> 'RewardTrajectory':
+        '''
+        Create a trajectory from a scene history file and the dataset
+        exported during the same run (history files do not keep the
+        object bounds), skipping the start of the scene like the history.
+        '''
+        controller = HistoryReplayController(history_path, dataset_directory)
+        try:
+            controller.start_scene()
+            output_list = iter(controller.step, None)
+            return RewardTrajectory.from_outputs(None, output_list)
+        finally:
+            controller.stop_simulation()
+
+    @staticmethod
+    def _from_steps(goal: GoalMetadata, step_list) -> 'RewardTrajectory':
+        goal_ids = RewardTrajectory._goal_ids(goal)
+        step_numbers = []
+        agent_xz = []
+        object_steps = {object_id: [] for object_id in goal_ids}
+        for step_number, position, objects in step_list:
+            step_numbers.append(step_number)
+            agent_xz.append(position)
+            for object_id in goal_ids:
+                object_steps[object_id].append(objects.get(object_id))
+
+        objects = {}
+        for object_id, step_objects in object_steps.items():
+            objects[object_id] = {
+                'corners': np.array([
+                    RewardTrajectory._corners(obj[0] if obj else None)
+                    for obj in step_objects
+                ]).reshape(-1, RewardTrajectory.CORNERS, 2),
+                'held': np.array([bool(obj and obj[1])
+                                  for obj in step_objects], dtype=bool),
+                'y': np.array([obj[2] if obj else np.nan
+                               for obj in step_objects], dtype=np.float64)
+            }
+        return RewardTrajectory(goal, step_numbers, agent_xz, objects)
+
+    def __len__(self) -> int:
+        return len(self.step_numbers)
+
+    def _object(self, object_id) -> Dict:
+        missing = {
+            'corners': np.full((len(self), self.CORNERS, 2), np.nan),
+            'held': np.zeros(len(self), dtype=bool),
+            'y': np.full(len(self), np.nan)
+        }
+        return self.objects.get(object_id, missing)
+
+    @staticmethod
+    def _present(obj: Dict) -> np.ndarray:
+        return ~np.isnan(obj['corners']).any(axis=(1, 2))
+
+    def _retrieval(self) -> np.ndarray:
+        target = self._object(self.goal.metadata['target'].get('id', None))
+        return self._present(target) & target['held']
+
+    def _traversal(self) -> np.ndarray:
+        target = self._object(self.goal.metadata['target'].get('id', None))
+        present = self._present(target)
+        achieved = np.zeros(len(self), dtype=bool)
+        if not present.any():
+            return achieved
+        step_index = np.flatnonzero(present)
+        bounds, inverse = np.unique(
+            target['corners'][present].reshape(len(step_index), -1),
+            axis=0, return_inverse=True)
+        inverse = inverse.reshape(-1)
+        for bounds_index, bounds_row in enumerate(bounds):
+            hull = RewardGeometry.convex_hull(bounds_row.reshape(-1, 2))
+            steps = step_index[inverse == bounds_index]
+            achieved[steps] = RewardGeometry.points_distance(
+                self.agent_xz[steps], hull) <= MAX_REACH_DISTANCE
+        return achieved
+
+    def _transferral(self) -> np.ndarray:
+        metadata = self.goal.metadata
+        achieved = np.zeros(len(self), dtype=bool)
+        relationship = metadata.get('relationship', None)
+        if relationship is None or len(relationship) != 3:
+            return achieved
+        action = relationship[1].lower()
+        action_object = self._object(
+            (metadata.get('target_1') or {}).get('id', None))
+        goal_object = self._object(
+            (metadata.get('target_2') or {}).get('id', None))
+
+        valid = (self._present(action_object) & ~action_object['held'] &
+                 self._present(goal_object) & ~goal_object['held'])
+        if action not in ('next to', 'on top of') or not valid.any():
+            return achieved
+
+        step_index = np.flatnonzero(valid)
+        pairs, inverse = np.unique(np.concatenate([
+            action_object['corners'][valid].reshape(len(step_index), -1),
+            goal_object['corners'][valid].reshape(len(step_index), -1)
+        ], axis=1), axis=0, return_inverse=True)
+        inverse = inverse.reshape(-1)
+        half = self.CORNERS * 2
+        pair_achieved = np.zeros(len(pairs), dtype=bool)
+        for pair_index, pair in enumerate(pairs):
+            action_hull = RewardGeometry.convex_hull(
+                pair[:half].reshape(-1, 2))
+            goal_hull = RewardGeometry.convex_hull(pair[half:].reshape(-1, 2))
+            if action == 'next to':
+                pair_achieved[pair_index] = RewardGeometry.polygon_distance(
+                    action_hull, goal_hull) <= MOVE_DISTANCE
+            else:
+                pair_achieved[pair_index] = RewardGeometry.intersects(
+                    action_hull, goal_hull)
+        achieved[step_index] = pair_achieved[inverse]
+        if action == 'on top of':
+            with np.errstate(invalid='ignore'):
+                achieved &= action_object['y'] > goal_object['y']
+        return achieved
+
+    def goal_achieved(self) -> np.ndarray:
+        '''
+        Returns:
+            np.ndarray: (T,) 1 for each step at which the goal is achieved,
+                0 otherwise
+        '''
+        category = None
+        if self.goal is not None and self.goal.metadata:
+            category = self.goal.metadata.get('category', None)
+        switch = {
+            GoalCategory.RETRIEVAL.value: self._retrieval,
+            GoalCategory.TRANSFERRAL.value: self._transferral,
+            GoalCategory.TRAVERSAL.value: self._traversal,
+        }
+        if category not in switch:
+            return np.full(len(self), GOAL_NOT_ACHIEVED, dtype=np.int64)
+        return np.where(switch[category](), GOAL_ACHIEVED,
+                        GOAL_NOT_ACHIEVED).astype(np.int64)
+
+    def calculate_rewards(self, step_penalty: float = STEP_PENALTY
+                          ) -> np.ndarray:
+        '''
+        Calculate the reward at each step, the same as
+        Reward.calculate_reward but with the given step penalty.
+
+        Returns:
+            np.ndarray: (T,) reward of each step
+        '''
+        score = self.goal_achieved()
+        # As Reward._adjust_score_penalty: the step that achieves the goal
+        # is not penalized
+        return score - (self.step_numbers - score) * step_penalty
+
+    @staticmethod
+    def _calculate(arguments) -> np.ndarray:
+        trajectory, step_penalty = arguments
+        return trajectory.calculate_rewards(step_penalty)
+
+    @staticmethod
+    def calculate_many(trajectory_list: Iterable['RewardTrajectory'],
+                       step_penalty: float = STEP_PENALTY,
+                       processes: int = None) -> Iterator[np.ndarray]:
+        '''
+        Yield the rewards of each trajectory (of many scenes), in order,
+        calculated across a pool of processes (by default, one per CPU;
+        with 1, in this process).
+        '''
+        argument_list = ((trajectory, step_penalty)
+                         for trajectory in trajectory_list)
+        if processes == 1:
+            yield from map(RewardTrajectory._calculate, argument_list)
+            return
+        with multiprocessing.Pool(processes) as pool:
+            yield from pool.imap(RewardTrajectory._calculate, argument_list)
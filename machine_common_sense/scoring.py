@@ -0,0 +1,377 @@
+import json
+import multiprocessing
+import pathlib
+from typing import Callable, Dict, Iterable, Iterator, List, Optional
+
+from .goal_metadata import GoalCategory
+from .history_reader import HistoryReader
+from .history_writer import StreamingHistoryWriter
+
+
+class Scoring(object):
+    '''
+    Scores evaluation runs offline: loads the ground truth from scene files
+    and the team results from scene history files (both in parallel across
+    a process pool, streaming, and keeping only a small summary of each
+    file), joins them by scene name, and reports for each run (team and
+    metadata tier):
+
+    - the accuracy and the AUC of the end scores of the passive scenes
+      with an answer, overall and per goal category
+    - the violation localization of the implausible passive scenes: how
+      many steps after the first impossible event (a hide, shroud,
+      teleport or resize of an object) the per-step predictions first
+      reported a violation
+    - the success rate, reward and step count of the interactive scenes,
+      per goal category
+    '''
+
+    PLAUSIBLE_CHOICES = ('plausible', 'expected')
+    IMPLAUSIBLE_CHOICES = ('implausible', 'unexpected')
+
+    # Object properties for impossible events in implausible scenes
+    VIOLATION_PROPERTIES = ('hides', 'shrouds', 'teleports', 'resizes')
+
+    INTERACTIVE_CATEGORIES = (
+        GoalCategory.RETRIEVAL.value,
+        GoalCategory.TRANSFERRAL.value,
+        GoalCategory.TRAVERSAL.value
+    )
+
+    # Files per task sent to each pool process
+    CHUNK_SIZE = 16
+
+    @staticmethod
+    def scene_key(name: str) -> str:
+        '''Return the name used to join scene files and history files: the
+        scene name without any prefix folder or .json extension.'''
+        return (name or '').rsplit('/', 1)[-1].replace('.json', '')
+
+    @staticmethod
+    def _is_plausible(choice) -> Optional[bool]:
+        choice = (choice or '').lower()
+        if choice in Scoring.PLAUSIBLE_CHOICES:
+            return True
+        if choice in Scoring.IMPLAUSIBLE_CHOICES:
+            return False
+        return None
+
+    @staticmethod
+    def _number(value) -> Optional[float]:
+        try:
+            return None if value in (None, '') else float(value)
+        except (TypeError, ValueError):
+            return None
+
+    @staticmethod
+    def load_ground_truth(scene_path) -> Optional[Dict]:
+        '''
+        Load the ground truth of one scene file.
+
+        Args:
+            scene_path: path to an MCS scene JSON file
+
+        Returns:
+            dict: the scene key, goal category, answer choice (or None),
+                and first violation step (or None), or None if the file
+                is not an MCS scene
+        '''
+        try:
+            with open(scene_path, encoding='utf-8-sig') as scene_file:
+                scene_data = json.load(scene_file)
+        except (OSError, ValueError):
+            return None
+        if not isinstance(scene_data, dict):
+            return None
+
+        goal = scene_data.get('goal') or {}
+        category = goal.get('category') or \
+            (goal.get('metadata') or {}).get('category')
+        answer = (goal.get('answer') or {}).get('choice')
+
+        violation_step = None
+        if Scoring._is_plausible(answer) is False:
+            step_list = [
+                event.get('stepBegin')
+                for obj in scene_data.get('objects') or []
+                for prop in Scoring.VIOLATION_PROPERTIES
+                for event in obj.get(prop) or []
+                if event.get('stepBegin')
+            ]
+            violation_step = min(step_list) if step_list else None
+
+        return {
+            'scene': Scoring.scene_key(
+                scene_data.get('name') or pathlib.Path(scene_path).stem),
+            'category': category,
+            'answer': answer,
+            'violation_step': violation_step
+        }
+
+    @staticmethod
+    def load_result(history_path) -> Optional[Dict]:
+        '''
+        Load the result of one scene history file, reading its steps one at
+        a time.
+
+        Args:
+            history_path: path to a history file of either format
+
+        Returns:
+            dict: the scene key, run (team and metadata tier), timestamp,
+                end choice and confidence, step count, first and best step
+                reward, and first step reporting a violation, or None if
+                the file cannot be read
+        '''
+        try:
+            step_count = 0
+            final_reward = None
+            best_reward = None
+            report_step = None
+            info = {}
+            score = {}
+            if HistoryReader.is_streaming(history_path):
+                records = HistoryReader.iter_records(history_path)
+            else:
+                history = HistoryReader.read(history_path)
+                info = history.get('info') or {}
+                score = history.get('score') or {}
+                records = ({'type': StreamingHistoryWriter.RECORD_STEP,
+                            StreamingHistoryWriter.RECORD_STEP: step}
+                           for step in history.get('steps') or [])
+            for record in records:
+                record_type = record['type']
+                if record_type == StreamingHistoryWriter.RECORD_INFO:
+                    info = record[record_type]
+                elif record_type == StreamingHistoryWriter.RECORD_SCORE:
+                    score = record[record_type]
+                if record_type != StreamingHistoryWriter.RECORD_STEP:
+                    continue
+                step = record[record_type]
+                step_count += 1
+                reward = Scoring._number(
+                    (step.get('output') or {}).get('reward'))
+                if reward is not None:
+                    final_reward = reward
+                    best_reward = reward if best_reward is None \
+                        else max(best_reward, reward)
+                if report_step is None and (
+                    step.get('violations_xy_list') or
+                    Scoring._is_plausible(step.get('classification')) is False
+                ):
+                    report_step = step.get('step')
+        except (OSError, ValueError, KeyError):
+            return None
+
+        return {
+            'scene': Scoring.scene_key(info.get('name')),
+            'team': info.get('team'),
+            'metadata': info.get('metadata'),
+            'timestamp': info.get('timestamp') or '',
+            'choice': score.get('classification'),
+            'confidence': Scoring._number(score.get('confidence')),
+            'step_count': step_count,
+            'final_reward': final_reward,
+            'best_reward': best_reward,
+            'report_step': report_step
+        }
+
+    @staticmethod
+    def iter_parallel(function: Callable, path_list: Iterable,
+                      processes: int = None) -> Iterator:
+        '''
+        Yield the function of each path (in any order), run across a pool
+        of processes (by default, one per CPU; with 1, run in this
+        process). Results are yielded as soon as they are done, so only
+        the caller decides what to keep.
+        '''
+        path_list = (str(path) for path in path_list)
+        if processes == 1:
+            yield from map(function, path_list)
+            return
+        with multiprocessing.Pool(processes) as pool:
+            yield from pool.imap_unordered(function, path_list,
+                                           Scoring.CHUNK_SIZE)
+
+    @staticmethod
+    def auc(label_list: List[bool],
+            score_list: List[float]) -> Optional[float]:
+        '''
+        Return the area under the ROC curve of the given scores for the
+        given (true is positive) labels, counting ties as half, or None if
+        either class is missing.
+        '''
+        pairs = sorted(zip(score_list, label_list))
+        positives = sum(1 for _, label in pairs if label)
+        negatives = len(pairs) - positives
+        if not positives or not negatives:
+            return None
+        # Mann-Whitney U from the average ranks of tied scores
+        rank_sum = 0.0
+        index = 0
+        while index < len(pairs):
+            end = index
+            while end < len(pairs) and pairs[end][0] == pairs[index][0]:
+                end += 1
+            average_rank = (index + 1 + end) / 2.0
+            rank_sum += average_rank * sum(
+                1 for _, label in pairs[index:end] if label)
+            index = end
+        return (rank_sum - positives * (positives + 1) / 2.0) / (
+            positives * negatives)
+
+    @staticmethod
+    def _plausibility_score(result: Dict) -> Optional[float]:
+        '''The end score as the probability that the scene is plausible.'''
+        plausible = Scoring._is_plausible(result['choice'])
+        confidence = result['confidence']
+        if plausible is None:
+            return None
+        if confidence is None:
+            confidence = 1.0
+        return confidence if plausible else 1.0 - confidence
+
+    @staticmethod
+    def _summarize_passive(pair_list: List) -> Dict:
+        correct = sum(
+            1 for truth, result in pair_list
+            if Scoring._is_plausible(result['choice']) ==
+            Scoring._is_plausible(truth['answer']))
+        scored = [(Scoring._is_plausible(truth['answer']),
+                   Scoring._plausibility_score(result))
+                  for truth, result in pair_list]
+        scored = [(label, score) for label, score in scored
+                  if score is not None]
+        return {
+            'scenes': len(pair_list),
+            'correct': correct,
+            'accuracy': correct / len(pair_list) if pair_list else None,
+            'auc': Scoring.auc([label for label, _ in scored],
+                               [score for _, score in scored])
+        }
+
+    @staticmethod
+    def _summarize_localization(pair_list: List) -> Dict:
+        latency_list = []
+        early = 0
+        missed = 0
+        for truth, result in pair_list:
+            if result['report_step'] is None:
+                missed += 1
+            elif result['report_step'] < truth['violation_step']:
+                early += 1
+            else:
+                latency_list.append(
+                    result['report_step'] - truth['violation_step'])
+        return {
+            'scenes': len(pair_list),
+            'localized': len(latency_list),
+            'early': early,
+            'missed': missed,
+            'mean_latency': (sum(latency_list) / len(latency_list)
+                             if latency_list else None)
+        }
+
+    @staticmethod
+    def _summarize_interactive(result_list: List[Dict]) -> Dict:
+        reward_list = [result['final_reward'] for result in result_list
+                       if result['final_reward'] is not None]
+        successes = sum(1 for result in result_list
+                        if (result['best_reward'] or 0) > 0)
+        return {
+            'scenes': len(result_list),
+            'successes': successes,
+            'success_rate': successes / len(result_list),
+            'mean_reward': (sum(reward_list) / len(reward_list)
+                            if reward_list else None),
+            'mean_steps': sum(
+                result['step_count'] for result in result_list
+            ) / len(result_list)
+        }
+
+    @staticmethod
+    def score(scene_path_list: Iterable, history_path_list: Iterable,
+              processes: int = None) -> Dict:
+        '''
+        Score the given history files against the given scene files.
+
+        Args:
+            scene_path_list: paths of the scene files (with the answers)
+            history_path_list: paths of the history files of any number of
+                runs (the latest history of each scene in each run counts)
+            processes: size of the process pool (default: CPU count)
+
+        Returns:
+            dict: "runs", a list with the report of each run, and the
+                counts of "unmatched" histories (no scene file) and
+                "unreadable" files
+        '''
+        ground_truth = {}
+        unreadable = 0
+        for truth in Scoring.iter_parallel(
+                Scoring.load_ground_truth, scene_path_list, processes):
+            if truth is None:
+                unreadable += 1
+                continue
+            ground_truth[truth['scene']] = truth
+
+        # Only the summary of the latest history of each scene per run
+        runs = {}
+        unmatched = 0
+        for result in Scoring.iter_parallel(
+                Scoring.load_result, history_path_list, processes):
+            if result is None:
+                unreadable += 1
+                continue
+            if result['scene'] not in ground_truth:
+                unmatched += 1
+                continue
+            run = runs.setdefault((result['team'], result['metadata']), {})
+            previous = run.get(result['scene'])
+            if previous is None or previous['timestamp'] <= \
+                    result['timestamp']:
+                run[result['scene']] = result
+
+        report_list = []
+        for (team, metadata), run in sorted(
+                runs.items(), key=lambda item: tuple(map(str, item[0]))):
+            passive = {}
+            interactive = {}
+            localization = []
+            for scene, result in run.items():
+                truth = ground_truth[scene]
+                category = truth['category'] or ''
+                if category in Scoring.INTERACTIVE_CATEGORIES:
+                    interactive.setdefault(category, []).append(result)
+                elif Scoring._is_plausible(truth['answer']) is not None:
+                    passive.setdefault(category, []).append((truth, result))
+                    if truth['violation_step'] is not None:
+                        localization.append((truth, result))
+            report_list.append({
+                'team': team,
+                'metadata': metadata,
+                'scenes': len(run),
+                'missing': len(ground_truth) - len(run),
+                'passive': {
+                    'overall': Scoring._summarize_passive([
+                        pair for pair_list in passive.values()
+                        for pair in pair_list
+                    ]),
+                    'categories': {
+                        category: Scoring._summarize_passive(pair_list)
+                        for category, pair_list in sorted(passive.items())
+                    }
+                },
+                'localization': Scoring._summarize_localization(
+                    localization),
+                'interactive': {
+                    category: Scoring._summarize_interactive(result_list)
+                    for category, result_list in sorted(interactive.items())
+                }
+            })
+
+        return {
+            'runs': report_list,
+            'unmatched': unmatched,
+            'unreadable': unreadable
+        }
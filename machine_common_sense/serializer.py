@@ -1,5 +1,9 @@
+import base64
 import io
 import json
+import os
+import struct
+import uuid
 import msgpack
 import numpy as np
 import PIL.Image as Image
@@ -9,6 +13,7 @@ from typing import Dict, Union
 
 import machine_common_sense as mcs
 
+from .compression import Compression
 from .goal_metadata import GoalMetadata
 from .object_metadata import ObjectMetadata
 from .step_metadata import StepMetadata
@@ -45,7 +50,144 @@ class ISerializer:
 
 
 class SerializerMsgPack(ISerializer):
-    """Serializer to (de)serialize StepMetadata into/from MsgPack format."""
+    """Serializer to (de)serialize StepMetadata into/from MsgPack format.
+
+    Since version 0.2.0, the whole object is packed in one pass: MCS objects
+    become tagged maps, and NumPy arrays and PIL images become ext types
+    holding their raw bytes (after a small dtype/mode and shape header),
+    which deserialize without copying into read only arrays. The payload is
+    wrapped in a map recording the serializer version. Payloads without it
+    are read with the original (0.1.0) ext type layout."""
+
+    LEGACY_VERSION = "0.1.0"
+    VERSION_KEY = "mcs_serializer_version"
+    PAYLOAD_KEY = "payload"
+    TYPE_KEY = "__mcs__"
+    VALUES_KEY = "values"
+
+    EXT_NDARRAY = 16
+    EXT_IMAGE = 17
+
+    TUPLE_TAG = "tuple"
+    # Tag to class and constructor arguments, packed as a list of values.
+    OBJECT_TYPES = {
+        "step": (StepMetadata, (
+            'action_list', 'camera_aspect_ratio', 'camera_clipping_planes',
+            'camera_field_of_view', 'camera_height', 'depth_map_list',
+            'goal', 'habituation_trial', 'head_tilt', 'image_list',
+            'object_list', 'object_mask_list', 'pose', 'position',
+            'return_status', 'reward', 'rotation', 'step_number',
+            'structural_object_list',
+            # Added last so earlier payloads of this version still unpack
+            'occupancy_grid'
+        )),
+        "goal": (GoalMetadata, (
+            'action_list', 'category', 'description', 'habituation_total',
+            'last_preview_phase_step', 'last_step', 'metadata'
+        )),
+        "object": (ObjectMetadata, (
+            'uuid', 'color', 'dimensions', 'direction', 'distance',
+            'distance_in_steps', 'distance_in_world', 'held', 'mass',
+            'material_list', 'position', 'rotation', 'shape', 'state_list',
+            'texture_color_list', 'visible'
+        ))
+    }
+    OBJECT_TAGS = {
+        object_class: (tag, fields)
+        for tag, (object_class, fields) in OBJECT_TYPES.items()
+    }
+
+    @classmethod
+    def version(cls):
+        return "0.2.0"
+
+    @staticmethod
+    def _pack_buffer(header: str, shape, data: bytes) -> bytes:
+        # <header length><header (dtype or image mode)><ndim><shape><data>
+        header = header.encode('ascii')
+        return b''.join([
+            struct.pack('<B', len(header)), header,
+            struct.pack(f'<B{len(shape)}Q', len(shape), *shape), data
+        ])
+
+    @staticmethod
+    def _unpack_buffer(data: bytes):
+        view = memoryview(data)
+        header_length = view[0]
+        header = bytes(view[1:1 + header_length]).decode('ascii')
+        offset = 1 + header_length
+        ndim = view[offset]
+        shape = struct.unpack_from(f'<{ndim}Q', view, offset + 1)
+        return header, shape, view[offset + 1 + 8 * ndim:]
+
+    @staticmethod
+    def _default(x):
+        """Hook to pack MCS objects, tuples, NumPy arrays and PIL images
+        within a single msgpack.packb call."""
+        object_tag = SerializerMsgPack.OBJECT_TAGS.get(type(x))
+        if object_tag is not None:
+            tag, fields = object_tag
+            return {
+                SerializerMsgPack.TYPE_KEY: tag,
+                SerializerMsgPack.VALUES_KEY: [
+                    getattr(x, field) for field in fields
+                ]
+            }
+        if isinstance(x, np.ndarray):
+            if x.dtype.hasobject:
+                return x.tolist()
+            x = np.ascontiguousarray(x)
+            return msgpack.ExtType(
+                SerializerMsgPack.EXT_NDARRAY,
+                SerializerMsgPack._pack_buffer(
+                    x.dtype.str, x.shape, x.data))
+        if isinstance(x, Image.Image):
+            return msgpack.ExtType(
+                SerializerMsgPack.EXT_IMAGE,
+                SerializerMsgPack._pack_buffer(
+                    x.mode, x.size, x.tobytes()))
+        if isinstance(x, tuple):
+            return {
+                SerializerMsgPack.TYPE_KEY: SerializerMsgPack.TUPLE_TAG,
+                SerializerMsgPack.VALUES_KEY: list(x)
+            }
+        if isinstance(x, np.generic):
+            return x.item()
+        # strict_types also sends subclasses of the builtin types here
+        if isinstance(x, dict):
+            return dict(x)
+        if isinstance(x, list):
+            return list(x)
+        if isinstance(x, str):
+            return str(x)
+        if isinstance(x, float):
+            return float(x)
+        if isinstance(x, int):
+            return int(x)
+        raise TypeError(f'Cannot serialize {type(x)}')
+
+    @staticmethod
+    def _object_hook(data: Dict):
+        tag = data.get(SerializerMsgPack.TYPE_KEY)
+        if tag is None:
+            return data
+        values = data[SerializerMsgPack.VALUES_KEY]
+        if tag == SerializerMsgPack.TUPLE_TAG:
+            return tuple(values)
+        object_class, fields = SerializerMsgPack.OBJECT_TYPES[tag]
+        return object_class(**dict(zip(fields, values)))
+
+    @staticmethod
+    def _ext_hook(code, data):
+        """Hook to unpack both the current and the legacy ext types."""
+        if code == SerializerMsgPack.EXT_NDARRAY:
+            dtype, shape, buffer = SerializerMsgPack._unpack_buffer(data)
+            return np.frombuffer(buffer, dtype=dtype).reshape(shape)
+        if code == SerializerMsgPack.EXT_IMAGE:
+            mode, size, buffer = SerializerMsgPack._unpack_buffer(data)
+            return Image.frombuffer(mode, size, buffer, 'raw', mode, 0, 1)
+        return SerializerMsgPack._ext_unpack(code, data)
+
     @staticmethod
     def _ext_pack(x):
         """
@@ -170,7 +312,8 @@ class SerializerMsgPack(ISerializer):
         return msgpack.ExtType(code, data)
 
     @staticmethod
-    def serialize(step_metadata: mcs.StepMetadata):
+    def serialize(step_metadata: mcs.StepMetadata, version: str = None,
+                  compression: Compression = None):
         """
         Serializes step metadata into MsgPack.
 
@@ -183,30 +326,115 @@ class SerializerMsgPack(ISerializer):
 
         Args:
             step_metadata: MCS step metadata output.
+            version: LEGACY_VERSION to use the original ext type layout
+                (default: the current version).
+            compression: Compression to compress the MsgPack with.
 
         Returns:
             Serialized version of step metadata in MsgPack format.
         """
-        serialized = msgpack.packb(step_metadata,
-                                   default=SerializerMsgPack._ext_pack,
-                                   strict_types=True)
+        if version == SerializerMsgPack.LEGACY_VERSION:
+            serialized = msgpack.packb(step_metadata,
+                                       default=SerializerMsgPack._ext_pack,
+                                       strict_types=True)
+        elif version in (None, SerializerMsgPack.version()):
+            serialized = msgpack.packb({
+                SerializerMsgPack.VERSION_KEY: SerializerMsgPack.version(),
+                SerializerMsgPack.PAYLOAD_KEY: step_metadata
+            }, default=SerializerMsgPack._default, strict_types=True)
+        else:
+            raise ValueError(f'Unsupported serializer version {version}')
+        if compression is not None:
+            serialized = compression.compress(serialized)
         return serialized
 
     @staticmethod
     def deserialize(packed_step_metadata):
-        deserialized = msgpack.unpackb(packed_step_metadata,
-                                       ext_hook=SerializerMsgPack._ext_unpack)
+        """
+        Deserializes step metadata from MsgPack of either the current or
+        the legacy version, compressed or not. NumPy arrays share the memory
+        of the packed bytes, so they are read only.
+        """
+        deserialized = msgpack.unpackb(
+            Compression.decompress(packed_step_metadata),
+            ext_hook=SerializerMsgPack._ext_hook,
+            object_hook=SerializerMsgPack._object_hook)
+        if (isinstance(deserialized, dict) and
+                SerializerMsgPack.VERSION_KEY in deserialized):
+            version = deserialized[SerializerMsgPack.VERSION_KEY]
+            if version != SerializerMsgPack.version():
+                raise ValueError(f'Unsupported serializer version {version}')
+            return deserialized[SerializerMsgPack.PAYLOAD_KEY]
         return deserialized
 
 
 class SerializerJson(ISerializer):
-    """Serializer to (de)serialize StepMetadata into/from MsgPack format."""
+    """Serializer to (de)serialize StepMetadata into/from JSON format.
+
+    By default, images and arrays are nested lists of numbers. With the
+    base64 array encoding, each is instead an object holding its raw bytes
+    in base64 with its dtype and shape (and image mode); with the npy array
+    encoding, each is saved to its own .npy sidecar file in a directory and
+    the object holds its relative path. The rest of the schema is the same,
+    and deserialize reads all three forms."""
+
+    ARRAY_ENCODING_LIST = 'list'
+    ARRAY_ENCODING_BASE64 = 'base64'
+    ARRAY_ENCODING_NPY = 'npy'
+
+    BASE64_KEY = '__ndarray__'
+    NPY_KEY = '__npy__'
+
     class McsStepMetadataEncoder(json.JSONEncoder):
         """
         JSON Encoder Class for MCS Step Metadata, e.g.
         json_dump = json.dumps(output, cls=McsStepMetadataEncoder, indent=4)
+
+        Pass array_encoding (and, for npy, sidecar_directory) to json.dumps
+        to encode images and arrays as base64 or .npy sidecar files.
         """
 
+        def __init__(self, *args, array_encoding=None,
+                     sidecar_directory=None, **kwargs):
+            super().__init__(*args, **kwargs)
+            self.array_encoding = (array_encoding or
+                                   SerializerJson.ARRAY_ENCODING_LIST)
+            self.sidecar_directory = sidecar_directory
+            self.sidecar_prefix = uuid.uuid4().hex
+            self.sidecar_count = 0
+            if self.array_encoding == SerializerJson.ARRAY_ENCODING_NPY:
+                if sidecar_directory is None:
+                    raise ValueError('The npy array encoding needs a '
+                                     'sidecar_directory')
+                os.makedirs(sidecar_directory, exist_ok=True)
+            elif self.array_encoding not in (
+                    SerializerJson.ARRAY_ENCODING_LIST,
+                    SerializerJson.ARRAY_ENCODING_BASE64):
+                raise ValueError(
+                    f'Unknown array encoding {self.array_encoding}')
+
+        def encode_array(self, x: np.ndarray, mode: str = None):
+            if (self.array_encoding == SerializerJson.ARRAY_ENCODING_LIST or
+                    x.dtype.hasobject):
+                return x.tolist()
+            if self.array_encoding == SerializerJson.ARRAY_ENCODING_BASE64:
+                x = np.ascontiguousarray(x)
+                encoded = {
+                    SerializerJson.BASE64_KEY: base64.b64encode(
+                        x.data).decode('ascii'),
+                    'dtype': x.dtype.str,
+                    'shape': list(x.shape)
+                }
+            else:
+                filename = (f'{self.sidecar_prefix}_'
+                            f'{self.sidecar_count}.npy')
+                self.sidecar_count += 1
+                np.save(os.path.join(self.sidecar_directory, filename), x)
+                encoded = {SerializerJson.NPY_KEY: filename}
+            if mode is not None:
+                encoded['mode'] = mode
+            return encoded
+
         def default(self, x):
             if isinstance(x, StepMetadata):
                 return {
@@ -227,15 +455,13 @@ class SerializerJson(ISerializer):
                     'reward': x.reward,
                     'rotation': x.rotation,
                     'step_number': x.step_number,
-                    'structural_object_list': x.structural_object_list
+                    'structural_object_list': x.structural_object_list,
+                    'occupancy_grid': x.occupancy_grid
                 }
             elif isinstance(x, tuple):
                 return [x[0], x[1]]
             elif isinstance(x, Image.Image):
-                # Could also use: return x.tobytes().decode("latin1")
-                # or: buffer = BytesIO() x.save(buff, format="PNG")
-                #     base64.b64encode(buffer.getvalue()).decode('ascii')
-                return np.array(x).tolist()
+                return self.encode_array(np.asarray(x), x.mode)
             elif isinstance(x, GoalMetadata):
                 return {
                     'action_list': x.action_list,
@@ -263,7 +489,7 @@ class SerializerJson(ISerializer):
                     'visible': x.visible
                 }
             elif isinstance(x, np.ndarray):
-                return x.tolist()
+                return self.encode_array(x)
             return json.JSONEncoder.default(self, x)
 
     @staticmethod
@@ -285,28 +511,92 @@ class SerializerJson(ISerializer):
         return object_list
 
     @staticmethod
-    def serialize(step_metadata: mcs.StepMetadata, indent: int = 4):
+    def serialize(step_metadata: mcs.StepMetadata, indent: int = 4,
+                  array_encoding: str = None, sidecar_directory: str = None,
+                  compression: Compression = None):
+        """
+        Serializes step metadata into JSON.
+
+        Args:
+            step_metadata: MCS step metadata output.
+            indent: JSON indent (None for the most compact output).
+            array_encoding: ARRAY_ENCODING_LIST (default),
+                ARRAY_ENCODING_BASE64 or ARRAY_ENCODING_NPY.
+            sidecar_directory: directory for the .npy files of the npy
+                array encoding.
+            compression: Compression to compress the JSON with (then
+                returned as bytes).
+
+        Returns:
+            Serialized version of step metadata in JSON format.
+        """
         json_dump = json.dumps(step_metadata,
                                cls=SerializerJson.McsStepMetadataEncoder,
-                               indent=indent)
+                               indent=indent,
+                               array_encoding=array_encoding,
+                               sidecar_directory=sidecar_directory)
+        if compression is not None:
+            return compression.compress(json_dump.encode('utf-8'))
         return json_dump
 
     @staticmethod
-    def deserialize(input_json: Union[Dict, str]):
+    def decode_array(array_raw, dtype='uint8', sidecar_directory=None):
+        """Decodes an array from any of the array encodings (nested lists
+        are given the dtype)."""
+        if not isinstance(array_raw, dict):
+            return np.array(array_raw, dtype=dtype)
+        if SerializerJson.BASE64_KEY in array_raw:
+            return np.frombuffer(
+                bytearray(base64.b64decode(
+                    array_raw[SerializerJson.BASE64_KEY])),
+                dtype=array_raw['dtype']
+            ).reshape(array_raw['shape'])
+        if SerializerJson.NPY_KEY in array_raw:
+            return np.load(os.path.join(sidecar_directory or '',
+                                        array_raw[SerializerJson.NPY_KEY]))
+        raise ValueError(f'Unknown array encoding {list(array_raw)}')
+
+    @staticmethod
+    def decode_image(image_raw, sidecar_directory=None):
+        """Decodes a PIL image from any of the array encodings."""
+        image_array = SerializerJson.decode_array(
+            image_raw, sidecar_directory=sidecar_directory)
+        mode = image_raw.get('mode') if isinstance(image_raw, dict) else None
+        return Image.fromarray(image_array, mode)
+
+    @staticmethod
+    def deserialize(input_json: Union[Dict, str, bytes],
+                    sidecar_directory: str = None):
+        """
+        Deserializes step metadata from JSON with any array encoding.
+
+        Args:
+            input_json: JSON string (or bytes, compressed or not) or its
+                parsed dict.
+            sidecar_directory: directory of the .npy files of the npy
+                array encoding.
+
+        Returns:
+            StepMetadata
+        """
+        if isinstance(input_json, bytes):
+            input_json = Compression.decompress(input_json).decode('utf-8')
         if isinstance(input_json, str):
             input_json = json.loads(input_json)
         depth_map_list = []
         for depth_map_raw in input_json['depth_map_list']:
-            depth_map_list.append(np.array(depth_map_raw, dtype='uint8'))
+            depth_map_list.append(SerializerJson.decode_array(
+                depth_map_raw, sidecar_directory=sidecar_directory))
 
         object_mask_list = []
         for obj_mask_raw in input_json['object_mask_list']:
-            object_mask_list.append(np.array(obj_mask_raw, dtype='uint8'))
+            object_mask_list.append(SerializerJson.decode_array(
+                obj_mask_raw, sidecar_directory=sidecar_directory))
 
         image_list = []
         for img_raw in input_json['image_list']:  # PIL
-            image_list.append(Image.fromarray(np.array(img_raw,
-                                                       dtype='uint8')))
+            image_list.append(SerializerJson.decode_image(
+                img_raw, sidecar_directory))
 
         object_list_raw = input_json['object_list']
         object_list = SerializerJson.convert_object_list(object_list_raw)
@@ -315,6 +605,11 @@ class SerializerJson(ISerializer):
         structural_object_list = SerializerJson.convert_object_list(
             structural_object_list_raw)
 
+        occupancy_grid_raw = input_json.get('occupancy_grid')
+        occupancy_grid = None if occupancy_grid_raw is None else (
+            SerializerJson.decode_array(occupancy_grid_raw, 'int8',
+                                        sidecar_directory))
+
         goal_raw = input_json['goal']
         goal = GoalMetadata(goal_raw['action_list'], goal_raw['category'],
                             goal_raw['description'],
@@ -334,6 +629,7 @@ class SerializerJson(ISerializer):
             image_list=image_list,
             object_list=object_list,
             object_mask_list=object_mask_list,
+            occupancy_grid=occupancy_grid,
             pose=input_json['pose'],
             position=input_json['position'],
             return_status=input_json['return_status'],
@@ -341,3 +637,237 @@ class SerializerJson(ISerializer):
             rotation=input_json['rotation'],
             step_number=input_json['step_number'],
             structural_object_list=structural_object_list)
+
+
+class SerializerDeltaStream(ISerializer):
+    """Stateful serializer for a stream of consecutive StepMetadata (like
+    the steps of one scene) into/from MsgPack format.
+
+    Every KEYFRAME_INTERVAL steps (and the first), a keyframe holds the
+    whole step. Other frames only hold the fields that changed since the
+    previous step: objects (by uuid) that were added or changed, and, for
+    images and arrays, only the changed elements when few of them changed.
+    Frames must be deserialized in order by a decoder for the same stream;
+    call reset() (or use a new instance) to start another stream. Values
+    unchanged from the previous step are shared with its output. Frames
+    may be compressed with the given Compression."""
+
+    VERSION_KEY = "mcs_delta_version"
+    KEYFRAME_KEY = "keyframe"
+    INDEX_KEY = "index"
+    FIELDS_KEY = "fields"
+    PATCH_KEY = "__patch__"
+    PATCH_VALUES_KEY = "values"
+    OBJECTS_KEY = "__objects__"
+    CHANGED_KEY = "changed"
+
+    STEP_FIELDS = SerializerMsgPack.OBJECT_TYPES['step'][1]
+    OBJECT_LIST_FIELDS = ('object_list', 'structural_object_list')
+    ARRAY_LIST_FIELDS = ('depth_map_list', 'image_list', 'object_mask_list')
+    ARRAY_FIELDS = ('occupancy_grid',)
+
+    # Patch an array when at most this fraction of its elements changed.
+    PATCH_MAX_FRACTION = 0.25
+
+    def __init__(self, keyframe_interval: int = 30,
+                 compression: Compression = None):
+        self.keyframe_interval = keyframe_interval
+        self.compression = compression
+        self.reset()
+
+    @classmethod
+    def version(cls):
+        return "0.1.0"
+
+    def reset(self):
+        """Forget the previous step, to start a new stream."""
+        self._encoder_fields = None
+        self._encoder_index = 0
+        self._decoder_fields = None
+        self._decoder_index = None
+
+    @staticmethod
+    def _to_array(value):
+        return np.asarray(value) if isinstance(value, Image.Image) else value
+
+    @staticmethod
+    def _equal(value, previous) -> bool:
+        if isinstance(value, (np.ndarray, Image.Image)):
+            if type(value) is not type(previous):
+                return False
+            if (isinstance(value, Image.Image) and
+                    value.mode != previous.mode):
+                return False
+            return np.array_equal(np.asarray(value), np.asarray(previous))
+        if isinstance(value, (GoalMetadata, ObjectMetadata)):
+            # Goals and objects may hold arrays, like goal target images
+            return (type(value) is type(previous) and
+                    SerializerDeltaStream._equal(vars(value), vars(previous)))
+        if isinstance(value, dict):
+            return (isinstance(previous, dict) and
+                    value.keys() == previous.keys() and
+                    all(SerializerDeltaStream._equal(item, previous[key])
+                        for key, item in value.items()))
+        if isinstance(value, (list, tuple)):
+            return (type(value) is type(previous) and
+                    len(value) == len(previous) and
+                    all(SerializerDeltaStream._equal(item, previous_item)
+                        for item, previous_item in zip(value, previous)))
+        try:
+            return bool(value == previous)
+        except ValueError:
+            return False
+
+    def _encode_array(self, value, previous):
+        """Return None if unchanged, a patch of the changed elements if
+        few changed, or else the whole array or image."""
+        if self._equal(value, previous):
+            return None
+        array = self._to_array(value)
+        previous_array = self._to_array(previous)
+        if (isinstance(array, np.ndarray) and
+                type(value) is type(previous) and
+                isinstance(previous_array, np.ndarray) and
+                array.shape == previous_array.shape and
+                array.dtype == previous_array.dtype and
+                not array.dtype.hasobject):
+            flat = array.ravel()
+            indices = np.flatnonzero(flat != previous_array.ravel())
+            if indices.size <= self.PATCH_MAX_FRACTION * flat.size:
+                return {
+                    self.PATCH_KEY: indices.astype(np.uint32),
+                    self.PATCH_VALUES_KEY: flat[indices]
+                }
+        return value
+
+    def _encode_array_list(self, value_list, previous_list):
+        if len(value_list) != len(previous_list):
+            return value_list
+        return [self._encode_array(value, previous)
+                for value, previous in zip(value_list, previous_list)]
+
+    def _encode_object_list(self, object_list, previous_list):
+        previous_objects = {obj.uuid: obj for obj in previous_list}
+        return {
+            self.OBJECTS_KEY: [obj.uuid for obj in object_list],
+            self.CHANGED_KEY: [
+                obj for obj in object_list
+                if not self._equal(obj, previous_objects.get(obj.uuid))
+            ]
+        }
+
+    def serialize(self, step_metadata: StepMetadata):
+        """
+        Serializes the next step metadata of the stream into MsgPack.
+
+        Args:
+            step_metadata: MCS step metadata output.
+
+        Returns:
+            Serialized keyframe or delta frame in MsgPack format.
+        """
+        fields = {field: getattr(step_metadata, field)
+                  for field in self.STEP_FIELDS}
+        keyframe = (self._encoder_fields is None or
+                    self._encoder_index % self.keyframe_interval == 0)
+        if keyframe:
+            encoded = fields
+        else:
+            encoded = {}
+            for field, value in fields.items():
+                previous = self._encoder_fields[field]
+                if field in self.OBJECT_LIST_FIELDS:
+                    value = self._encode_object_list(value or [],
+                                                     previous or [])
+                    if (not value[self.CHANGED_KEY] and
+                            value[self.OBJECTS_KEY] ==
+                            [obj.uuid for obj in previous or []]):
+                        continue
+                elif field in self.ARRAY_LIST_FIELDS:
+                    value = self._encode_array_list(value or [],
+                                                    previous or [])
+                    if value and all(item is None for item in value):
+                        continue
+                    if not value and not previous:
+                        continue
+                elif self._equal(value, previous):
+                    continue
+                elif field in self.ARRAY_FIELDS:
+                    value = self._encode_array(value, previous)
+                encoded[field] = value
+
+        packed = msgpack.packb({
+            self.VERSION_KEY: self.version(),
+            self.KEYFRAME_KEY: keyframe,
+            self.INDEX_KEY: self._encoder_index,
+            self.FIELDS_KEY: encoded
+        }, default=SerializerMsgPack._default, strict_types=True)
+        if self.compression is not None:
+            packed = self.compression.compress(packed)
+        self._encoder_fields = fields
+        self._encoder_index += 1
+        return packed
+
+    def _decode_array(self, encoded, previous):
+        if encoded is None:
+            return previous
+        if not (isinstance(encoded, dict) and self.PATCH_KEY in encoded):
+            return encoded
+        array = np.array(self._to_array(previous))
+        array.ravel()[encoded[self.PATCH_KEY]] = encoded[
+            self.PATCH_VALUES_KEY]
+        if isinstance(previous, Image.Image):
+            return Image.fromarray(array, previous.mode)
+        return array
+
+    def deserialize(self, packed_frame):
+        """
+        Deserializes the next keyframe or delta frame of the stream.
+
+        Args:
+            packed_frame: frame from serialize.
+
+        Returns:
+            StepMetadata
+        """
+        frame = msgpack.unpackb(Compression.decompress(packed_frame),
+                                ext_hook=SerializerMsgPack._ext_hook,
+                                object_hook=SerializerMsgPack._object_hook)
+        if frame.get(self.VERSION_KEY) != self.version():
+            raise ValueError(
+                f'Unsupported delta stream version '
+                f'{frame.get(self.VERSION_KEY)}')
+        index = frame[self.INDEX_KEY]
+        encoded = frame[self.FIELDS_KEY]
+        if frame[self.KEYFRAME_KEY]:
+            fields = encoded
+        else:
+            if (self._decoder_fields is None or
+                    index != self._decoder_index + 1):
+                raise ValueError(
+                    f'Delta frame {index} does not follow frame '
+                    f'{self._decoder_index}')
+            fields = dict(self._decoder_fields)
+            for field, value in encoded.items():
+                previous = fields[field]
+                if field in self.OBJECT_LIST_FIELDS:
+                    objects = {obj.uuid: obj for obj in previous or []}
+                    objects.update({obj.uuid: obj
+                                    for obj in value[self.CHANGED_KEY]})
+                    value = [objects[uuid]
+                             for uuid in value[self.OBJECTS_KEY]]
+                elif field in self.ARRAY_LIST_FIELDS:
+                    if len(value) == len(previous or []):
+                        value = [self._decode_array(item, previous_item)
+                                 for item, previous_item in
+                                 zip(value, previous)]
+                elif (field in self.ARRAY_FIELDS and
+                        isinstance(value, dict)):
+                    # Changed fields only, so None is no array (not the
+                    # unchanged array, as in ARRAY_LIST_FIELDS)
+                    value = self._decode_array(value, previous)
+                fields[field] = value
+
+        self._decoder_fields = fields
+        self._decoder_index = index
+        return StepMetadata(**fields)
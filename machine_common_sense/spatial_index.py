@@ -0,0 +1,366 @@
+import math
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from .reward_geometry import RewardGeometry
+from .step_metadata import StepMetadata
+
+
+class SpatialIndex(object):
+    '''
+    A uniform grid index of the XZ footprints (convex hulls of the bounds
+    corners) of the objects in a scene, for reachability and collision
+    queries: the objects within a distance of a point, the objects at a
+    point (like inside a wall), the nearest object, and the first object
+    along a heading. Update it each step with the new object lists; only
+    objects with new bounds are hulled and moved between grid cells again.
+
+    Hulls come from (and share the cache of) RewardGeometry, so query
+    distances match the rewards. The controller keeps one of these for
+    the reward calculations; an agent can keep its own, updated from each
+    StepMetadata (with whatever objects its metadata tier shows it).
+    '''
+
+    DEFAULT_CELL_SIZE = 1.0
+
+    # Hull edges per object (the XZ hull of 8 bounds corners has at most 8)
+    MAX_EDGES = 8
+
+    def __init__(self, cell_size: float = DEFAULT_CELL_SIZE,
+                 capacity: int = 64):
+        self.cell_size = cell_size
+        # uuid to (corners key, slot, cells)
+        self._entries = {}
+        self._hulls = {}
+        # (column, row) to set of uuid
+        self._cells = {}
+        # Per slot: the edge start x and z, direction x and z, and squared
+        # length (as RewardGeometry._edge_data) of each hull, padded with
+        # its first edge; the bounding box; whether the hull is a polygon
+        # (not a point or segment); and whether the object is structural
+        self._uuids = []
+        self._free = []
+        self._edges = np.zeros((0, 5, self.MAX_EDGES))
+        self._bounds = np.zeros((0, 4))
+        self._polygon = np.zeros(0, dtype=bool)
+        self._structural = np.zeros(0, dtype=bool)
+        self._grow(capacity)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, uuid: str) -> bool:
+        return uuid in self._entries
+
+    def _grow(self, capacity: int) -> None:
+        extra = capacity - len(self._uuids)
+        self._free.extend(range(capacity - 1, len(self._uuids) - 1, -1))
+        self._uuids.extend([None] * extra)
+        self._edges = np.concatenate(
+            [self._edges, np.zeros((extra, 5, self.MAX_EDGES))])
+        self._edges[-extra:, 4] = 1.0
+        self._bounds = np.concatenate([self._bounds, np.zeros((extra, 4))])
+        self._polygon = np.concatenate(
+            [self._polygon, np.zeros(extra, dtype=bool)])
+        self._structural = np.concatenate(
+            [self._structural, np.zeros(extra, dtype=bool)])
+
+    def clear(self) -> None:
+        for uuid in list(self._entries):
+            self.remove_object(uuid)
+
+    def _cell_range(self, min_x: float, min_z: float, max_x: float,
+                    max_z: float) -> Iterable[Tuple[int, int]]:
+        size = self.cell_size
+        return (
+            (column, row)
+            for column in range(math.floor(min_x / size),
+                                math.floor(max_x / size) + 1)
+            for row in range(math.floor(min_z / size),
+                             math.floor(max_z / size) + 1)
+        )
+
+    def update_object(self, uuid: str, corners: List[Dict],
+                      structural: bool = False) -> bool:
+        '''
+        Add or move the object with the given ID and bounds corners (dicts
+        with "x" and "z"); objects without corners are removed.
+
+        Returns:
+            bool: whether the object is new or has new bounds
+        '''
+        if not corners:
+            return self.remove_object(uuid)
+        key = RewardGeometry.corners_key(corners)
+        entry = self._entries.get(uuid)
+        if entry is not None and entry[0] == key:
+            self._structural[entry[1]] = structural
+            return False
+        if entry is not None:
+            self._remove_cells(uuid, entry[2])
+            slot = entry[1]
+        else:
+            if not self._free:
+                self._grow(len(self._uuids) * 2)
+            slot = self._free.pop()
+        hull = RewardGeometry.corners_hull(corners, key)
+        edges = np.array(RewardGeometry._edges(hull))
+        self._edges[slot] = edges[:, np.arange(self.MAX_EDGES) % len(hull)]
+        minimum = hull.min(axis=0)
+        maximum = hull.max(axis=0)
+        bounds = (minimum[0], minimum[1], maximum[0], maximum[1])
+        self._bounds[slot] = bounds
+        self._polygon[slot] = len(hull) >= 3
+        self._structural[slot] = structural
+        self._uuids[slot] = uuid
+        cells = list(self._cell_range(*bounds))
+        for cell in cells:
+            self._cells.setdefault(cell, set()).add(uuid)
+        self._entries[uuid] = (key, slot, cells)
+        self._hulls[uuid] = hull
+        return True
+
+    def _remove_cells(self, uuid: str, cells: List[Tuple[int, int]]) -> None:
+        for cell in cells:
+            uuid_set = self._cells.get(cell)
+            if uuid_set is not None:
+                uuid_set.discard(uuid)
+                if not uuid_set:
+                    del self._cells[cell]
+
+    def remove_object(self, uuid: str) -> bool:
+        '''Remove the object with the given ID, returning whether it was
+        in the index.'''
+        entry = self._entries.pop(uuid, None)
+        if entry is None:
+            return False
+        self._remove_cells(uuid, entry[2])
+        del self._hulls[uuid]
+        self._uuids[entry[1]] = None
+        self._free.append(entry[1])
+        return True
+
+    def _update(self, object_list: Iterable[Tuple[str, List[Dict], bool]]
+                ) -> List[str]:
+        changed = []
+        seen = set()
+        for uuid, corners, structural in object_list:
+            # The first object with each ID, as in the rewards
+            if uuid in seen:
+                continue
+            seen.add(uuid)
+            if self.update_object(uuid, corners, structural):
+                changed.append(uuid)
+        for uuid in [uuid for uuid in self._entries if uuid not in seen]:
+            self.remove_object(uuid)
+            changed.append(uuid)
+        return changed
+
+    def update(self, object_list: List, structural_object_list: List = None
+               ) -> List[str]:
+        '''
+        Update the index to the given ObjectMetadata lists (like the
+        object_list and structural_object_list of a StepMetadata): add
+        new objects, move objects with new bounds, and remove objects no
+        longer in either list.
+
+        Returns:
+            list: the IDs of the added, moved and removed objects
+        '''
+        return self._update(
+            [(obj.uuid, obj.dimensions, False)
+             for obj in object_list or []] +
+            [(obj.uuid, obj.dimensions, True)
+             for obj in structural_object_list or []])
+
+    def update_from_step(self, step_metadata: StepMetadata) -> List[str]:
+        '''Update the index to the objects of the given step output (see
+        update).'''
+        return self.update(step_metadata.object_list,
+                           step_metadata.structural_object_list)
+
+    def update_from_metadata(self, objects: List[Dict],
+                             structural_objects: List[Dict] = None
+                             ) -> List[str]:
+        '''Update the index to the given AI2-THOR object dictionaries
+        (with "objectId" and "objectBounds"), as in update.'''
+        return self._update(
+            [(obj['objectId'],
+              (obj.get('objectBounds') or {}).get('objectBoundsCorners'),
+              structural)
+             for object_list, structural in ((objects, False),
+                                             (structural_objects, True))
+             for obj in object_list or []])
+
+    def hull(self, uuid: str) -> Optional[np.ndarray]:
+        '''Return the (N, 2) XZ hull of the object with the given ID, or
+        None if it is not in the index.'''
+        return self._hulls.get(uuid)
+
+    def is_structural(self, uuid: str) -> bool:
+        entry = self._entries.get(uuid)
+        return entry is not None and bool(self._structural[entry[1]])
+
+    def distance(self, uuid: str, point) -> Optional[float]:
+        '''Return the XZ distance from the point to the footprint of the
+        object with the given ID (0 if inside it), or None if it is not in
+        the index.'''
+        entry = self._entries.get(uuid)
+        if entry is None:
+            return None
+        return float(self._distances(np.array([entry[1]]), *point)[0])
+
+    def _candidates(self, min_x: float, min_z: float, max_x: float,
+                    max_z: float, structural: Optional[bool],
+                    ignore: Iterable[str] = ()) -> np.ndarray:
+        found = set()
+        for cell in self._cell_range(min_x, min_z, max_x, max_z):
+            found.update(self._cells.get(cell, ()))
+        found.difference_update(ignore)
+        slots = np.fromiter((self._entries[uuid][1] for uuid in found),
+                            dtype=np.intp, count=len(found))
+        # Cheap bounding box test before any edges
+        bounds = self._bounds[slots]
+        keep = ((bounds[:, 0] <= max_x) & (bounds[:, 2] >= min_x) &
+                (bounds[:, 1] <= max_z) & (bounds[:, 3] >= min_z))
+        if structural is not None:
+            keep &= self._structural[slots] == structural
+        return slots[keep]
+
+    def _inside(self, slots: np.ndarray, x: float, z: float) -> np.ndarray:
+        start_x, start_z, direction_x, direction_z, _ = \
+            self._edges[slots].transpose(1, 0, 2)
+        # As RewardGeometry.points_in_polygon, for each slot
+        return self._polygon[slots] & (
+            direction_x * (z - start_z) - direction_z * (x - start_x) >= 0
+        ).all(axis=1)
+
+    def _distances(self, slots: np.ndarray, x: float, z: float
+                   ) -> np.ndarray:
+        start_x, start_z, direction_x, direction_z, length_squared = \
+            self._edges[slots].transpose(1, 0, 2)
+        # As RewardGeometry.points_distance, for each slot
+        offset_x = x - start_x
+        offset_z = z - start_z
+        t = (offset_x * direction_x + offset_z * direction_z) / length_squared
+        np.clip(t, 0.0, 1.0, out=t)
+        offset_x -= t * direction_x
+        offset_z -= t * direction_z
+        distances = np.sqrt(offset_x * offset_x +
+                            offset_z * offset_z).min(axis=1)
+        distances[self._inside(slots, x, z)] = 0.0
+        return distances
+
+    def _sorted(self, slots: np.ndarray, values: np.ndarray
+                ) -> List[Tuple[str, float]]:
+        return sorted(
+            ((self._uuids[slot], value)
+             for slot, value in zip(slots.tolist(), values.tolist())),
+            key=lambda item: (item[1], item[0]))
+
+    def objects_within(self, point, distance: float,
+                       structural: Optional[bool] = None,
+                       ignore: Iterable[str] = ()
+                       ) -> List[Tuple[str, float]]:
+        '''
+        Return the objects within the distance (like MAX_REACH_DISTANCE)
+        of the XZ point.
+
+        Args:
+            point: (x, z)
+            distance: maximum distance to each footprint
+            structural: only structural (True) or non-structural (False)
+                objects, or both (None)
+            ignore: object IDs to skip (like a held object)
+
+        Returns:
+            list: (uuid, distance) tuples, nearest first
+        '''
+        x, z = point
+        slots = self._candidates(x - distance, z - distance, x + distance,
+                                 z + distance, structural, ignore)
+        if not len(slots):
+            return []
+        distances = self._distances(slots, x, z)
+        within = distances <= distance
+        return self._sorted(slots[within], distances[within])
+
+    def objects_at(self, point, structural: Optional[bool] = None
+                   ) -> List[str]:
+        '''Return the IDs of the objects whose footprint contains the XZ
+        point (like the walls at a point, with structural=True).'''
+        return [uuid for uuid, _ in self.objects_within(point, 0.0,
+                                                        structural)]
+
+    def nearest(self, point, structural: Optional[bool] = None,
+                ignore: Iterable[str] = ()) -> Optional[Tuple[str, float]]:
+        '''Return the (uuid, distance) of the object nearest the XZ point,
+        or None if there is none.'''
+        if not self._cells:
+            return None
+        columns = [cell[0] for cell in self._cells]
+        rows = [cell[1] for cell in self._cells]
+        x, z = point
+        # Far enough to reach every indexed cell from the point
+        limit = math.hypot(
+            max(abs(x - min(columns) * self.cell_size),
+                abs(x - (max(columns) + 1) * self.cell_size)),
+            max(abs(z - min(rows) * self.cell_size),
+                abs(z - (max(rows) + 1) * self.cell_size)))
+        ignore = set(ignore)
+        radius = self.cell_size
+        while True:
+            found = self.objects_within(point, radius, structural, ignore)
+            if found:
+                return found[0]
+            if radius > limit:
+                return None
+            radius *= 2
+
+    def raycast(self, origin, rotation: float, max_distance: float,
+                structural: Optional[bool] = None,
+                ignore: Iterable[str] = ()) -> Optional[Tuple[str, float]]:
+        '''
+        Return the first object along a heading.
+
+        Args:
+            origin: (x, z) start of the ray
+            rotation: heading in degrees, like the StepMetadata rotation
+                (0 faces positive Z and 90 faces positive X)
+            max_distance: length of the ray
+            structural: only structural (True) or non-structural (False)
+                objects, or both (None)
+            ignore: object IDs to skip (like a held object)
+
+        Returns:
+            tuple: the (uuid, distance along the ray) of the nearest object
+                the ray crosses (distance 0 if the origin is inside it), or
+                None
+        '''
+        x, z = origin
+        ray_x = math.sin(math.radians(rotation))
+        ray_z = math.cos(math.radians(rotation))
+        end_x = x + ray_x * max_distance
+        end_z = z + ray_z * max_distance
+        slots = self._candidates(min(x, end_x), min(z, end_z),
+                                 max(x, end_x), max(z, end_z), structural,
+                                 ignore)
+        if not len(slots):
+            return None
+        start_x, start_z, direction_x, direction_z, _ = \
+            self._edges[slots].transpose(1, 0, 2)
+        # Solve origin + t * ray = start + s * direction for each edge
+        denominator = ray_x * direction_z - ray_z * direction_x
+        offset_x = start_x - x
+        offset_z = start_z - z
+        with np.errstate(divide='ignore', invalid='ignore'):
+            t = (offset_x * direction_z - offset_z * direction_x) / \
+                denominator
+            s = (offset_x * ray_z - offset_z * ray_x) / denominator
+        crossed = (denominator != 0) & (t >= 0) & (s >= 0) & (s <= 1)
+        distances = np.where(crossed, t, np.inf).min(axis=1)
+        distances[self._inside(slots, x, z)] = 0.0
+        hit = distances <= max_distance
+        found = self._sorted(slots[hit], distances[hit])
+        return found[0] if found else None
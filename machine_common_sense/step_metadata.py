@@ -1,4 +1,5 @@
 from .goal_metadata import GoalMetadata
+from .object_masks import ObjectMaskTable
 from .pose import Pose
 from .return_status import ReturnStatus
 from .util import Util
@@ -59,6 +60,14 @@ class StepMetadata:
         scene with a scripted Previous Phase.
         The color of each object in the mask corresponds to the "color"
         property in its ObjectMetadata object.
+    occupancy_grid : 2D numpy array or None
+        If the "occupancy_grid" config option is on, a grid of the floor
+        around you, with -1 (unknown), 0 (free) or 1 (occupied) in each
+        cell. At the oracle metadata tier, it covers the whole room (rows
+        along Z and columns along X, from the room's minimum corner) and
+        comes from all the objects; at other metadata tiers, it covers what
+        is in front of you (you are at the middle of row 0, facing along
+        the rows) and comes from the depth map.
     pose : string
         Your current pose. Either "STANDING", "CRAWLING", or "LYING".
     position : dict
@@ -95,6 +104,8 @@ class StepMetadata:
         image_list=None,
         object_list=None,
         object_mask_list=None,
+        object_mask_table=None,
+        occupancy_grid=None,
         pose=Pose.UNDEFINED.value,
         position=None,
         return_status=ReturnStatus.UNDEFINED.value,
@@ -124,6 +135,7 @@ class StepMetadata:
         self.object_mask_list = (
             [] if object_mask_list is None else object_mask_list
         )
+        self.occupancy_grid = occupancy_grid
         self.pose = pose
         self.position = {} if position is None else position
         self.return_status = return_status
@@ -132,10 +144,43 @@ class StepMetadata:
         self.step_number = step_number
         self.structural_object_list = [
         ] if structural_object_list is None else structural_object_list
+        # Per-scene object mask color table, and analyses by mask index
+        self._object_mask_table = object_mask_table
+        self._object_mask_stats = {}
 
     def __str__(self):
         return Util.class_to_str(self)
 
+    def analyze_object_mask(self, index=-1):
+        """
+        Return the pixel count, bounding box and centroid of each object in
+        an object mask in the object_mask_list, computed the first time it
+        is needed. The objects are those in the scene's color table (given
+        by the controller), or else in the object_list and
+        structural_object_list, or else (like at metadata tiers without
+        object IDs) each distinct color in the mask.
+
+        Parameters
+        ----------
+        index : int, optional
+            Which object mask in the object_mask_list (default the last).
+
+        Returns
+        -------
+        ObjectMaskStats
+        """
+        if index < 0:
+            index += len(self.object_mask_list)
+        stats = self._object_mask_stats.get(index)
+        if stats is None:
+            if self._object_mask_table is None:
+                self._object_mask_table = ObjectMaskTable.from_objects(
+                    self.object_list + self.structural_object_list)
+            stats = self._object_mask_table.analyze(
+                self.object_mask_list[index])
+            self._object_mask_stats[index] = stats
+        return stats
+
     def check_list_none(self, obj_list):
         if obj_list is None:
             return None
@@ -153,6 +198,7 @@ class StepMetadata:
         yield 'goal', dict(self.goal)
         yield 'head_tilt', self.head_tilt
         yield 'object_list', self.check_list_none(self.object_list)
+        yield 'occupancy_grid', self.occupancy_grid
         yield 'pose', self.pose
         yield 'position', self.position
         yield 'return_status', self.return_status
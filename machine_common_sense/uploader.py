@@ -1,24 +1,66 @@
+import abc
+import concurrent.futures
+import contextlib
 import io
+import json
+import os
 import pathlib
+import shutil
+import threading
+import uuid
+
+from typing import Dict, List
 
 import boto3
-import PIL
+import botocore.config
+import boto3.s3.transfer
+import PIL.Image
 
+from .compression import Compression
 
-class S3Uploader():
-    '''Upload evaluation files to an AWS S3 bucket.
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+# Number of files an UploadManager uploads at once
+DEFAULT_UPLOAD_WORKERS = 4
+
+# Shared S3 client; boto3 clients are thread safe, so reuse a single one
+# (and its connection pool) for every upload in the process.
+_s3_client = None
+_s3_client_pool_size = 0
+_s3_client_lock = threading.Lock()
 
-    Leverages the AWS credentials written from the controller's configuration.
-    '''
+
+def get_s3_client(max_pool_connections: int = 10):
+    '''Return the pooled boto3 S3 client, creating it on first use, or
+    again if its connection pool is smaller than max_pool_connections.'''
+    global _s3_client, _s3_client_pool_size
+    with _s3_client_lock:
+        if (_s3_client is None or
+                _s3_client_pool_size < max_pool_connections):
+            _s3_client = boto3.client(
+                's3',
+                config=botocore.config.Config(
+                    max_pool_connections=max_pool_connections
+                )
+            )
+            _s3_client_pool_size = max_pool_connections
+        return _s3_client
+
+
+class Uploader(abc.ABC):
+    '''Base class for uploading evaluation files to a storage backend.'''
 
     def __init__(self, s3_bucket: str):
-        self.client = boto3.client('s3')
         self.bucket = s3_bucket
 
     def upload_video(self,
                      video_path: pathlib.Path,
                      s3_filename: str) -> None:
-        '''Uploads mp4 video files from disk to AWS S3
+        '''Uploads mp4 video files from disk
 
         Args:
             video_path (pathlib.Path): path to video file
@@ -27,10 +69,8 @@ class S3Uploader():
         Returns:
             None
         '''
-        print(f"Uploading {video_path} to {self.bucket} as {s3_filename}")
-        self._upload_file(
+        self.upload_file(
             filepath=video_path,
-            bucket=self.bucket,
             s3_filename=s3_filename,
             mimetype='video/mp4'
         )
@@ -38,7 +78,7 @@ class S3Uploader():
     def upload_image(self,
                      image: PIL.Image.Image,
                      s3_filename: str) -> None:
-        '''Uploads in-memory PIL images to AWS S3
+        '''Uploads in-memory PIL images
 
         Args:
             image (PIL.Image.Image): image bytes to upload
@@ -61,7 +101,7 @@ class S3Uploader():
     def upload_history(self,
                        history_path: pathlib.Path,
                        s3_filename: str) -> None:
-        '''Uploads scene history from disk to AWS S3
+        '''Uploads scene history from disk
 
         Args:
             history_path (pathlib.Path): path to history json file
@@ -70,20 +110,86 @@ class S3Uploader():
         Returns:
             None
         '''
-        print(f"Uploading {history_path} to {self.bucket} as {s3_filename}")
-        self._upload_file(
+        self.upload_file(
             filepath=history_path,
-            bucket=self.bucket,
             s3_filename=s3_filename,
             mimetype='application/json'
         )
 
+    def upload_file(self,
+                    filepath: pathlib.Path,
+                    s3_filename: str,
+                    mimetype: str) -> None:
+        '''Uploads any file from disk
+
+        Args:
+            filepath (pathlib.Path): the file path on disk
+            s3_filename (str): name to give file in s3
+            mimetype (str): mimetype for the file to upload
+
+        Returns:
+            None
+        '''
+        print(f"Uploading {filepath} to {self.bucket} as {s3_filename}")
+        self._upload_file(
+            filepath=filepath,
+            bucket=self.bucket,
+            s3_filename=s3_filename,
+            mimetype=mimetype
+        )
+
+    @abc.abstractmethod
+    def _upload_file(self,
+                     filepath: pathlib.Path,
+                     bucket: str,
+                     s3_filename: str,
+                     mimetype: str) -> None:
+        pass
+
+    @abc.abstractmethod
+    def _upload_object(self,
+                       in_memory_file: io.BytesIO,
+                       bucket: str,
+                       s3_filename: str,
+                       mimetype: str) -> None:
+        pass
+
+
+class S3Uploader(Uploader):
+    '''Upload evaluation files to an AWS S3 bucket.
+
+    Leverages the AWS credentials written from the controller's configuration.
+    Large files are sent as concurrent multipart transfers.
+    '''
+
+    TRANSFER_CONFIG = boto3.s3.transfer.TransferConfig(
+        multipart_threshold=8 * 1024 * 1024,
+        multipart_chunksize=8 * 1024 * 1024,
+        max_concurrency=4
+    )
+
+    def __init__(self, s3_bucket: str, client=None,
+                 max_workers: int = DEFAULT_UPLOAD_WORKERS):
+        '''
+        Args:
+            s3_bucket (str): the S3 bucket to upload to
+            client: boto3 S3 client (default: the shared pooled client)
+            max_workers (int): number of files uploaded at once (like by an
+                UploadManager), to size the connection pool for
+        '''
+        super().__init__(s3_bucket)
+        self.client = get_s3_client(
+            max_workers * self.TRANSFER_CONFIG.max_concurrency
+        ) if client is None else client
+
     def _upload_file(self,
                      filepath: pathlib.Path,
                      bucket: str,
                      s3_filename: str,
                      mimetype: str) -> None:
-        '''Upload a file from disk to AWS S3 bucket
+        '''Upload a file from disk to AWS S3 bucket, with the ContentEncoding
+        (or, like for xz, the ContentType) of its compressed file extension
+        (if any)
 
         Args:
             filepath (pathlib.Path): the file path on disk
@@ -94,14 +200,23 @@ class S3Uploader():
         Returns:
             None
         '''
+        extra_args = {
+            'ACL': 'public-read',
+            'ContentType': mimetype,
+        }
+        content_encoding = Compression.content_encoding_for_path(filepath)
+        if content_encoding is not None:
+            extra_args['ContentEncoding'] = content_encoding
+        # Files compressed without a Content-Encoding are the compressed type
+        compressed_mimetype = Compression.mimetype_for_path(filepath)
+        if compressed_mimetype is not None:
+            extra_args['ContentType'] = compressed_mimetype
         self.client.upload_file(
             str(filepath),
             bucket,
             s3_filename,
-            ExtraArgs={
-                'ACL': 'public-read',
-                'ContentType': mimetype,
-            }
+            ExtraArgs=extra_args,
+            Config=self.TRANSFER_CONFIG
         )
 
     def _upload_object(self,
@@ -127,5 +242,291 @@ class S3Uploader():
             ExtraArgs={
                 'ACL': 'public-read',
                 'ContentType': mimetype,
-            }
+            },
+            Config=self.TRANSFER_CONFIG
         )
+
+
+class LocalUploader(Uploader):
+    '''Stand-in for S3Uploader that "uploads" evaluation files into a local
+    directory (one subdirectory per bucket), for testing without AWS.'''
+
+    def __init__(self, directory: str, s3_bucket: str = 'local'):
+        super().__init__(s3_bucket)
+        self.directory = pathlib.Path(directory)
+
+    def _destination(self, bucket: str, s3_filename: str) -> pathlib.Path:
+        destination = self.directory / bucket / s3_filename
+        destination.parent.mkdir(parents=True, exist_ok=True)
+        return destination
+
+    def _upload_file(self,
+                     filepath: pathlib.Path,
+                     bucket: str,
+                     s3_filename: str,
+                     mimetype: str) -> None:
+        '''Copy a file from disk into the local bucket directory'''
+        destination = self._destination(bucket, s3_filename)
+        # Copy then rename so a crash never leaves a partial "upload"
+        partial = destination.with_name(destination.name + '.partial')
+        shutil.copyfile(str(filepath), str(partial))
+        os.replace(str(partial), str(destination))
+
+    def _upload_object(self,
+                       in_memory_file: io.BytesIO,
+                       bucket: str,
+                       s3_filename: str,
+                       mimetype: str) -> None:
+        '''Write an in-memory file object into the local bucket directory'''
+        destination = self._destination(bucket, s3_filename)
+        partial = destination.with_name(destination.name + '.partial')
+        with open(partial, 'wb') as output_file:
+            shutil.copyfileobj(in_memory_file, output_file)
+        os.replace(str(partial), str(destination))
+
+
+class UploadManager():
+    '''Upload files concurrently through an Uploader, recording each upload
+    in an on-disk journal so that uploads still pending after a crash (or a
+    failure) can be resumed later.
+
+    The journal is a JSON lines file: a "pending" record is appended (and
+    synced) before each upload starts and a "done" record once it succeeds.
+    The done records are dropped when the journal is compacted: on resume,
+    on shutdown, and whenever it doubles in size past COMPACT_SIZE.
+    The journal may be shared by any number of managers and processes:
+    each pending record names the manager that owns it, and each manager
+    holds a lock on its own file in the journal's ".locks" directory while
+    it runs, so resume() only takes over the uploads of managers that have
+    stopped (or crashed). Every journal read and write holds a lock on the
+    journal too. Without fcntl (like on Windows), these locks only work
+    between the managers in one process.
+    '''
+
+    DEFAULT_JOURNAL_FILE = 'mcs_upload_journal.jsonl'
+    JOURNAL_PENDING = 'pending'
+    JOURNAL_DONE = 'done'
+    # Compact the journal once it grows past this size (in bytes) and
+    # twice its size after the last compaction
+    COMPACT_SIZE = 1024 * 1024
+    LOCK_DIRECTORY_SUFFIX = '.locks'
+    JOURNAL_LOCK_FILE = 'journal.lock'
+
+    # Owners of the managers running in this process
+    _live_owners = set()
+
+    def __init__(self,
+                 uploader: Uploader,
+                 journal_path: str = None,
+                 max_workers: int = DEFAULT_UPLOAD_WORKERS):
+        self.uploader = uploader
+        self.journal_path = pathlib.Path(
+            self.DEFAULT_JOURNAL_FILE if journal_path is None
+            else journal_path)
+        self.lock_directory = self.journal_path.with_name(
+            self.journal_path.name + self.LOCK_DIRECTORY_SUFFIX)
+        self.owner = uuid.uuid4().hex
+        self._journal_lock = threading.Lock()
+        self._compacted_size = 0
+        self._owner_lock_file = None
+        if fcntl is not None:
+            self.lock_directory.mkdir(parents=True, exist_ok=True)
+            self._owner_lock_file = open(self._owner_lock_path(self.owner),
+                                         'w')
+            fcntl.flock(self._owner_lock_file, fcntl.LOCK_EX)
+        UploadManager._live_owners.add(self.owner)
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=max_workers)
+
+    def submit(self,
+               filepath: pathlib.Path,
+               s3_filename: str,
+               mimetype: str) -> concurrent.futures.Future:
+        '''Journal and start the upload of a file from disk.
+
+        Args:
+            filepath (pathlib.Path): the file path on disk
+            s3_filename (str): name to give file in s3
+            mimetype (str): mimetype for the file to upload
+
+        Returns:
+            concurrent.futures.Future: completes when the upload succeeds
+            or raises its error
+        '''
+        entry = {
+            'id': uuid.uuid4().hex,
+            'bucket': self.uploader.bucket,
+            'filepath': str(filepath),
+            's3_filename': s3_filename,
+            'mimetype': mimetype
+        }
+        self._append_journal(self.JOURNAL_PENDING, entry, self.owner)
+        return self._executor.submit(self._upload, entry)
+
+    def _upload(self, entry: Dict) -> None:
+        self.uploader.upload_file(
+            filepath=entry['filepath'],
+            s3_filename=entry['s3_filename'],
+            mimetype=entry['mimetype']
+        )
+        self._append_journal(self.JOURNAL_DONE, {'id': entry['id']})
+
+    def pending(self) -> List[Dict]:
+        '''Return the journaled uploads that have not yet succeeded.'''
+        with self._locked_journal():
+            return [record['entry']
+                    for record in self._read_journal().values()]
+
+    def resume(self) -> List[concurrent.futures.Future]:
+        '''Take over and restart every pending upload to this manager's
+        bucket left by a manager that is no longer running, if its file
+        still exists on disk, after compacting the journal. The uploads of
+        other buckets and running managers stay in the journal.
+
+        Returns:
+            list of concurrent.futures.Future, one per restarted upload
+        '''
+        with self._locked_journal():
+            record_list = []
+            entry_list = []
+            stopped_owners = set()
+            for record in self._read_journal().values():
+                entry = record['entry']
+                owner = record.get('owner')
+                if (entry.get('bucket', self.uploader.bucket) !=
+                        self.uploader.bucket or owner == self.owner or
+                        self._owner_running(owner)):
+                    record_list.append(record)
+                    continue
+                if owner is not None:
+                    stopped_owners.add(owner)
+                # Drop the no longer uploadable records
+                if os.path.exists(entry['filepath']):
+                    entry_list.append(entry)
+                    record_list.append(self._pending_record(
+                        entry, self.owner))
+            # Drop the done records
+            self._write_journal(record_list)
+            for owner in stopped_owners:
+                self._remove_owner_lock(owner)
+        return [self._executor.submit(self._upload, entry)
+                for entry in entry_list]
+
+    def compact(self) -> None:
+        '''Rewrite the journal with only its pending uploads.'''
+        with self._locked_journal():
+            if self.journal_path.exists():
+                self._write_journal(
+                    list(self._read_journal().values()))
+
+    def shutdown(self, wait: bool = True) -> None:
+        self._executor.shutdown(wait=wait)
+        # Keep owning the pending uploads that are still running
+        if wait:
+            self.compact()
+            UploadManager._live_owners.discard(self.owner)
+            if self._owner_lock_file is not None:
+                self._owner_lock_file.close()
+                self._owner_lock_file = None
+                self._remove_owner_lock(self.owner)
+
+    def _owner_lock_path(self, owner: str) -> pathlib.Path:
+        return self.lock_directory / (owner + '.lock')
+
+    def _remove_owner_lock(self, owner: str) -> None:
+        try:
+            os.remove(self._owner_lock_path(owner))
+        except OSError:
+            pass
+
+    def _owner_running(self, owner: str) -> bool:
+        '''Return whether the manager with the given owner (which may be in
+        another process) is still running.'''
+        if owner is None:
+            return False
+        if owner in UploadManager._live_owners:
+            return True
+        if fcntl is None:
+            return False
+        try:
+            lock_file = open(self._owner_lock_path(owner))
+        except OSError:
+            # Removed when its manager shut down
+            return False
+        with lock_file:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                return True
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+        return False
+
+    @contextlib.contextmanager
+    def _locked_journal(self):
+        with self._journal_lock:
+            if fcntl is None:
+                yield
+                return
+            self.lock_directory.mkdir(parents=True, exist_ok=True)
+            with open(self.lock_directory / self.JOURNAL_LOCK_FILE,
+                      'a') as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _pending_record(self, entry: Dict, owner: str = None) -> Dict:
+        record = {
+            'status': self.JOURNAL_PENDING,
+            'id': entry['id'],
+            'entry': entry
+        }
+        if owner is not None:
+            record['owner'] = owner
+        return record
+
+    def _read_journal(self) -> Dict[str, Dict]:
+        pending = {}
+        if not self.journal_path.exists():
+            return pending
+        with open(self.journal_path) as journal_file:
+            for line in journal_file:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # Partial line from a crash mid-write
+                    continue
+                if record.get('status') == self.JOURNAL_PENDING:
+                    pending[record['id']] = record
+                elif record.get('status') == self.JOURNAL_DONE:
+                    pending.pop(record['id'], None)
+        return pending
+
+    def _write_journal(self, record_list: List[Dict]) -> None:
+        partial = self.journal_path.with_name(
+            self.journal_path.name + '.partial')
+        with open(partial, 'w') as journal_file:
+            for record in record_list:
+                journal_file.write(json.dumps(record) + '\n')
+            journal_file.flush()
+            os.fsync(journal_file.fileno())
+        os.replace(str(partial), str(self.journal_path))
+        self._compacted_size = self.journal_path.stat().st_size
+
+    def _append_journal(self, status: str, entry: Dict,
+                        owner: str = None) -> None:
+        if status == self.JOURNAL_PENDING:
+            record = self._pending_record(entry, owner)
+        else:
+            record = {'status': status, 'id': entry['id']}
+        with self._locked_journal():
+            self.journal_path.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.journal_path, 'a') as journal_file:
+                journal_file.write(json.dumps(record) + '\n')
+                journal_file.flush()
+                os.fsync(journal_file.fileno())
+                size = os.fstat(journal_file.fileno()).st_size
+            if size > max(self.COMPACT_SIZE, 2 * self._compacted_size):
+                # Drop the done records
+                self._write_journal(list(self._read_journal().values()))
@@ -217,6 +217,29 @@ class Util:
                     ' needs to be a number. Will be set to 0.')
             return False
 
+    @staticmethod
+    def json_default(value):
+        """
+        Converts the given value, which the json module cannot serialize,
+        into one it can.  Use as the default argument of json.dumps.
+
+        Parameters
+        ----------
+        value :
+            The input value.
+
+        Returns
+        -------
+        list, number, or string
+            NumPy arrays become lists, NumPy numbers become numbers, and any
+            other value becomes its string.
+        """
+        if isinstance(value, numpy.ndarray):
+            return value.tolist()
+        if isinstance(value, numpy.generic):
+            return value.item()
+        return str(value)
+
     @staticmethod
     def value_to_str(input_value, depth=0):
         """
@@ -0,0 +1,22 @@
+#!/usr/bin/env python3
+
+import argparse
+
+from machine_common_sense.history_columns import HistoryColumns
+
+
+def main(args):
+    for npz_path in HistoryColumns.convert_directory(args.folder,
+                                                     args.output):
+        print(npz_path)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Convert scene history files into columnar .npz files'
+    )
+    parser.add_argument('folder', help='Scene history folder '
+                        '(like SCENE_HISTORY)')
+    parser.add_argument('--output', default=None,
+                        help='Output folder (default: same folder)')
+    main(parser.parse_args())
@@ -1,12 +1,27 @@
 import argparse
-import subprocess
-import os
+import concurrent.futures
+import multiprocessing
+import multiprocessing.util
 import pathlib
-import shutil
 
-from typing import List
+from typing import Iterator, List
+
+import cv2
+import numpy as np
 
 import machine_common_sense as mcs
+from machine_common_sense.recorder import VideoRecorder
+
+QUARTET_SIZE = 4
+TILE_WIDTH = 320
+TILE_HEIGHT = 240
+# Quartet member index to (row, column) in the 2x2 grid
+TILE_POSITIONS = [(0, 0), (0, 1), (1, 0), (1, 1)]
+
+# Controllers owned by the current (worker) process, one per quartet member
+_controllers = []
+# Why the current (worker) process has no controllers
+_controllers_error = None
 
 
 def parse_args():
@@ -23,11 +38,17 @@ def parse_args():
                         '--engine',
                         required=True,
                         help="Path to Unity runtime")
+    parser.add_argument('-w',
+                        '--workers',
+                        type=int,
+                        default=1,
+                        help="Number of quartets to process concurrently "
+                             "(each runs four Unity instances)")
     return parser.parse_args()
 
 
-def run_scene(controller, file_name: str) -> None:
-    '''Run the passive physics scene to generate the image frames'''
+def run_scene(controller, file_name: str) -> Iterator[List]:
+    '''Run the passive physics scene and yield each step's image list'''
     scene_data, status = mcs.load_scene_json_file(file_name)
 
     if status is not None:
@@ -46,61 +67,158 @@ def run_scene(controller, file_name: str) -> None:
             last_step = scene_data['goal']['last_step']
 
     output = controller.start_scene(scene_data)
+    yield output.image_list
 
     for i in range(output.step_number + 1, last_step + 1):
         action = output.action_list[len(output.action_list) - 1]
         output = controller.step(action)
+        if output is None:
+            break
+        yield output.image_list
+
+    controller.end_scene("", 1)
 
 
 def list_quartets(input_dir: str) -> List:
     '''From the input directory, list the non-debug quartet files'''
     files = list(sorted(pathlib.Path(input_dir).glob('*[!debug].json')))
     num_files = len(files)
-    if num_files % 4 != 0:
+    if num_files % QUARTET_SIZE != 0:
         raise ValueError('Number of scene files is not a multiple of 4')
     # TODO not ensuring the same basename
-    quartets = [files[x:x + 4] for x in range(0, num_files, 4)]
+    quartets = [files[x:x + QUARTET_SIZE]
+                for x in range(0, num_files, QUARTET_SIZE)]
     return quartets
 
 
-def cleanup(quartet: List) -> None:
-    '''Remove quartet directories and images'''
-    for q in quartet:
-        shutil.rmtree(str(q.stem), ignore_errors=True)
+def tile_frames(frames: List) -> np.ndarray:
+    '''Tile the four quartet frames into a single 2x2 grid frame (leaving
+    the tile of a missing (None) frame black)'''
+    grid = np.zeros((TILE_HEIGHT * 2, TILE_WIDTH * 2, 3), dtype=np.uint8)
+    for (row, column), frame in zip(TILE_POSITIONS, frames):
+        if frame is None:
+            continue
+        y = row * TILE_HEIGHT
+        x = column * TILE_WIDTH
+        grid[y:y + TILE_HEIGHT, x:x + TILE_WIDTH] = cv2.resize(
+            np.asarray(frame)[:, :, :3],
+            (TILE_WIDTH, TILE_HEIGHT),
+            interpolation=cv2.INTER_AREA)
+    return grid
+
+
+def pad_frames(image_lists: List) -> Iterator[List]:
+    '''Yield the four quartet frames of each sub-event of a step. Scenes
+    with fewer sub-events this step hold their last frame.'''
+    count = max(len(image_list) for image_list in image_lists)
+    for index in range(count):
+        yield [image_list[min(index, len(image_list) - 1)]
+               if image_list else None
+               for image_list in image_lists]
+
+
+def drain_scene(scene: Iterator[List]) -> None:
+    '''Run the rest of the scene, so that it ends normally'''
+    for _ in scene:
+        pass
+
+
+def composite_quartet(controllers: List, quartet: List,
+                      output_dir: pathlib.Path) -> pathlib.Path:
+    '''Run the four quartet scenes in lockstep on their own controllers and
+    encode the tiled frames into a single video as they arrive.'''
+    basename = str(quartet[0].stem[:-2])
+    video_path = output_dir / f'{basename}.mp4'
+    recorder = VideoRecorder(vid_path=video_path,
+                             width=TILE_WIDTH * 2,
+                             height=TILE_HEIGHT * 2,
+                             fps=mcs.Controller.FPS_FRAME_RATE)
+    scenes = [run_scene(controller, str(q))
+              for controller, q in zip(controllers, quartet)]
+
+    with concurrent.futures.ThreadPoolExecutor(QUARTET_SIZE) as executor:
+        while True:
+            image_lists = list(executor.map(lambda s: next(s, None), scenes))
+            # Like the old ffmpeg overlay=shortest=1, stop at the shortest
+            if any(image_list is None for image_list in image_lists):
+                break
+            for frames in pad_frames(image_lists):
+                recorder.add(tile_frames(frames))
+
+        # Let any unfinished scenes end normally, still in parallel
+        list(executor.map(drain_scene, scenes))
+
+    recorder.finish()
+    return video_path
+
+
+def create_controllers(engine: str) -> List:
+    '''Start one controller (Unity instance) per quartet member in
+    parallel. Raises RuntimeError (after stopping the others) if any fails
+    to start.'''
+    with concurrent.futures.ThreadPoolExecutor(QUARTET_SIZE) as executor:
+        controllers = list(executor.map(
+            lambda _: mcs.create_controller(engine), range(QUARTET_SIZE)))
+    if any(controller is None for controller in controllers):
+        stop_controllers(controllers)
+        raise RuntimeError(f'Failed to start the Unity runtime {engine}')
+    return controllers
+
+
+def stop_controllers(controllers: List) -> None:
+    for controller in controllers:
+        if controller is not None:
+            controller.stop_simulation()
+
+
+def _init_worker(engine: str) -> None:
+    '''Pool initializer: each worker process owns its four controllers'''
+    global _controllers, _controllers_error
+    try:
+        _controllers = create_controllers(engine)
+    except RuntimeError as error:
+        # Raised from each task instead, as the pool would keep replacing
+        # a worker whose initializer raises
+        _controllers_error = error
+        return
+    # Worker processes skip atexit, so register a finalizer to stop Unity
+    multiprocessing.util.Finalize(
+        None, stop_controllers, args=(_controllers,), exitpriority=10)
+
+
+def _composite_in_worker(args) -> pathlib.Path:
+    quartet, output_dir = args
+    if _controllers_error is not None:
+        raise _controllers_error
+    return composite_quartet(_controllers, quartet, output_dir)
 
 
 def main():
-    os.environ['MCS_DEBUG_MODE'] = 'True'
     args = parse_args()
     quartets = list_quartets(args.input)
     output_dir = pathlib.Path(args.output)
-    controller = mcs.create_controller(args.engine)
+    output_dir.mkdir(parents=True, exist_ok=True)
 
     # object_permanence, shape_constancy, spatio_temporal_continuity -
     # {0001 - 0100} - {1 - 4}
-    for quartet in quartets:
-        for q in quartet:
-            run_scene(controller, str(q))
-
-        basename = str(quartet[0].stem[:-2])
-        # make a system call to ffmpeg to make the quad video
+    if args.workers <= 1:
+        controllers = create_controllers(args.engine)
         try:
-            # yapf: disable
-            subprocess.run(['ffmpeg',
-                            '-y',
-                            '-i', f'{str(quartet[0].stem)}/frame_image_%d.png',
-                            '-i', f'{str(quartet[1].stem)}/frame_image_%d.png',
-                            '-i', f'{str(quartet[2].stem)}/frame_image_%d.png',
-                            '-i', f'{str(quartet[3].stem)}/frame_image_%d.png',
-                            '-filter_complex', 'nullsrc=size=640x480 [base]; [0:v] setpts=PTS-STARTPTS, scale=320x240 [upperleft]; [1:v] setpts=PTS-STARTPTS, scale=320x240 [upperright]; [2:v] setpts=PTS-STARTPTS, scale=320x240 [lowerleft]; [3:v] setpts=PTS-STARTPTS, scale=320x240 [lowerright]; [base][upperleft] overlay=shortest=1 [tmp1]; [tmp1][upperright] overlay=shortest=1:x=320 [tmp2]; [tmp2][lowerleft] overlay=shortest=1:y=240 [tmp3]; [tmp3][lowerright] overlay=shortest=1:x=320:y=240',  # noqa: E501
-                            '-c:v', 'libx264', output_dir / f'{basename}.mp4'
-                            ])
-            # yapf: enable
-        except OSError as e:
-            if e.errno == os.errno.ENOENT:
-                raise OSError('ffmpeg command missing')
-
-        cleanup(quartet)
+            for quartet in quartets:
+                print(composite_quartet(controllers, quartet, output_dir))
+        finally:
+            stop_controllers(controllers)
+        return
+
+    with multiprocessing.Pool(args.workers,
+                              initializer=_init_worker,
+                              initargs=(args.engine,)) as pool:
+        for video_path in pool.imap_unordered(
+                _composite_in_worker,
+                [(quartet, output_dir) for quartet in quartets]):
+            print(video_path)
+        pool.close()
+        pool.join()
 
 
 if __name__ == "__main__":
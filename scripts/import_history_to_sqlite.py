@@ -0,0 +1,26 @@
+#!/usr/bin/env python3
+
+import argparse
+
+from machine_common_sense.history_database import HistoryDatabase
+
+
+def main(args):
+    database = HistoryDatabase(args.database)
+    try:
+        for history_path in args.folders:
+            imported = database.import_directory(history_path)
+            print(f'Imported {len(imported)} history files from '
+                  f'{history_path}')
+    finally:
+        database.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Import scene history files into a SQLite database'
+    )
+    parser.add_argument('database', help='SQLite database file')
+    parser.add_argument('folders', nargs='+', help='Scene history folders '
+                        '(like SCENE_HISTORY)')
+    main(parser.parse_args())
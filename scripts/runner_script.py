@@ -1,13 +1,117 @@
 import argparse
 import glob
+import io
 import os.path
-import subprocess
+import pathlib
+import zipfile
+
+import PIL.Image
 
 import machine_common_sense as mcs
+from machine_common_sense.recorder import VideoRecorder
 
 
 SCRIPT_FOLDER = os.path.dirname(os.path.abspath(__file__))
-BLACK_IMAGE_PATH = SCRIPT_FOLDER + '/black_image.png'
+
+
+class SceneMediaWriter():
+    """Streams the output frames of a single scene into an MP4 video, a GIF,
+    and/or a ZIP archive of PNG frames while the scene runs, so no debug
+    image files or external tools are needed."""
+
+    FRAME_RATE = mcs.Controller.FPS_FRAME_RATE
+    # Prefer H.264 so browsers can play the videos; fall back to MPEG-4 Part 2
+    # if this OpenCV build has no H.264 encoder.
+    VIDEO_FOURCC_LIST = ['avc1', 'mp4v']
+    GIF_FRAME_DURATION_MILLIS = int(1000 / FRAME_RATE)
+
+    def __init__(
+        self,
+        scene_name,
+        save_video=False,
+        save_gif=False,
+        frame_archive=None
+    ):
+        self._scene_name = scene_name
+        self._save_video = save_video
+        self._save_gif = save_gif
+        self._frame_archive = frame_archive
+        self._frame_count = 0
+        self._frame_size = None
+        self._gif_frames = []
+        self._video_recorder = None
+
+    @property
+    def video_path(self):
+        return self._scene_name + '.mp4'
+
+    @property
+    def gif_path(self):
+        return self._scene_name + '.gif'
+
+    def add(self, image_list):
+        """Add each image (PIL.Image) from a step's output to the outputs."""
+        for image in image_list:
+            self._add_frame(image)
+
+    def _create_video_recorder(self, size):
+        for fourcc in self.VIDEO_FOURCC_LIST:
+            video_recorder = VideoRecorder(
+                vid_path=pathlib.Path(self.video_path),
+                width=size[0],
+                height=size[1],
+                fps=self.FRAME_RATE,
+                fourcc=fourcc
+            )
+            if video_recorder.writer.isOpened():
+                return video_recorder
+            video_recorder.finish()
+        print('Failed to open a video writer for ' + self.video_path)
+        return None
+
+    def _add_frame(self, image):
+        if self._frame_size is None:
+            self._frame_size = image.size
+            if self._save_video:
+                self._video_recorder = self._create_video_recorder(image.size)
+        if self._video_recorder:
+            self._video_recorder.add(image)
+        if self._save_gif:
+            # Keep GIF frames palettized (one byte per pixel) until the end.
+            self._gif_frames.append(
+                image.convert('P', palette=PIL.Image.ADAPTIVE)
+            )
+        if self._frame_archive is not None:
+            png_buffer = io.BytesIO()
+            image.save(png_buffer, format='PNG')
+            self._frame_archive.writestr(
+                self._scene_name + '/frame_image_' + str(self._frame_count) +
+                '.png',
+                png_buffer.getvalue()
+            )
+        self._frame_count = self._frame_count + 1
+
+    def finish(self):
+        """Add the black trailing frame, finish encoding, and return the list
+        of written video and GIF file paths."""
+        if self._frame_size is None:
+            return []
+        self._add_frame(PIL.Image.new('RGB', self._frame_size))
+        output_list = []
+        if self._video_recorder:
+            self._video_recorder.finish()
+            output_list.append(self.video_path)
+        if self._save_gif:
+            self._gif_frames[0].save(
+                self.gif_path,
+                save_all=True,
+                append_images=self._gif_frames[1:],
+                duration=self.GIF_FRAME_DURATION_MILLIS,
+                loop=0
+            )
+            self._gif_frames = []
+            output_list.append(self.gif_path)
+        return output_list
 
 
 class AbstractRunnerScript():
@@ -24,7 +128,7 @@ class AbstractRunnerScript():
         if not args.mcs_unity_filename:
             return
 
-        debug = (args.save_videos or args.save_gifs or args.debug)
+        debug = args.debug
         config_suffix = 'with_debug' if debug else 'no_debug'
         if args.level1:
             config_suffix = 'level1_debug' if debug else 'level1'
@@ -39,34 +143,84 @@ class AbstractRunnerScript():
             config_file_path
         )
 
-        for filename in filename_list:
-            scene_name = self.run_scene(
-                controller,
-                filename,
-                action_callback,
-                args.rename if args.rename else ('' if rename else None)
-            )
-            if args.save_videos or args.save_gifs:
-                # Copy the black image into the debug folder as the last frame.
-                frame_image_list = glob.glob(scene_name + '/frame_image_*')
-                frame_count = len(frame_image_list)
-                black_frame = (
-                    scene_name + '/frame_image_' + str(frame_count) + '.png'
+        self._open_archives()
+        self._open_dataset()
+        try:
+            for filename in filename_list:
+                self.run_scene(
+                    controller,
+                    filename,
+                    action_callback,
+                    args.rename if args.rename else ('' if rename else None)
                 )
-                subprocess.call(['cp', BLACK_IMAGE_PATH, black_frame])
-            if args.save_videos:
-                subprocess.call([
-                    'ffmpeg', '-y', '-r', '20', '-i',
-                    scene_name + '/frame_image_%d.png',
-                    '-vcodec', 'h264', '-vf', 'format=yuv420p',
-                    scene_name + '.mp4'
-                ])
-            if args.save_gifs:
-                subprocess.call([
-                    'ffmpeg', '-y', '-r', '20', '-i',
-                    scene_name + '/frame_image_%d.png',
-                    scene_name + '.gif'
-                ])
+        finally:
+            self._close_archives()
+            self._close_dataset()
+
+    def get_zip_prefix(self):
+        """Return the filename prefix of the ZIP archives to save, or None."""
+        return None
+
+    def get_dataset_directory(self):
+        """Return the directory in which to export the dataset, or None."""
+        return None
+
+    def _open_dataset(self):
+        dataset_directory = self.get_dataset_directory()
+        self._dataset_writer = (
+            mcs.DatasetWriter(dataset_directory) if dataset_directory
+            else None
+        )
+
+    def _close_dataset(self):
+        if self._dataset_writer:
+            self._dataset_writer.close()
+            self._dataset_writer = None
+
+    def _export_dataset_step(self, scene_name, step_metadata, action=None,
+                             params=None):
+        if self._dataset_writer:
+            self._dataset_writer.add_step(
+                scene_name, step_metadata, action, params)
+
+    def _open_archives(self):
+        self._archives = {}
+        zip_prefix = self.get_zip_prefix()
+        if not zip_prefix:
+            return
+        for file_type in (
+            (['mp4'] if self.args.save_videos else []) +
+            (['gif'] if self.args.save_gifs else []) +
+            ['frames']
+        ):
+            # Frame PNGs, videos, and GIFs are already compressed.
+            self._archives[file_type] = zipfile.ZipFile(
+                zip_prefix + '_' + file_type + '.zip',
+                'w',
+                zipfile.ZIP_STORED
+            )
+
+    def _close_archives(self):
+        for archive in self._archives.values():
+            archive.close()
+        self._archives = {}
+
+    def _create_media_writer(self, scene_name):
+        frame_archive = self._archives.get('frames')
+        if not (self.args.save_videos or self.args.save_gifs or frame_archive):
+            return None
+        return SceneMediaWriter(
+            scene_name,
+            save_video=self.args.save_videos,
+            save_gif=self.args.save_gifs,
+            frame_archive=frame_archive
+        )
+
+    def _archive_media(self, output_list):
+        for output_path in output_list:
+            file_type = output_path.rsplit('.', 1)[-1]
+            if file_type in self._archives:
+                self._archives[file_type].write(output_path)
 
     def read_args(self):
         parser = argparse.ArgumentParser(description=('Run ' + self._name))
@@ -147,17 +301,30 @@ class AbstractRunnerScript():
                 scene_data['name'][(scene_data['name'].rfind('/') + 1):]
             )
 
+        media_writer = self._create_media_writer(scene_data['name'])
+
         step_metadata = controller.start_scene(scene_data)
+        if media_writer:
+            media_writer.add(step_metadata.image_list)
+        self._export_dataset_step(
+            scene_data['name'], step_metadata, 'Initialize')
         action, params = action_callback(scene_data, step_metadata, self)
 
         while action is not None:
             step_metadata = controller.step(action, **params)
             if step_metadata is None:
                 break
+            if media_writer:
+                media_writer.add(step_metadata.image_list)
+            self._export_dataset_step(
+                scene_data['name'], step_metadata, action, params)
             action, params = action_callback(scene_data, step_metadata, self)
 
         controller.end_scene("", 1)
 
+        if media_writer:
+            self._archive_media(media_writer.finish())
+
         return scene_data['name']
 
 
@@ -172,26 +339,11 @@ class SingleFileRunnerScript(AbstractRunnerScript):
 
 
 class MultipleFileRunnerScript(AbstractRunnerScript):
-    def __init__(
-        self,
-        name,
-        action_callback,
-        rename=False
-    ):
-        super().__init__(name, action_callback, rename)
-        if self.args.zip_prefix:
-            for file_type in (
-                (['mp4'] if self.args.save_videos else []) +
-                (['gif'] if self.args.save_gifs else [])
-            ):
-                subprocess.call(
-                    ['zip', self.args.zip_prefix + '_' + file_type + '.zip'] +
-                    glob.glob(self.args.mcs_scene_prefix + '*.' + file_type)
-                )
-            subprocess.call(
-                ['zip', self.args.zip_prefix + '_frames.zip'] +
-                glob.glob(self.args.mcs_scene_prefix + '*/frame_image_*.png')
-            )
+    def get_zip_prefix(self):
+        return self.args.zip_prefix
+
+    def get_dataset_directory(self):
+        return self.args.dataset_directory
 
     def read_subclass_args(self, parser):
         parser.add_argument(
@@ -203,6 +355,12 @@ class MultipleFileRunnerScript(AbstractRunnerScript):
             default=None,
             help='Save ZIPs of frames/videos/GIFs with this filename prefix'
         )
+        parser.add_argument(
+            '--dataset-directory',
+            default=None,
+            help='Export the frames and metadata of each step as a sharded '
+            'dataset in this directory'
+        )
         args = parser.parse_args()
         filename_list = glob.glob(args.mcs_scene_prefix + '*_debug.json')
         if len(filename_list) == 0:
@@ -0,0 +1,43 @@
+#!/usr/bin/env python3
+
+import argparse
+import glob
+import json
+
+from machine_common_sense.history_reader import HistoryReader
+from machine_common_sense.scoring import Scoring
+
+
+def main(args):
+    scene_path_list = sorted(glob.glob(args.folder + '*_debug.json'))
+    if not scene_path_list:
+        scene_path_list = sorted(glob.glob(args.folder + '*.json'))
+    history_path_list = (
+        history_path
+        for history_folder in args.history_folders
+        for history_path in HistoryReader.iter_history_files(history_folder)
+    )
+    report = Scoring.score(scene_path_list, history_path_list,
+                           args.processes)
+    with open(args.output, 'w') as output_file:
+        json.dump(report, output_file, indent=4)
+    for run in report['runs']:
+        overall = run['passive']['overall']
+        print(f"{run['team']} {run['metadata']}: {run['scenes']} scenes, "
+              f"passive accuracy {overall['accuracy']}, "
+              f"AUC {overall['auc']}")
+    print(f"{report['unmatched']} unmatched histories, "
+          f"{report['unreadable']} unreadable files")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Score scene history files against the scene ground truth'
+    )
+    parser.add_argument('folder', help='Scene folder prefix')
+    parser.add_argument('output', help='Output file (please end with .json)')
+    parser.add_argument('history_folders', nargs='+', help='Scene history '
+                        'folders (like SCENE_HISTORY)')
+    parser.add_argument('--processes', type=int, default=None,
+                        help='Number of processes (default: CPU count)')
+    main(parser.parse_args())
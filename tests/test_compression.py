@@ -0,0 +1,80 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from machine_common_sense.compression import Compression
+
+
+class TestCompression(unittest.TestCase):
+
+    DATA = json.dumps({'steps': list(range(1000))}).encode('utf-8')
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def test_round_trip(self):
+        for method in (Compression.ZLIB, Compression.GZIP, Compression.LZMA):
+            compression = Compression(method, 9)
+            compressed = compression.compress(self.DATA)
+            self.assertLess(len(compressed), len(self.DATA))
+            self.assertEqual(Compression.detect(compressed), method)
+            self.assertEqual(Compression.decompress(compressed), self.DATA)
+
+    def test_none(self):
+        compression = Compression()
+        self.assertFalse(compression.enabled)
+        self.assertEqual(compression.extension, '')
+        self.assertIsNone(compression.content_encoding)
+        self.assertEqual(compression.compress(self.DATA), self.DATA)
+        self.assertEqual(Compression.detect(self.DATA), Compression.NONE)
+        self.assertEqual(Compression.decompress(self.DATA), self.DATA)
+        # Looks like a zlib header, but is not compressed
+        self.assertEqual(Compression.decompress(b'x\x9c123'), b'x\x9c123')
+
+    def test_unknown(self):
+        with self.assertRaises(ValueError):
+            Compression('zip')
+
+    def test_paths(self):
+        self.assertEqual(Compression.strip_extension('a/b.json.gz'),
+                         'a/b.json')
+        self.assertEqual(Compression.strip_extension('a/b.json'), 'a/b.json')
+        self.assertEqual(Compression.content_encoding_for_path('b.json.gz'),
+                         'gzip')
+        self.assertIsNone(Compression.content_encoding_for_path('b.json.xz'))
+        self.assertEqual(Compression.mimetype_for_path('b.json.xz'),
+                         'application/x-xz')
+        self.assertIsNone(Compression.mimetype_for_path('b.json.gz'))
+        self.assertIsNone(Compression.content_encoding_for_path('b.mp4'))
+
+    def test_write_and_read(self):
+        compression = Compression('gzip')
+        path = compression.write_text(
+            os.path.join(self.tmp_dir, 'output.json'), '{"a": 1}')
+        self.assertEqual(path, os.path.join(self.tmp_dir, 'output.json.gz'))
+        self.assertEqual(Compression.read_text(path), '{"a": 1}')
+
+        uncompressed_path = Compression().write_text(
+            os.path.join(self.tmp_dir, 'plain.json'), '{"b": 2}')
+        with open(uncompressed_path) as plain_file:
+            self.assertEqual(plain_file.read(), '{"b": 2}')
+        self.assertEqual(Compression.read_text(uncompressed_path), '{"b": 2}')
+
+    def test_compress_file(self):
+        path = os.path.join(self.tmp_dir, 'history.jsonl')
+        with open(path, 'wb') as history_file:
+            history_file.write(self.DATA)
+        self.assertEqual(Compression().compress_file(path), path)
+        compressed_path = Compression('zlib').compress_file(path)
+        self.assertEqual(compressed_path, path + '.zz')
+        self.assertFalse(os.path.exists(path))
+        self.assertEqual(Compression.read_bytes(compressed_path), self.DATA)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,8 +1,10 @@
 import unittest
 
-from machine_common_sense.config_manager import ConfigManager
+from machine_common_sense.config_manager import ConfigManager, ConfigSnapshot
 from unittest.mock import patch
 import os
+import pickle
+import tempfile
 
 
 class TestConfigManager(unittest.TestCase):
@@ -111,6 +113,24 @@ class TestConfigManager(unittest.TestCase):
             self.config_mngr.get_debug_output(),
             'terminal')
 
+    def test_get_debug_output_writer_settings(self):
+        self.assertEqual(self.config_mngr.get_debug_output_batch_size(), 1)
+        self.assertEqual(
+            self.config_mngr.get_debug_output_png_compression(), 1)
+        self.assertEqual(self.config_mngr.get_debug_output_workers(), 2)
+
+        section = self.config_mngr._config[
+            self.config_mngr.CONFIG_DEFAULT_SECTION
+        ]
+        section[self.config_mngr.CONFIG_DEBUG_OUTPUT_BATCH_SIZE] = '50'
+        section[self.config_mngr.CONFIG_DEBUG_OUTPUT_PNG_COMPRESSION] = '6'
+        section[self.config_mngr.CONFIG_DEBUG_OUTPUT_WORKERS] = '4'
+
+        self.assertEqual(self.config_mngr.get_debug_output_batch_size(), 50)
+        self.assertEqual(
+            self.config_mngr.get_debug_output_png_compression(), 6)
+        self.assertEqual(self.config_mngr.get_debug_output_workers(), 4)
+
     def test_get_evaluation_name(self):
         self.assertEqual(self.config_mngr.get_evaluation_name(), '')
 
@@ -124,6 +144,70 @@ class TestConfigManager(unittest.TestCase):
             self.config_mngr.get_evaluation_name(),
             'test_eval')
 
+    def test_get_compression(self):
+        self.assertEqual(self.config_mngr.get_compression(), 'none')
+        self.assertIsNone(self.config_mngr.get_compression_level())
+
+        section = self.config_mngr._config[
+            self.config_mngr.CONFIG_DEFAULT_SECTION
+        ]
+        section[self.config_mngr.CONFIG_COMPRESSION] = 'gzip'
+        section[self.config_mngr.CONFIG_COMPRESSION_LEVEL] = '9'
+
+        self.assertEqual(self.config_mngr.get_compression(), 'gzip')
+        self.assertEqual(self.config_mngr.get_compression_level(), 9)
+
+    def test_get_dataset_directory(self):
+        self.assertIsNone(self.config_mngr.get_dataset_directory())
+        self.assertEqual(self.config_mngr.get_dataset_shard_size(), 1000)
+
+        self.config_mngr._config[
+            self.config_mngr.CONFIG_DEFAULT_SECTION
+        ][
+            self.config_mngr.CONFIG_DATASET_DIRECTORY
+        ] = 'dataset'
+        self.config_mngr._config[
+            self.config_mngr.CONFIG_DEFAULT_SECTION
+        ][
+            self.config_mngr.CONFIG_DATASET_SHARD_SIZE
+        ] = '50'
+
+        self.assertEqual(self.config_mngr.get_dataset_directory(), 'dataset')
+        self.assertEqual(self.config_mngr.get_dataset_shard_size(), 50)
+
+    def test_occupancy_grid(self):
+        self.assertFalse(self.config_mngr.is_occupancy_grid_enabled())
+        self.assertEqual(
+            self.config_mngr.get_occupancy_grid_resolution(), 0.1)
+
+        self.config_mngr._config[
+            self.config_mngr.CONFIG_DEFAULT_SECTION
+        ][
+            self.config_mngr.CONFIG_OCCUPANCY_GRID
+        ] = 'true'
+        self.config_mngr._config[
+            self.config_mngr.CONFIG_DEFAULT_SECTION
+        ][
+            self.config_mngr.CONFIG_OCCUPANCY_GRID_RESOLUTION
+        ] = '0.25'
+
+        self.assertTrue(self.config_mngr.is_occupancy_grid_enabled())
+        self.assertEqual(
+            self.config_mngr.get_occupancy_grid_resolution(), 0.25)
+
+    def test_get_history_database(self):
+        self.assertIsNone(self.config_mngr.get_history_database())
+
+        self.config_mngr._config[
+            self.config_mngr.CONFIG_DEFAULT_SECTION
+        ][
+            self.config_mngr.CONFIG_HISTORY_DATABASE
+        ] = 'history.sqlite'
+
+        self.assertEqual(
+            self.config_mngr.get_history_database(),
+            'history.sqlite')
+
     @mock_env()
     def test_get_metadata_tier(self):
         self.assertEqual(self.config_mngr.get_metadata_tier(), '')
@@ -204,6 +288,33 @@ class TestConfigManager(unittest.TestCase):
             'team-name')
 
     @mock_env()
+    def test_get_upload_journal_file(self):
+        self.assertIsNone(self.config_mngr.get_upload_journal_file())
+
+        self.config_mngr._config[
+            self.config_mngr.CONFIG_DEFAULT_SECTION
+        ][
+            self.config_mngr.CONFIG_UPLOAD_JOURNAL_FILE
+        ] = 'uploads/journal.jsonl'
+
+        self.assertEqual(
+            self.config_mngr.get_upload_journal_file(),
+            'uploads/journal.jsonl')
+
+    @mock_env()
+    def test_get_upload_local_directory(self):
+        self.assertIsNone(self.config_mngr.get_upload_local_directory())
+
+        self.config_mngr._config[
+            self.config_mngr.CONFIG_DEFAULT_SECTION
+        ][
+            self.config_mngr.CONFIG_UPLOAD_LOCAL_DIRECTORY
+        ] = 'local_bucket'
+
+        self.assertEqual(
+            self.config_mngr.get_upload_local_directory(),
+            'local_bucket')
+
     def test_is_debug(self):
         self.assertFalse(self.config_mngr.is_debug())
 
@@ -277,6 +388,17 @@ class TestConfigManager(unittest.TestCase):
 
         self.assertTrue(self.config_mngr.is_history_enabled())
 
+    def test_is_history_streaming(self):
+        self.assertFalse(self.config_mngr.is_history_streaming())
+
+        self.config_mngr._config[
+            self.config_mngr.CONFIG_DEFAULT_SECTION
+        ][
+            self.config_mngr.CONFIG_HISTORY_STREAMING
+        ] = 'true'
+
+        self.assertTrue(self.config_mngr.is_history_streaming())
+
     def test_is_noise_enabled(self):
         self.assertFalse(self.config_mngr.is_noise_enabled())
 
@@ -315,6 +437,58 @@ class TestConfigManager(unittest.TestCase):
 
         self.assertFalse(self.config_mngr.is_noise_enabled())
 
+    @mock_env(MCS_METADATA_LEVEL='level1')
+    def test_snapshot(self):
+        config_mngr = ConfigManager('./missing-snapshot-test.ini')
+        snapshot = config_mngr.snapshot
+        self.assertIsInstance(snapshot, ConfigSnapshot)
+        self.assertEqual(snapshot.metadata_tier, 'level1')
+        self.assertEqual(snapshot.size, config_mngr.SCREEN_WIDTH_DEFAULT)
+        self.assertEqual(snapshot.compression, 'none')
+        self.assertEqual(snapshot.dataset_shard_size, 1000)
+        self.assertAlmostEqual(snapshot.occupancy_grid_resolution, 0.1)
+        self.assertTrue(snapshot.history_enabled)
+        self.assertFalse(snapshot.evaluation)
+        self.assertIsNone(snapshot.seed)
+
+        with self.assertRaises(AttributeError):
+            snapshot.evaluation = True
+        with self.assertRaises(AttributeError):
+            snapshot.unknown = True
+        with self.assertRaises(AttributeError):
+            del snapshot.team
+        self.assertFalse(hasattr(snapshot, '__dict__'))
+
+        changed = snapshot.replace(evaluation=True, team='test')
+        self.assertTrue(changed.evaluation)
+        self.assertEqual(changed.team, 'test')
+        self.assertFalse(snapshot.evaluation)
+        self.assertEqual(pickle.loads(pickle.dumps(changed)), changed)
+        self.assertNotEqual(changed, snapshot)
+        with self.assertRaises(TypeError):
+            snapshot.replace(unknown=True)
+
+    @mock_env()
+    def test_reload(self):
+        with tempfile.TemporaryDirectory() as directory:
+            file_path = os.path.join(directory, 'reload-test.ini')
+            with open(file_path, 'w') as config_file:
+                config_file.write('[MCS]\nevaluation = false\nsize = 900\n')
+            config_mngr = ConfigManager(file_path)
+            snapshot = config_mngr.snapshot
+            self.assertFalse(snapshot.evaluation)
+            self.assertEqual(snapshot.size, 900)
+
+            with open(file_path, 'w') as config_file:
+                config_file.write('[MCS]\nevaluation = true\nsize = 100\n')
+            # The snapshot does not change until reloaded
+            self.assertFalse(config_mngr.snapshot.evaluation)
+            reloaded = config_mngr.reload()
+            self.assertIs(config_mngr.snapshot, reloaded)
+            self.assertTrue(reloaded.evaluation)
+            self.assertEqual(reloaded.size, config_mngr.SCREEN_WIDTH_DEFAULT)
+            self.assertFalse(snapshot.evaluation)
+
 
 if __name__ == '__main__':
     unittest.main()
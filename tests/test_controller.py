@@ -1,6 +1,8 @@
+import json
 import numpy
 from types import SimpleNamespace
 import unittest
+import unittest.mock
 
 import machine_common_sense as mcs
 
@@ -12,6 +14,7 @@ from .mock_controller import (
 import os
 import glob
 import shutil
+import tempfile
 
 SCENE_HIST_DIR = "./SCENE_HISTORY/"
 TEST_FILE_NAME = "test controller"
@@ -387,6 +390,99 @@ class TestController(unittest.TestCase):
         self.assertTrue(len(hist_file_lookup) > 0)
         self.assertTrue(os.path.exists(hist_file_lookup[0]))
 
+    def test_end_scene_no_wait(self):
+        hist_file_prefix = TEST_FILE_NAME + ' end scene no wait'
+        self.controller.start_scene({'name': hist_file_prefix})
+        handle = self.controller.end_scene("plausible", "0.5", wait=False)
+        self.assertIsNotNone(handle)
+        self.assertIsNone(handle.result(timeout=10))
+        self.assertTrue(handle.done())
+        self.assertIsNone(handle.exception())
+
+        hist_file_lookup = glob.glob(SCENE_HIST_DIR +
+                                     hist_file_prefix + "*.json")
+        self.assertEqual(len(hist_file_lookup), 1)
+        with open(hist_file_lookup[0]) as history_file:
+            history = json.load(history_file)
+        self.assertEqual(history['score']['classification'], 'plausible')
+
+    def test_end_scene_no_wait_then_start_scene(self):
+        hist_file_prefix = TEST_FILE_NAME + ' end scene no wait next'
+        self.controller.start_scene({'name': hist_file_prefix})
+        handle = self.controller.end_scene("plausible", "0.5", wait=False)
+        # Starting the next scene must not write the previous scene's
+        # history file a second time.
+        self.controller.start_scene({'name': hist_file_prefix + ' 2'})
+        handle.result(timeout=10)
+        self.controller.end_scene("", 1)
+        self.controller.wait_for_finalization()
+
+        hist_file_lookup = glob.glob(SCENE_HIST_DIR +
+                                     hist_file_prefix + "-*.json")
+        self.assertEqual(len(hist_file_lookup), 1)
+        with open(hist_file_lookup[0]) as history_file:
+            history = json.load(history_file)
+        self.assertEqual(history['score']['confidence'], '0.5')
+
+    def test_end_scene_history_streaming(self):
+        hist_file_prefix = TEST_FILE_NAME + ' end scene streaming'
+        with unittest.mock.patch.object(
+                self.controller._config, 'snapshot',
+                self.controller._config.snapshot.replace(
+                    history_streaming=True)):
+            self.controller.start_scene({'name': hist_file_prefix})
+        self.controller.step('MoveAhead')
+        self.controller.end_scene("plausible", 0.5)
+
+        hist_file_lookup = glob.glob(SCENE_HIST_DIR +
+                                     hist_file_prefix + "-*.jsonl")
+        self.assertEqual(len(hist_file_lookup), 1)
+        history = mcs.HistoryReader.read(hist_file_lookup[0])
+        self.assertEqual(len(history['steps']), 1)
+        self.assertEqual(history['score']['confidence'], '0.5')
+
+    def test_dataset_export(self):
+        dataset_directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, dataset_directory)
+        self.controller.render_mask_images()
+        with unittest.mock.patch.object(
+                self.controller._config, 'snapshot',
+                self.controller._config.snapshot.replace(
+                    dataset_directory=dataset_directory)):
+            self.controller.start_scene({'name': TEST_FILE_NAME + ' dataset'})
+            self.controller.step('MoveAhead')
+            self.controller.end_scene("", 1)
+            self.controller._get_dataset_writer().close()
+
+        reader = mcs.DatasetReader(dataset_directory)
+        self.assertEqual(len(reader), 2 * MOCK_VARIABLES['event_count'])
+        self.assertEqual(reader.scene_names(), [TEST_FILE_NAME + ' dataset'])
+        self.assertEqual(reader[0]['record']['action'], 'Initialize')
+        self.assertEqual(reader[-1]['record']['action'], 'MoveAhead')
+        self.assertEqual(reader[-1]['record']['step'], 1)
+        self.assertIn('depth', reader[0])
+
+    def test_end_scene_no_wait_error(self):
+        self.controller.start_scene({'name': TEST_FILE_NAME + ' error'})
+        self.controller._finalize_scene = unittest.mock.Mock(
+            side_effect=IOError('disk full'))
+        handle = self.controller.end_scene("", 1, wait=False)
+        self.assertIsInstance(handle.exception(timeout=10), IOError)
+        # The finalization slot must be released even on error.
+        for _ in range(mcs.Controller.MAX_PENDING_FINALIZATIONS + 1):
+            self.controller.end_scene("", 1, wait=False).exception(
+                timeout=10)
+
+    def test_stop_simulation_write_errors(self):
+        self.controller._controller.stop = unittest.mock.Mock()
+        self.controller._Controller__debug_writer.shutdown = (
+            unittest.mock.Mock(return_value=[IOError('disk full')]))
+        with unittest.mock.patch('builtins.print') as mock_print:
+            self.controller.stop_simulation()
+        mock_print.assert_any_call(
+            'Failed to write a debug output file: disk full')
+        self.controller._controller.stop.assert_called_once()
+
     def test_start_scene(self):
         self.controller.render_mask_images()
         output = self.controller.start_scene({'name': TEST_FILE_NAME})
@@ -721,11 +817,25 @@ class TestController(unittest.TestCase):
             'target_2': {'image': "[2]"}
         })
         actual = self.controller.update_goal_target_image(goal)
-        self.assertEqual(actual.metadata, {
-            'target': {'image': [0]},
-            'target_1': {'image': [1]},
-            'target_2': {'image': [2]}
+        for index, target in enumerate(['target', 'target_1', 'target_2']):
+            self.assertIsInstance(actual.metadata[target]['image'],
+                                  numpy.ndarray)
+            self.assertEqual(actual.metadata[target]['image'].tolist(),
+                             [index])
+
+    def test_update_goal_target_image_encoded(self):
+        image = numpy.arange(24, dtype=numpy.uint8).reshape(2, 4, 3)
+        goal = mcs.GoalMetadata(metadata={
+            'target': {'image': mcs.GoalImage.encode(image)},
+            'target_1': {'image': mcs.GoalImage.encode(image, png=False)},
+            'target_2': {'image': None}
         })
+        actual = self.controller.update_goal_target_image(goal)
+        numpy.testing.assert_array_equal(actual.metadata['target']['image'],
+                                         image)
+        numpy.testing.assert_array_equal(
+            actual.metadata['target_1']['image'], image)
+        self.assertIsNone(actual.metadata['target_2']['image'])
 
     def test_update_goal_target_image_oracle(self):
         self.controller.set_metadata_tier('oracle')
@@ -0,0 +1,153 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+import unittest.mock
+
+import numpy as np
+from PIL import Image
+
+import machine_common_sense as mcs
+
+
+class TestDataset(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def create_step(self, step_number, frames=2, depth=True, size=(6, 4)):
+        width, height = size
+        images = [
+            Image.fromarray(np.full(
+                (height, width, 3), step_number * 10 + index, np.uint8))
+            for index in range(frames)
+        ]
+        return mcs.StepMetadata(
+            step_number=step_number,
+            reward=step_number * 0.5,
+            return_status='SUCCESSFUL',
+            image_list=images,
+            depth_map_list=[
+                np.full((height, width), step_number + index / 10.0)
+                for index in range(frames)
+            ] if depth else [],
+            object_mask_list=images,
+            object_list=[mcs.ObjectMetadata(uuid='ball')]
+        )
+
+    def write(self, step_count, shard_size=3, writer_id=None, **kwargs):
+        writer = mcs.DatasetWriter(self.directory, shard_size, writer_id)
+        for step_number in range(step_count):
+            writer.add_step('scene', self.create_step(step_number, **kwargs),
+                            'MoveAhead', {'amount': 0.5})
+        writer.close()
+        return writer
+
+    def test_write_and_read(self):
+        writer = self.write(4)
+        reader = mcs.DatasetReader(self.directory)
+        self.assertEqual(len(reader), 8)
+
+        with open(writer.manifest_path) as manifest_file:
+            manifest = json.load(manifest_file)
+        self.assertEqual([shard['count'] for shard in manifest['shards']],
+                         [3, 3, 2])
+
+        frame = reader[5]
+        self.assertEqual(frame['rgb'].shape, (4, 6, 3))
+        self.assertEqual(frame['rgb'][0, 0, 0], 21)
+        self.assertEqual(frame['depth'].dtype, np.float32)
+        self.assertAlmostEqual(float(frame['depth'][0, 0]), 2.1, places=5)
+        self.assertEqual(frame['record']['step'], 2)
+        self.assertEqual(frame['record']['substep'], 1)
+        self.assertEqual(frame['record']['action'], 'MoveAhead')
+        self.assertEqual(frame['record']['params'], {'amount': 0.5})
+        self.assertEqual(frame['record']['reward'], 1.0)
+        self.assertEqual(frame['record']['objects'][0]['uuid'], 'ball')
+        self.assertIsInstance(frame['rgb'], np.memmap)
+        self.assertEqual(reader[-1]['record']['step'], 3)
+        with self.assertRaises(IndexError):
+            reader[8]
+
+    def test_get_batch(self):
+        self.write(4)
+        reader = mcs.DatasetReader(self.directory)
+        batch = reader.get_batch([7, 0, 4, 1])
+        self.assertEqual(batch['rgb'].shape, (4, 4, 6, 3))
+        self.assertEqual(list(batch['rgb'][:, 0, 0, 0]), [31, 0, 20, 1])
+        self.assertEqual([record['step'] for record in batch['record']],
+                         [3, 0, 2, 0])
+        self.assertEqual(batch['depth'].shape, (4, 4, 6))
+
+    def test_iter_batches(self):
+        self.write(4)
+        reader = mcs.DatasetReader(self.directory)
+        batches = list(reader.iter_batches(3, shuffle=True, seed=1))
+        self.assertEqual([len(batch['record']) for batch in batches],
+                         [3, 3, 2])
+        values = np.concatenate([batch['rgb'][:, 0, 0, 0]
+                                 for batch in batches])
+        self.assertEqual(sorted(values), [0, 1, 10, 11, 20, 21, 30, 31])
+
+    def test_new_shard_on_layout_change(self):
+        writer = mcs.DatasetWriter(self.directory, 10)
+        writer.add_step('a', self.create_step(0))
+        writer.add_step('b', self.create_step(1, depth=False))
+        writer.add_step('c', self.create_step(2, size=(8, 2)))
+        writer.close()
+        reader = mcs.DatasetReader(self.directory)
+        self.assertEqual(len(reader), 6)
+        self.assertNotIn('depth', reader[2])
+        self.assertEqual(reader[4]['rgb'].shape, (2, 8, 3))
+        self.assertEqual(reader.scene_names(), ['a', 'b', 'c'])
+
+    def test_multiple_writers(self):
+        self.write(2, writer_id='worker1')
+        self.write(3, writer_id='worker2')
+        reader = mcs.DatasetReader(self.directory)
+        self.assertEqual(len(reader), 10)
+        self.assertTrue(os.path.exists(os.path.join(
+            self.directory, 'manifest_worker2.json')))
+
+    def test_closed(self):
+        writer = self.write(1)
+        with self.assertRaises(ValueError):
+            writer.add_step('scene', self.create_step(1))
+
+    def test_background_error(self):
+        writer = mcs.DatasetWriter(self.directory, 10)
+        writer.add_step('scene', self.create_step(0))
+        writer.flush()
+        writer._write_frame = unittest.mock.Mock(
+            side_effect=IOError('disk full'))
+        writer.add_step('scene', self.create_step(1))
+        with self.assertRaises(IOError):
+            writer.flush()
+        writer.close()
+        self.assertEqual(len(mcs.DatasetReader(self.directory)), 2)
+
+    def test_close_error(self):
+        writer = mcs.DatasetWriter(self.directory, 10)
+        writer.add_step('scene', self.create_step(0))
+        writer._close_shard = unittest.mock.Mock(
+            side_effect=IOError('disk full'))
+        with self.assertRaises(IOError):
+            writer.close()
+        self.assertFalse(writer._thread.is_alive())
+
+    def test_close_at_exit(self):
+        with unittest.mock.patch('atexit.register') as register, \
+                unittest.mock.patch('atexit.unregister') as unregister:
+            writer = mcs.DatasetWriter(self.directory, 10)
+            register.assert_called_once_with(writer.close)
+            writer.add_step('scene', self.create_step(0))
+            # The exit hook writes the open shard
+            register.call_args[0][0]()
+            unregister.assert_called_once_with(writer.close)
+        self.assertEqual(len(mcs.DatasetReader(self.directory)), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,153 @@
+import json
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+import PIL.Image
+
+import machine_common_sense as mcs
+from machine_common_sense.compression import Compression
+
+from .mock_controller import MockControllerAI2THOR
+
+
+class TestDebugWriter(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.folder = self.directory.name
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def path(self, name):
+        return os.path.join(self.folder, name)
+
+    def test_dumps(self):
+        data = {
+            'array': np.arange(3, dtype=np.int32),
+            'columns': np.arange(4).reshape(2, 2)[:, 0],
+            'number': np.float32(0.5),
+            'integer': np.int64(7),
+            'other': PIL.Image,
+            'nested': {'list': [1, None, 'a']}
+        }
+        result = json.loads(mcs.DebugWriter.dumps(data))
+        self.assertEqual(result['array'], [0, 1, 2])
+        self.assertEqual(result['columns'], [0, 2])
+        self.assertEqual(result['number'], 0.5)
+        self.assertEqual(result['integer'], 7)
+        self.assertIsInstance(result['other'], str)
+        self.assertEqual(result['nested'], {'list': [1, None, 'a']})
+
+    def test_dumps_without_orjson(self):
+        data = {'array': np.arange(2), 'number': np.int64(3)}
+        with mock.patch('machine_common_sense.debug_writer.orjson', None):
+            text = mcs.DebugWriter.dumps(data)
+        self.assertEqual(text, b'{"array":[0,1],"number":3}')
+
+    def test_write_json(self):
+        writer = mcs.DebugWriter()
+        writer.write_json(self.path('a.json'), {'step': 1})
+        writer.write_json(self.path('b.json'), [np.int64(2)])
+        self.assertEqual(writer.flush(), [])
+        with open(self.path('a.json')) as input_file:
+            self.assertEqual(json.load(input_file), {'step': 1})
+        with open(self.path('b.json')) as input_file:
+            self.assertEqual(json.load(input_file), [2])
+        self.assertEqual(writer.shutdown(), [])
+
+    def test_write_json_compressed(self):
+        writer = mcs.DebugWriter(Compression(Compression.GZIP))
+        writer.write_json(self.path('a.json'), {'step': 1})
+        writer.shutdown()
+        self.assertEqual(
+            json.loads(Compression.read_text(self.path('a.json.gz'))),
+            {'step': 1})
+
+    def test_write_batch(self):
+        writer = mcs.DebugWriter(batch_size=2)
+        for step in range(5):
+            writer.write_json(self.path(f'out_{step}.json'), {'step': step})
+        # Full batches are queued, the rest waits for the flush
+        writer.flush()
+        self.assertEqual(sorted(os.listdir(self.folder)), [
+            'debug_output_0.jsonl', 'debug_output_1.jsonl',
+            'debug_output_2.jsonl'])
+        records = []
+        for number in range(3):
+            records.extend(mcs.DebugWriter.read_batch(
+                self.path(f'debug_output_{number}.jsonl')))
+        self.assertEqual(records, [
+            (f'out_{step}.json', {'step': step}) for step in range(5)])
+
+        # A new folder starts a new batch and its own numbering
+        other_folder = self.path('other')
+        os.makedirs(other_folder)
+        writer.write_json(self.path('a.json'), 'a')
+        writer.write_json(os.path.join(other_folder, 'b.json'), 'b')
+        writer.shutdown()
+        self.assertEqual(list(mcs.DebugWriter.read_batch(
+            self.path('debug_output_3.jsonl'))), [('a.json', 'a')])
+        self.assertEqual(os.listdir(other_folder), ['debug_output_0.jsonl'])
+
+    def test_write_image(self):
+        image = np.zeros((8, 8, 3), dtype=np.uint8)
+        image[2:4, 2:6] = [200, 10, 30]
+        writer = mcs.DebugWriter(png_compression=9)
+        writer.write_image(self.path('array.png'), image)
+        writer.write_image(self.path('image.png'), PIL.Image.fromarray(image))
+        writer.write_image(self.path('depth.png'), image[:, :, 0])
+        self.assertEqual(writer.shutdown(), [])
+        for name in ['array.png', 'image.png']:
+            with PIL.Image.open(self.path(name)) as saved:
+                np.testing.assert_array_equal(np.array(saved), image)
+        with PIL.Image.open(self.path('depth.png')) as saved:
+            np.testing.assert_array_equal(np.array(saved), image[:, :, 0])
+        self.assertNotIn('array.png.partial', os.listdir(self.folder))
+
+    def test_flush_errors(self):
+        writer = mcs.DebugWriter()
+        writer.write_json(self.path('missing/a.json'), {})
+        writer.write_json(self.path('a.json'), {})
+        errors = writer.shutdown()
+        self.assertEqual(len(errors), 1)
+        self.assertIsInstance(errors[0], FileNotFoundError)
+        self.assertEqual(writer.flush(), [])
+
+    def test_controller(self):
+        controller = MockControllerAI2THOR()
+        snapshot = controller._config.snapshot.replace(
+            debug_output='file', debug_output_batch_size=2,
+            history_enabled=False)
+        current_directory = os.getcwd()
+        os.chdir(self.folder)
+        try:
+            with mock.patch.object(controller._config, 'snapshot', snapshot):
+                controller._on_init()
+                controller.start_scene({'name': 'debug'})
+                controller.step('Pass')
+                controller.end_scene('plausible')
+        finally:
+            os.chdir(current_directory)
+
+        folder = self.path('debug')
+        names = sorted(os.listdir(folder))
+        self.assertIn('frame_image_0.png', names)
+        self.assertIn('frame_image_1.png', names)
+        records = dict(
+            record for name in names if name.endswith('.jsonl')
+            for record in mcs.DebugWriter.read_batch(
+                os.path.join(folder, name)))
+        self.assertEqual(sorted(records), [
+            'ai2thor_input_0.json', 'ai2thor_input_1.json',
+            'ai2thor_output_0.json', 'ai2thor_output_1.json',
+            'mcs_output_0.json', 'mcs_output_1.json'])
+        self.assertEqual(records['mcs_output_1.json']['step_number'], 1)
+        self.assertEqual(records['ai2thor_input_1.json']['action'], 'Pass')
+
+
+if __name__ == '__main__':
+    unittest.main()
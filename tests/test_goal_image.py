@@ -0,0 +1,61 @@
+import ast
+import unittest
+
+import numpy as np
+
+import machine_common_sense as mcs
+
+
+class TestGoalImage(unittest.TestCase):
+
+    def setUp(self):
+        mcs.GoalImage.clear_cache()
+        self.image = np.random.default_rng(1).integers(
+            0, 256, (6, 5, 3), dtype=np.uint8)
+
+    def test_decode_png(self):
+        encoded = mcs.GoalImage.encode(self.image)
+        self.assertTrue(encoded.startswith(mcs.GoalImage.PNG_PREFIX))
+        decoded = mcs.GoalImage.decode(encoded)
+        np.testing.assert_array_equal(decoded, self.image)
+        self.assertFalse(decoded.flags.writeable)
+        self.assertIs(mcs.GoalImage.decode(encoded), decoded)
+
+    def test_decode_raw(self):
+        encoded = mcs.GoalImage.encode(self.image, png=False)
+        self.assertEqual(encoded['shape'], [6, 5, 3])
+        np.testing.assert_array_equal(mcs.GoalImage.decode(encoded),
+                                      self.image)
+
+    def test_decode_other(self):
+        self.assertIsNone(mcs.GoalImage.decode(None))
+        self.assertIs(mcs.GoalImage.decode(self.image), self.image)
+        np.testing.assert_array_equal(
+            mcs.GoalImage.decode(self.image.tolist()), self.image)
+        self.assertEqual(mcs.GoalImage.decode({'a': 1}), {'a': 1})
+
+    def test_cache_size(self):
+        for number in range(mcs.GoalImage.CACHE_SIZE + 5):
+            mcs.GoalImage.decode(f'[{number}]')
+        self.assertEqual(len(mcs.GoalImage._cache),
+                         mcs.GoalImage.CACHE_SIZE)
+
+    def test_parse_list(self):
+        for text in ['[0]', '[[1, 2], [3, 4]]', '[1.5, -2, 3e2]',
+                     '[[[1, 2, 3]], [[4, 5, 6]]]', '[]', '[[], []]',
+                     ' [[1,2],\n [3,4]] ', str(self.image.tolist())]:
+            parsed = mcs.GoalImage.parse_list(text)
+            expected = np.array(ast.literal_eval(text.strip()))
+            self.assertEqual(parsed.shape, expected.shape, text)
+            self.assertEqual(parsed.dtype.kind, expected.dtype.kind, text)
+            np.testing.assert_array_equal(parsed, expected)
+
+    def test_parse_list_ragged(self):
+        with self.assertRaises(ValueError):
+            mcs.GoalImage.parse_list('[[1, 2, 3], [4]]')
+        with self.assertRaises(ValueError):
+            mcs.GoalImage.parse_list('[[1, 2], [3], [4, 5, 6]]')
+
+
+if __name__ == '__main__':
+    unittest.main()
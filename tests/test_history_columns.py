@@ -0,0 +1,113 @@
+import json
+import pathlib
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+import machine_common_sense as mcs
+
+
+class TestHistoryColumns(unittest.TestCase):
+
+    history = {
+        'info': {'name': 'prefix/scene', 'team': 'team1'},
+        'steps': [{
+            'step': 1,
+            'action': 'MoveAhead',
+            'params': {'amount': 0.5},
+            'classification': None,
+            'confidence': None,
+            'delta_time_millis': 12.5,
+            'output': {
+                'head_tilt': 10,
+                'pose': 'STANDING',
+                'position': {'x': 1, 'y': 0.5, 'z': -2},
+                'return_status': 'SUCCESSFUL',
+                'reward': -0.001,
+                'rotation': 90
+            }
+        }, {
+            'step': 2,
+            'action': 'Pass',
+            'classification': '1',
+            'confidence': 0.25,
+            'delta_time_millis': 3,
+            'output': None
+        }],
+        'score': {'classification': 'plausible', 'confidence': '0.75'}
+    }
+
+    def setUp(self):
+        self.tmp_dir = pathlib.Path(tempfile.mkdtemp())
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def assert_columns(self, columns):
+        np.testing.assert_array_equal(columns['step'], [1, 2])
+        np.testing.assert_array_equal(columns['action'], ['MoveAhead', 'Pass'])
+        np.testing.assert_array_equal(
+            columns['return_status'], ['SUCCESSFUL', ''])
+        np.testing.assert_array_equal(columns['classification'], ['', '1'])
+        np.testing.assert_allclose(columns['confidence'], [np.nan, 0.25])
+        np.testing.assert_allclose(columns['delta_time_millis'], [12.5, 3])
+        np.testing.assert_allclose(columns['head_tilt'], [10, np.nan])
+        np.testing.assert_allclose(columns['reward'], [-0.001, np.nan])
+        np.testing.assert_allclose(columns['rotation'], [90, np.nan])
+        np.testing.assert_allclose(
+            columns['position'], [[1, 0.5, -2], [np.nan] * 3])
+        self.assertEqual(json.loads(columns['params'][0]), {'amount': 0.5})
+        self.assertEqual(json.loads(str(columns['info'])),
+                         self.history['info'])
+        self.assertEqual(str(columns['score_classification']), 'plausible')
+        self.assertAlmostEqual(float(columns['score_confidence']), 0.75)
+
+    def test_from_history(self):
+        columns = mcs.HistoryColumns.from_history(self.history)
+        self.assert_columns(columns)
+        self.assertEqual(columns['step'].dtype, np.int32)
+        self.assertEqual(columns['position'].dtype, np.float32)
+
+    def test_from_history_no_steps(self):
+        columns = mcs.HistoryColumns.from_history({'info': {}})
+        self.assertEqual(columns['step'].shape, (0,))
+        self.assertEqual(columns['position'].shape, (0, 3))
+        self.assertTrue(np.isnan(columns['score_confidence']))
+
+    def test_convert_and_load(self):
+        history_path = self.tmp_dir / 'scene-20210101-000000.json'
+        history_path.write_text(json.dumps(self.history))
+        npz_path = mcs.HistoryColumns.convert_file(history_path)
+        self.assertEqual(npz_path, history_path.with_suffix('.npz'))
+
+        columns = mcs.HistoryColumns.load(npz_path)
+        self.assertIsInstance(columns['position'], np.memmap)
+        self.assertIsInstance(columns['action'], np.memmap)
+        self.assert_columns(columns)
+        self.assert_columns(mcs.HistoryColumns.load(npz_path, mmap=False))
+
+    def test_convert_directory(self):
+        (self.tmp_dir / 'prefix').mkdir()
+        (self.tmp_dir / 'a.json').write_text(json.dumps(self.history))
+        with open(self.tmp_dir / 'prefix' / 'b.jsonl', 'w') as history_file:
+            history_file.write(json.dumps(
+                {'type': 'info', 'info': self.history['info']}) + '\n')
+            for step in self.history['steps']:
+                history_file.write(
+                    json.dumps({'type': 'step', 'step': step}) + '\n')
+            history_file.write(json.dumps(
+                {'type': 'score', 'score': self.history['score']}) + '\n')
+
+        output_dir = self.tmp_dir / 'output'
+        npz_list = mcs.HistoryColumns.convert_directory(
+            self.tmp_dir, output_dir)
+        self.assertEqual(npz_list, [output_dir / 'a.npz',
+                                    output_dir / 'prefix' / 'b.npz'])
+        for npz_path in npz_list:
+            self.assert_columns(mcs.HistoryColumns.load(npz_path))
+
+
+if __name__ == '__main__':
+    unittest.main()
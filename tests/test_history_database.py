@@ -0,0 +1,161 @@
+import json
+import pathlib
+import shutil
+import tempfile
+import threading
+import unittest
+
+import numpy as np
+
+import machine_common_sense as mcs
+
+
+def make_history(team, confidence_list):
+    return {
+        'info': {
+            'evaluation_name': 'eval_3',
+            'evaluation': True,
+            'metadata': 'oracle',
+            'team': team,
+            'name': f'scene_{team}',
+            'timestamp': '20210101-000000'
+        },
+        'steps': [{
+            'step': index + 1,
+            'action': 'Pass',
+            'classification': '1',
+            'confidence': confidence,
+            'delta_time_millis': 5,
+            'output': {
+                'position': {'x': 0.5, 'y': 0, 'z': index},
+                'return_status': 'SUCCESSFUL',
+                'reward': -0.001
+            }
+        } for index, confidence in enumerate(confidence_list)],
+        'score': {'classification': '1', 'confidence': '0.75'}
+    }
+
+
+class TestHistoryDatabase(unittest.TestCase):
+
+    LOW_CONFIDENCE_SQL = (
+        'SELECT scenes.team FROM steps JOIN scenes ON scenes.id = '
+        'steps.scene WHERE scenes.team = ? AND steps.step = ? AND '
+        'steps.confidence < 0.5'
+    )
+
+    def setUp(self):
+        self.tmp_dir = pathlib.Path(tempfile.mkdtemp())
+        self.database = mcs.HistoryDatabase(self.tmp_dir / 'history.sqlite')
+
+    def tearDown(self):
+        self.database.close()
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def test_import_history(self):
+        scene_id = self.database.import_history(
+            make_history('a', [0.9, 0.4, '0.2']))
+        self.database.import_history(make_history('b', [0.1, 0.1]))
+
+        self.assertEqual(
+            self.database.query(self.LOW_CONFIDENCE_SQL, ('a', 2)), [('a',)])
+        self.assertEqual(
+            self.database.query(self.LOW_CONFIDENCE_SQL, ('a', 1)), [])
+        self.assertEqual(self.database.query(
+            'SELECT team, metadata_tier, confidence FROM scenes '
+            'WHERE id = ?', (scene_id,)), [('a', 'oracle', 0.75)])
+        self.assertEqual(self.database.query(
+            'SELECT position_z, confidence, data FROM steps '
+            'WHERE scene = ? AND step = 3', (scene_id,)
+        )[0][:2], (2.0, 0.2))
+
+    def test_indexes(self):
+        plan = self.database.query(
+            'EXPLAIN QUERY PLAN SELECT * FROM steps WHERE step = 40')
+        self.assertIn('steps_step', ' '.join(str(row) for row in plan))
+
+    def test_batched_scene(self):
+        self.database.BATCH_STEPS = 2
+        scene_id = self.database.begin_scene(make_history('a', [])['info'])
+        history = make_history('a', [0.1, 0.2, 0.3])
+        for step in history['steps']:
+            self.database.add_step(scene_id, step)
+        # The first batch is inserted, the last step still buffered
+        self.assertEqual(self.database._connection.execute(
+            'SELECT COUNT(*) FROM steps').fetchone(), (2,))
+        self.database.end_scene(scene_id, {'classification': '0',
+                                           'confidence': '0.5'})
+        self.assertEqual(self.database.query(
+            'SELECT step FROM steps WHERE scene = ? ORDER BY step',
+            (scene_id,)), [(1,), (2,), (3,)])
+        self.assertEqual(self.database.query(
+            'SELECT classification, confidence FROM scenes'), [('0', 0.5)])
+
+    def test_add_step_from_thread(self):
+        scene_id = self.database.begin_scene({'team': 'a'})
+        thread = threading.Thread(
+            target=self.database.end_scene, args=(scene_id, {}))
+        thread.start()
+        thread.join()
+        self.assertEqual(
+            self.database.query('SELECT team FROM scenes'), [('a',)])
+
+    def test_import_directory(self):
+        history_dir = self.tmp_dir / 'SCENE_HISTORY'
+        (history_dir / 'prefix').mkdir(parents=True)
+        (history_dir / 'a.json').write_text(
+            json.dumps(make_history('a', [0.9])))
+        (history_dir / 'prefix' / 'b.json').write_text(
+            json.dumps(make_history('b', [0.9, 0.8])))
+        (history_dir / 'notes.txt').write_text('not a history')
+
+        imported = self.database.import_directory(history_dir)
+        self.assertEqual(len(imported), 2)
+        # Importing again skips the files already imported
+        self.assertEqual(self.database.import_directory(history_dir), [])
+        self.assertEqual(self.database.query(
+            'SELECT team, COUNT(*) FROM steps JOIN scenes ON scenes.id = '
+            'steps.scene GROUP BY team'), [('a', 1), ('b', 2)])
+
+    def test_history_writer(self):
+        if not pathlib.Path(mcs.HistoryWriter.HISTORY_DIRECTORY).exists():
+            self.addCleanup(shutil.rmtree, mcs.HistoryWriter.HISTORY_DIRECTORY,
+                            ignore_errors=True)
+        writer = mcs.HistoryWriter(
+            {'name': 'test_database_scene', 'screenshot': True},
+            {'team': 'a', 'metadata': 'level2'},
+            database=self.database
+        )
+        writer.add_step(mcs.SceneHistory(step=1, action='MoveAhead'))
+        writer.add_step(mcs.SceneHistory(step=2, action='Pass'))
+        writer.write_history_file('1', 0.25)
+        self.assertEqual(self.database.query(
+            'SELECT name, team, metadata_tier, confidence FROM scenes'),
+            [('test_database_scene', 'a', 'level2', 0.25)])
+        self.assertEqual(self.database.query(
+            'SELECT step, action FROM steps ORDER BY step'),
+            [(1, 'MoveAhead'), (2, 'Pass')])
+
+    def test_history_writer_numpy_output(self):
+        if not pathlib.Path(mcs.HistoryWriter.HISTORY_DIRECTORY).exists():
+            self.addCleanup(shutil.rmtree, mcs.HistoryWriter.HISTORY_DIRECTORY,
+                            ignore_errors=True)
+        writer = mcs.HistoryWriter(
+            {'name': 'test_database_scene', 'screenshot': True}, {},
+            database=self.database
+        )
+        goal = mcs.GoalMetadata(metadata={
+            'target_2': {'id': 'b', 'image': np.ones((2, 2, 3), np.uint8)}
+        })
+        writer.add_step(mcs.SceneHistory(step=1, action='Pass', output=(
+            mcs.StepMetadata(goal=goal, reward=np.float64(-0.001)))))
+        writer.write_history_file('1', 0.25)
+        self.assertEqual(self.database.query(
+            'SELECT reward FROM steps'), [(-0.001,)])
+        data = json.loads(self.database.query('SELECT data FROM steps')[0][0])
+        self.assertEqual(data['output']['goal']['metadata']['target_2'],
+                         {'id': 'b'})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,64 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+import machine_common_sense as mcs
+
+
+class TestHistoryReader(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.history = {
+            'info': {'name': 'scene', 'timestamp': '20210101-000000'},
+            'steps': [{'step': 1, 'action': 'MoveAhead'},
+                      {'step': 2, 'action': 'Pass'}],
+            'score': {'classification': '1', 'confidence': '0.5'}
+        }
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def write_streaming(self, lines):
+        path = os.path.join(self.tmp_dir, 'scene.jsonl')
+        with open(path, 'w') as history_file:
+            history_file.write(''.join(lines))
+        return path
+
+    def streaming_lines(self):
+        records = [{'type': 'info', 'info': self.history['info']}] + [
+            {'type': 'step', 'step': step} for step in self.history['steps']
+        ] + [{'type': 'score', 'score': self.history['score']}]
+        return [json.dumps(record) + '\n' for record in records]
+
+    def test_read_json(self):
+        path = os.path.join(self.tmp_dir, 'scene.json')
+        with open(path, 'w') as history_file:
+            json.dump(self.history, history_file)
+        self.assertFalse(mcs.HistoryReader.is_streaming(path))
+        self.assertEqual(mcs.HistoryReader.read(path), self.history)
+        self.assertEqual(list(mcs.HistoryReader.iter_steps(path)),
+                         self.history['steps'])
+
+    def test_read_streaming(self):
+        path = self.write_streaming(self.streaming_lines())
+        self.assertTrue(mcs.HistoryReader.is_streaming(path))
+        self.assertEqual(mcs.HistoryReader.read(path), self.history)
+        self.assertEqual(list(mcs.HistoryReader.iter_steps(path)),
+                         self.history['steps'])
+
+    def test_read_streaming_interrupted(self):
+        lines = self.streaming_lines()[:-1]
+        # Partial record from a crash mid-write
+        lines[-1] = lines[-1][:10]
+        path = self.write_streaming(lines)
+        history = mcs.HistoryReader.read(path)
+        self.assertEqual(history['info'], self.history['info'])
+        self.assertEqual(history['steps'], self.history['steps'][:1])
+        self.assertEqual(history['score'], {})
+
+
+if __name__ == '__main__':
+    unittest.main()
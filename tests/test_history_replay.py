@@ -0,0 +1,144 @@
+import glob
+import json
+import os
+import shutil
+import tempfile
+import unittest
+import unittest.mock
+
+import machine_common_sense as mcs
+
+from .mock_controller import MockControllerAI2THOR, MOCK_VARIABLES
+
+SCENE_HIST_DIR = "./SCENE_HISTORY/"
+TEST_FILE_NAME = "test history replay"
+
+
+class TestHistoryReplayController(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.history_existed = os.path.exists(SCENE_HIST_DIR)
+
+    @classmethod
+    def tearDownClass(cls):
+        for test_file in glob.glob(f'{SCENE_HIST_DIR}/{TEST_FILE_NAME}*'):
+            os.unlink(test_file)
+        if not cls.history_existed and not os.listdir(SCENE_HIST_DIR):
+            shutil.rmtree(SCENE_HIST_DIR)
+
+    def setUp(self):
+        self.dataset_directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dataset_directory)
+
+    def record(self, name, streaming=False, compression='none'):
+        controller = MockControllerAI2THOR()
+        controller.set_metadata_tier('oracle')
+        controller.render_mask_images()
+        with unittest.mock.patch.object(
+                controller._config, 'snapshot',
+                controller._config.snapshot.replace(
+                    history_streaming=streaming,
+                    dataset_directory=self.dataset_directory,
+                    compression=compression)):
+            controller._on_init()
+            controller.render_mask_images()
+            controller.start_scene({'name': name})
+            self.recorded_output = controller.step('MoveAhead')
+            controller.make_step_prediction('plausible', 0.25)
+            controller.step('RotateLeft')
+            controller.end_scene('plausible', 0.75)
+            controller._get_dataset_writer().close()
+        history_list = glob.glob(SCENE_HIST_DIR + name + '-*')
+        self.assertEqual(len(history_list), 1)
+        return history_list[0]
+
+    def check_replay(self, history_path):
+        replay = mcs.HistoryReplayController(history_path)
+        self.assertEqual(replay.start_scene().step_number, 0)
+        output = replay.step('MoveAhead')
+        self.assertIsInstance(output, mcs.StepMetadata)
+        self.assertEqual(output.step_number, 1)
+        self.assertEqual(output.return_status,
+                         MOCK_VARIABLES['metadata']['lastActionStatus'])
+        self.assertEqual(replay.get_step(1)['classification'], 'plausible')
+        self.assertEqual(replay.step('RotateLeft').step_number, 2)
+        self.assertIsNone(replay.step('Pass'))
+        self.assertEqual(replay.seek(1).step_number, 1)
+        self.assertEqual(replay.step().step_number, 2)
+        self.assertEqual(replay.step_count, 2)
+        self.assertEqual(replay.score['confidence'], '0.75')
+        self.assertEqual(replay.info['name'], os.path.basename(
+            history_path).rsplit('-', 2)[0])
+        replay.stop_simulation()
+
+    def test_replay_json(self):
+        self.check_replay(self.record(TEST_FILE_NAME + ' json'))
+
+    def test_replay_streaming(self):
+        self.check_replay(
+            self.record(TEST_FILE_NAME + ' jsonl', streaming=True))
+
+    def test_replay_streaming_reformatted(self):
+        history_path = self.record(
+            TEST_FILE_NAME + ' reformatted', streaming=True)
+        with open(history_path) as history_file:
+            record_list = [json.loads(line) for line in history_file]
+        # Other separators and key order than the history writer's
+        with open(history_path, 'w') as history_file:
+            for record in record_list:
+                history_file.write(json.dumps(
+                    dict(reversed(list(record.items()))),
+                    separators=(',', ':')) + '\n')
+        self.check_replay(history_path)
+
+    def test_replay_streaming_compressed(self):
+        history_path = self.record(
+            TEST_FILE_NAME + ' gzip', streaming=True, compression='gzip')
+        self.assertTrue(history_path.endswith('.jsonl.gz'))
+        self.check_replay(history_path)
+
+    def test_replay_with_dataset(self):
+        history_path = self.record(TEST_FILE_NAME + ' dataset')
+        replay = mcs.HistoryReplayController(
+            history_path, self.dataset_directory)
+        output = replay.start_scene()
+        self.assertEqual(len(output.image_list),
+                         MOCK_VARIABLES['event_count'])
+        output = replay.step()
+        self.assertEqual(len(output.image_list),
+                         MOCK_VARIABLES['event_count'])
+        self.assertEqual(len(output.depth_map_list),
+                         MOCK_VARIABLES['event_count'])
+        self.assertEqual(
+            [obj.uuid for obj in output.object_list],
+            [obj.uuid for obj in self.recorded_output.object_list])
+        self.assertEqual(output.position, self.recorded_output.position)
+        event = replay.get_plot_event()
+        self.assertEqual(len(event.metadata['objects']),
+                         len(output.object_list))
+        self.assertIn('agent', event.metadata)
+
+    def test_reward_trajectory_from_replay(self):
+        history_path = self.record(TEST_FILE_NAME + ' rewards')
+        trajectory = mcs.RewardTrajectory.from_replay(
+            history_path, self.dataset_directory)
+        self.assertEqual(list(trajectory.step_numbers), [1, 2])
+        self.assertEqual(trajectory.calculate_rewards()[0],
+                         self.recorded_output.reward)
+
+    def test_predictions(self):
+        replay = mcs.HistoryReplayController(
+            self.record(TEST_FILE_NAME + ' predictions'))
+        replay.start_scene()
+        replay.step()
+        replay.make_step_prediction('implausible', 0.5)
+        replay.end_scene('implausible', 0.5)
+        self.assertEqual(replay.predictions[1]['classification'],
+                         'implausible')
+        self.assertEqual(replay.end_score['confidence'], 0.5)
+        self.assertEqual(replay.score['classification'], 'plausible')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -3,13 +3,26 @@ import os
 import glob
 import shutil
 
+import numpy as np
+
 import machine_common_sense as mcs
+from machine_common_sense.compression import Compression
 
 
 TEST_FILE_NAME = "test_scene_file.json"
 PREFIX = 'prefix'
 
 
+def target_image_step(step):
+    goal = mcs.GoalMetadata(metadata={
+        'target_1': {'id': 'a', 'image': np.zeros((2, 2, 3), np.uint8)},
+        'target_2': {'id': 'b', 'image': np.ones((2, 2, 3), np.uint8)}
+    })
+    output = mcs.StepMetadata(goal=goal, reward=np.float64(-0.001),
+                              step_number=step)
+    return mcs.SceneHistory(step=step, action="Pass", output=output)
+
+
 class TestHistoryWriter(unittest.TestCase):
 
     config_data = {"name": TEST_FILE_NAME}
@@ -195,7 +208,8 @@ class TestHistoryWriter(unittest.TestCase):
             },
             structural_object_list={
                 "structural_object": "structural_object"
-            }
+            },
+            occupancy_grid=np.zeros((2, 2), np.int8)
         )
 
         history_item = mcs.SceneHistory(
@@ -212,6 +226,7 @@ class TestHistoryWriter(unittest.TestCase):
         self.assertIsNone(writer.current_steps[0]["output"]["object_list"])
         self.assertIsNone(
             writer.current_steps[0]["output"]["structural_object_list"])
+        self.assertIsNone(writer.current_steps[0]["output"]["occupancy_grid"])
 
         history_item = mcs.SceneHistory(
             step=2,
@@ -228,6 +243,126 @@ class TestHistoryWriter(unittest.TestCase):
         self.assertIsNone(
             writer.current_steps[1]["output"]["structural_object_list"])
 
+    def test_write_history_file_compressed(self):
+        writer = mcs.HistoryWriter(self.config_data, {},
+                                   compression=Compression('lzma'))
+        self.assertTrue(writer.scene_history_file.endswith('.json.xz'))
+        writer.add_step(mcs.SceneHistory(step=1, action="MoveAhead"))
+        writer.write_history_file("Plausible", 0.75)
+        writer.check_file_written()
+
+        history = mcs.HistoryReader.read(writer.scene_history_file)
+        self.assertEqual(history, writer.history_obj)
+
+    def test_write_history_file_target_images(self):
+        writer = mcs.HistoryWriter(self.config_data, {}, "target-images")
+        writer.add_step(target_image_step(1))
+        writer.add_step(target_image_step(2))
+        writer.write_history_file("Plausible", 0.75)
+
+        history = mcs.HistoryReader.read(writer.scene_history_file)
+        for step in history['steps']:
+            metadata = step['output']['goal']['metadata']
+            self.assertEqual(metadata['target_1'], {'id': 'a'})
+            self.assertEqual(metadata['target_2'], {'id': 'b'})
+            self.assertEqual(step['output']['reward'], -0.001)
+
+
+class TestStreamingHistoryWriter(unittest.TestCase):
+
+    config_data = {"name": TEST_FILE_NAME}
+
+    @classmethod
+    def tearDownClass(cls):
+        test_file_base = os.path.splitext(TEST_FILE_NAME)[0]
+        test_files = glob.glob(
+            f'{mcs.HistoryWriter.HISTORY_DIRECTORY}/{test_file_base}*')
+        for test_file in test_files:
+            os.unlink(test_file)
+        if not os.listdir(mcs.HistoryWriter.HISTORY_DIRECTORY):
+            shutil.rmtree(mcs.HistoryWriter.HISTORY_DIRECTORY)
+
+    def test_init_writes_info(self):
+        writer = mcs.StreamingHistoryWriter(self.config_data, {'team': 'a'})
+        self.assertTrue(writer.scene_history_file.endswith('.jsonl'))
+        records = list(mcs.HistoryReader.iter_records(
+            writer.scene_history_file))
+        self.assertEqual(len(records), 1)
+        self.assertEqual(records[0]['type'], 'info')
+        self.assertEqual(records[0]['info']['team'], 'a')
+        writer.check_file_written()
+
+    def test_add_step_appends_records(self):
+        writer = mcs.StreamingHistoryWriter(self.config_data, {})
+        for step in range(1, 4):
+            writer.add_step(mcs.SceneHistory(step=step, action="MoveAhead"))
+            # Each step is on disk before the scene ends
+            steps = list(mcs.HistoryReader.iter_steps(
+                writer.scene_history_file))
+            self.assertEqual(len(steps), step)
+        self.assertEqual(writer.step_count, 3)
+        self.assertEqual(writer.current_steps, [])
+
+        history = mcs.HistoryReader.read(writer.scene_history_file)
+        self.assertEqual(history['score'], {})
+        writer.check_file_written()
+
+    def test_write_history_file(self):
+        writer = mcs.StreamingHistoryWriter(self.config_data, {})
+        writer.add_step(mcs.SceneHistory(step=1, action="MoveAhead"))
+        writer.add_step(mcs.SceneHistory(step=2, action="MoveLeft"))
+        writer.write_history_file("Plausible", 0.75)
+
+        self.assertEqual(writer.end_score["confidence"], "0.75")
+        history = mcs.HistoryReader.read(writer.scene_history_file)
+        self.assertEqual(history.keys(), {'info', 'steps', 'score'})
+        self.assertEqual(history['info']['name'], "test_scene_file")
+        self.assertEqual([step['action'] for step in history['steps']],
+                         ["MoveAhead", "MoveLeft"])
+        self.assertEqual(history['score'], {
+            'classification': "Plausible",
+            'confidence': "0.75"
+        })
+
+        # A second end of scene (like the atexit hook) changes nothing
+        writer.check_file_written()
+        writer.write_history_file("", "")
+        self.assertEqual(
+            mcs.HistoryReader.read(writer.scene_history_file), history)
+
+    def test_compression(self):
+        writer = mcs.StreamingHistoryWriter(
+            self.config_data, {}, compression=Compression('gzip'))
+        self.assertTrue(writer.scene_history_file.endswith('.jsonl'))
+        writer.add_step(mcs.SceneHistory(step=1, action="MoveAhead"))
+        writer.write_history_file("Plausible", 0.75)
+
+        self.assertTrue(writer.scene_history_file.endswith('.jsonl.gz'))
+        self.assertFalse(os.path.exists(writer.scene_history_file[:-3]))
+        history = mcs.HistoryReader.read(writer.scene_history_file)
+        self.assertEqual(len(history['steps']), 1)
+        self.assertEqual(history['score']['confidence'], "0.75")
+
+    def test_target_images(self):
+        writer = mcs.StreamingHistoryWriter(self.config_data, {})
+        writer.add_step(target_image_step(1))
+        writer.add_step(target_image_step(2))
+        writer.write_history_file("Plausible", 0.75)
+
+        history = mcs.HistoryReader.read(writer.scene_history_file)
+        self.assertEqual(len(history['steps']), 2)
+        metadata = history['steps'][1]['output']['goal']['metadata']
+        self.assertEqual(metadata['target_2'], {'id': 'b'})
+        self.assertEqual(history['steps'][1]['output']['reward'], -0.001)
+
+    def test_screenshot_scene(self):
+        writer = mcs.StreamingHistoryWriter(
+            {"name": TEST_FILE_NAME, "screenshot": True}, {})
+        self.assertIsNone(writer.scene_history_file)
+        writer.add_step(mcs.SceneHistory(step=1, action="MoveAhead"))
+        writer.write_history_file("", "")
+        self.assertEqual(writer.step_count, 1)
+
 
 if __name__ == '__main__':
     unittest.main()
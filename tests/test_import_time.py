@@ -0,0 +1,57 @@
+import json
+import subprocess
+import sys
+import unittest
+
+# Libraries too slow to import until a feature needs them
+HEAVY_MODULES = ['ai2thor', 'boto3', 'cv2', 'matplotlib', 'shapely']
+
+# Generous, to catch a heavy import coming back rather than small slowdowns
+# (importing everything takes well over a second)
+MAX_IMPORT_SECONDS = 0.5
+
+
+def run_fresh(code):
+    '''Run the code in a new interpreter and return its printed JSON.'''
+    output = subprocess.run(
+        [sys.executable, '-c', code], capture_output=True, check=True,
+        text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+class TestImportTime(unittest.TestCase):
+
+    def test_import_time(self):
+        result = run_fresh(
+            'import json, sys, time\n'
+            'import numpy\n'
+            'start = time.perf_counter()\n'
+            'import machine_common_sense as mcs\n'
+            'seconds = time.perf_counter() - start\n'
+            'mcs.Util, mcs.SerializerJson, mcs.StepMetadata, mcs.Reward\n'
+            'mcs.HistoryReader, mcs.HistoryReplayController\n'
+            'mcs.load_scene_json_file("missing.json")\n'
+            f'print(json.dumps([seconds, [name for name in {HEAVY_MODULES}'
+            ' if name in sys.modules]]))')
+        seconds, loaded = result
+        self.assertEqual(loaded, [])
+        self.assertLess(seconds, MAX_IMPORT_SECONDS)
+
+    def test_lazy_attributes(self):
+        result = run_fresh(
+            'import json\n'
+            'import machine_common_sense as mcs\n'
+            'from machine_common_sense import Controller, SerializerJson\n'
+            'print(json.dumps([Controller is mcs.Controller,\n'
+            '    "Controller" in dir(mcs),\n'
+            '    sorted(set(mcs.__all__) - set(dir(mcs)))]))')
+        self.assertEqual(result, [True, True, []])
+
+    def test_unknown_attribute(self):
+        import machine_common_sense as mcs
+        with self.assertRaises(AttributeError):
+            mcs.NotAClass
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,121 @@
+import unittest
+
+import numpy as np
+import PIL.Image
+
+import machine_common_sense as mcs
+
+from .mock_controller import MockControllerAI2THOR
+
+
+class TestObjectMasks(unittest.TestCase):
+
+    def setUp(self):
+        self.mask = np.zeros((4, 6, 3), dtype=np.uint8)
+        self.mask[1:3, 2:5] = [10, 20, 30]
+        self.mask[3, 0] = [1, 2, 3]
+        self.mask[0, 5] = [7, 7, 7]
+        self.table = mcs.ObjectMaskTable({
+            'ball': (10, 20, 30),
+            'box': {'r': 1, 'g': 2, 'b': 3},
+            'floor': (0, 0, 0),
+            'hidden': (99, 99, 99)
+        })
+
+    def test_label(self):
+        labels = self.table.label(self.mask)
+        self.assertEqual(labels.shape, (4, 6))
+        self.assertEqual(labels[1, 2], 0)
+        self.assertEqual(labels[3, 0], 1)
+        self.assertEqual(labels[0, 0], 2)
+        self.assertEqual(labels[0, 5], -1)
+        np.testing.assert_array_equal(
+            self.table.label(PIL.Image.fromarray(self.mask)), labels)
+
+    def test_update(self):
+        self.assertFalse(self.table.update({'ball': (10, 20, 30)}))
+        self.assertTrue(self.table.update({'new': (7, 7, 7),
+                                           'box': (5, 5, 5)}))
+        self.assertEqual(self.table.uuids,
+                         ['ball', 'box', 'floor', 'hidden', 'new'])
+        labels = self.table.label(self.mask)
+        self.assertEqual(labels[0, 5], 4)
+        self.assertEqual(labels[3, 0], -1)
+        self.assertEqual(
+            list(mcs.ObjectMaskTable().lookup(np.array([0, 1]))), [-1, -1])
+
+    def test_analyze(self):
+        stats = self.table.analyze(self.mask)
+        self.assertEqual(len(stats), 4)
+        self.assertEqual(list(stats.pixel_counts), [6, 1, 16, 0])
+        self.assertEqual(list(stats.bounding_boxes[0]), [2, 1, 4, 2])
+        self.assertEqual(list(stats.bounding_boxes[2]), [0, 0, 5, 3])
+        self.assertEqual(list(stats.bounding_boxes[3]), [-1, -1, -1, -1])
+        np.testing.assert_allclose(stats.centroids[0], [3.0, 1.5])
+        np.testing.assert_allclose(stats.centroids[1], [0.0, 3.0])
+        self.assertEqual(list(stats.colors[1]), [1, 2, 3])
+        self.assertEqual(stats.visible(), ['ball', 'box', 'floor'])
+        self.assertEqual(stats.get('ball'), {
+            'pixel_count': 6,
+            'bounding_box': (2, 1, 4, 2),
+            'centroid': (3.0, 1.5)
+        })
+        self.assertIsNone(stats.get('hidden'))
+        self.assertIsNone(stats.get('missing'))
+
+    def test_analyze_random_against_masks(self):
+        random = np.random.default_rng(5)
+        palette = random.integers(0, 256, (20, 3), dtype=np.uint8)
+        table = mcs.ObjectMaskTable({
+            f'obj{number}': color for number, color in enumerate(palette)
+        })
+        mask = palette[random.integers(0, 20, (30, 40))]
+        stats = table.analyze(mask)
+        for number, color in enumerate(palette):
+            rows, columns = np.nonzero(np.all(mask == color, axis=2))
+            self.assertEqual(stats.pixel_counts[number], len(rows))
+            self.assertEqual(list(stats.bounding_boxes[number]), [
+                columns.min(), rows.min(), columns.max(), rows.max()])
+            np.testing.assert_allclose(stats.centroids[number],
+                                       [columns.mean(), rows.mean()])
+
+    def test_analyze_colors_only(self):
+        stats = mcs.ObjectMaskTable().analyze(self.mask)
+        self.assertEqual(stats.uuids, [None] * 4)
+        self.assertEqual([list(color) for color in stats.colors],
+                         [[0, 0, 0], [1, 2, 3], [7, 7, 7], [10, 20, 30]])
+        self.assertEqual(list(stats.pixel_counts), [16, 1, 1, 6])
+
+    def test_step_metadata(self):
+        step = mcs.StepMetadata(
+            object_list=[mcs.ObjectMetadata(
+                uuid='ball', color={'r': 10, 'g': 20, 'b': 30})],
+            structural_object_list=[mcs.ObjectMetadata(
+                uuid='floor', color={'r': 0, 'g': 0, 'b': 0})],
+            object_mask_list=[PIL.Image.fromarray(self.mask)])
+        stats = step.analyze_object_mask()
+        self.assertEqual(stats.uuids, ['ball', 'floor'])
+        self.assertEqual(list(stats.pixel_counts), [6, 16])
+        self.assertIs(step.analyze_object_mask(0), stats)
+        self.assertNotIn('_object_mask', str(step))
+
+        step = mcs.StepMetadata(object_mask_list=[self.mask],
+                                object_mask_table=self.table)
+        self.assertEqual(step.analyze_object_mask().uuids, self.table.uuids)
+
+    def test_controller(self):
+        controller = MockControllerAI2THOR()
+        controller.set_metadata_tier('oracle')
+        controller.render_mask_images()
+        output = controller.start_scene({'name': 'test object masks'})
+        self.assertIsNotNone(output._object_mask_table)
+
+        controller = MockControllerAI2THOR()
+        controller.set_metadata_tier('level2')
+        controller.render_mask_images()
+        output = controller.start_scene({'name': 'test object masks'})
+        self.assertIsNone(output._object_mask_table)
+
+
+if __name__ == '__main__':
+    unittest.main()
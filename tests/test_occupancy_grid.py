@@ -0,0 +1,146 @@
+import math
+import unittest
+import unittest.mock
+
+import numpy as np
+
+from machine_common_sense.occupancy_grid import OccupancyGrid
+from machine_common_sense.point_cloud import PointCloud
+
+from .mock_controller import MockControllerAI2THOR
+from .test_spatial_index import create_metadata
+
+
+def create_box(object_id, x, z, width=1.0, depth=1.0, bottom=0.0,
+               top=1.0, held=False):
+    obj = create_metadata(object_id, x, z, width, depth)
+    for corner in obj.dimensions:
+        corner['y'] = top if corner['y'] else bottom
+    obj.held = held
+    return obj
+
+
+class TestOccupancyGrid(unittest.TestCase):
+
+    def setUp(self):
+        self.grid = OccupancyGrid((-2, -2, 2, 2), 0.1)
+
+    def occupied(self):
+        return self.grid.grid == OccupancyGrid.OCCUPIED
+
+    def test_shape(self):
+        self.assertEqual(self.grid.shape, (40, 40))
+        self.assertEqual(self.grid.cell_of(-2, -2), (0, 0))
+        self.assertEqual(self.grid.cell_of(1.05, 0.05), (20, 30))
+        self.assertTrue((self.grid.grid == OccupancyGrid.UNKNOWN).all())
+        room = OccupancyGrid.for_room({'x': 12, 'y': 3, 'z': 8}, 0.5)
+        self.assertEqual(room.shape, (20, 28))
+
+    def test_update_from_objects(self):
+        changed = self.grid.update_from_objects(
+            [create_box('box', 1, 1, 0.96, 0.96)],
+            [create_box('floor', 0, 0, 4, 4, -0.1, 0.0),
+             create_box('wall', 0, -1.45, 3.96, 0.02)])
+        self.assertEqual(sorted(changed), ['box', 'wall'])
+        self.assertTrue((self.grid.grid != OccupancyGrid.UNKNOWN).all())
+        box_cells = self.occupied()[25:35, 25:35]
+        self.assertTrue(box_cells.all())
+        # The thin wall still covers a row of cells
+        self.assertTrue(self.occupied()[5, :].all())
+        self.assertEqual(self.occupied().sum(), 100 + 40)
+
+        # Only the moved object changes
+        changed = self.grid.update_from_objects(
+            [create_box('box', -1, 1, 0.96, 0.96)],
+            [create_box('floor', 0, 0, 4, 4, -0.1, 0.0),
+             create_box('wall', 0, -1.45, 3.96, 0.02)])
+        self.assertEqual(changed, ['box'])
+        self.assertFalse(self.occupied()[25:35, 25:35].any())
+        self.assertTrue(self.occupied()[25:35, 5:15].all())
+
+        # Held, high and removed objects are not obstacles
+        changed = self.grid.update_from_objects(
+            [create_box('box', -1, 1, held=True),
+             create_box('shelf', 1, 1, bottom=1.5, top=2.0)])
+        self.assertEqual(sorted(changed), ['box', 'wall'])
+        self.assertFalse(self.occupied().any())
+
+    def test_overlapping_objects(self):
+        self.grid.update_from_objects(
+            [create_box('a', 0, 0, 0.96, 0.96),
+             create_box('b', 0.5, 0, 0.96, 0.96)])
+        self.grid.update_from_objects([create_box('a', 0, 0, 0.96, 0.96)])
+        self.assertTrue(self.occupied()[15:25, 15:25].all())
+        self.assertEqual(self.occupied().sum(), 100)
+
+    def depth_map(self, head_tilt, camera_height, wall_distance,
+                  size=(120, 180), field_of_view=60):
+        ray_x, ray_y = PointCloud.camera_rays(
+            size[0], size[1], field_of_view)
+        tilt = math.radians(head_tilt)
+        up = ray_y * math.cos(tilt) - math.sin(tilt)
+        forward = ray_y * math.sin(tilt) + math.cos(tilt)
+        with np.errstate(divide='ignore'):
+            floor = np.where(up < 0, -camera_height / up, np.inf)
+            wall = np.where(forward > 0, wall_distance / forward, np.inf)
+        return np.minimum(np.minimum(floor, wall), 15.0)
+
+    def test_update_from_depth(self):
+        grid = OccupancyGrid.egocentric(5, 0.1)
+        self.assertEqual(grid.shape, (50, 100))
+        depth_map = self.depth_map(30, 0.75, 3.0)
+        self.assertGreater(grid.update_from_depth(
+            depth_map, {'x': 0, 'z': 0}, 0, 30, 0.75, 60, 15.0, 1), 0)
+        # The wall in front, and the floor up to it
+        occupied = grid.grid == OccupancyGrid.OCCUPIED
+        self.assertTrue(occupied[30, 50])
+        self.assertEqual(set(np.nonzero(occupied)[0]), {29, 30})
+        self.assertEqual(grid.grid[15, 50], OccupancyGrid.FREE)
+        self.assertEqual(grid.grid[40, 50], OccupancyGrid.UNKNOWN)
+
+        # Replace the last view
+        depth_map = self.depth_map(30, 0.75, 2.0)
+        grid.update_from_depth(depth_map, {'x': 0, 'z': 0}, 0, 30, 0.75,
+                               60, 15.0, 1, replace=True)
+        occupied = grid.grid == OccupancyGrid.OCCUPIED
+        self.assertTrue(occupied[20, 50])
+        self.assertFalse(occupied[30, 50])
+
+    def test_update_from_depth_rotated(self):
+        grid = OccupancyGrid((-5, -5, 5, 5), 0.1)
+        grid.update_from_depth(self.depth_map(30, 0.75, 3.0),
+                               {'x': 1.0, 'z': 0.0}, 90, 30, 0.75, 60, 15.0,
+                               1)
+        # Facing positive X, the wall is at X 4
+        row, column = grid.cell_of(4.0, 0.0)
+        self.assertEqual(grid.grid[row - 1:row + 2, column - 1:column + 2
+                                   ].max(), OccupancyGrid.OCCUPIED)
+        row, column = grid.cell_of(2.5, 0.0)
+        self.assertEqual(grid.grid[row, column], OccupancyGrid.FREE)
+
+    def check_controller_grid(self, metadata_tier):
+        controller = MockControllerAI2THOR()
+        controller.set_metadata_tier(metadata_tier)
+        if metadata_tier != 'none':
+            controller.render_mask_images()
+        with unittest.mock.patch.object(
+                controller._config, 'snapshot',
+                controller._config.snapshot.replace(occupancy_grid=True)):
+            return controller.start_scene({
+                'name': 'test occupancy grid',
+                'roomDimensions': {'x': 4, 'y': 3, 'z': 4}
+            }).occupancy_grid
+
+    def test_controller(self):
+        grid = self.check_controller_grid('oracle')
+        self.assertEqual(grid.shape, (60, 60))
+        self.assertTrue((grid == OccupancyGrid.FREE).all())
+        grid = self.check_controller_grid('level2')
+        self.assertEqual(grid.shape, (150, 300))
+        self.assertIsNone(self.check_controller_grid('none'))
+        self.assertIsNone(MockControllerAI2THOR().start_scene(
+            {'name': 'test occupancy grid'}).occupancy_grid)
+
+
+if __name__ == '__main__':
+    unittest.main()
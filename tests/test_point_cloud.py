@@ -0,0 +1,101 @@
+import unittest
+
+import numpy as np
+
+import machine_common_sense as mcs
+
+
+class TestPointCloud(unittest.TestCase):
+
+    def test_camera_rays(self):
+        ray_x, ray_y = mcs.PointCloud.camera_rays(4, 6, 90)
+        self.assertEqual(ray_x.shape, (4, 6))
+        # Focal length 2 pixels: the pixel centers are 0.5 apart
+        self.assertAlmostEqual(ray_x[0, 0], -1.25)
+        self.assertAlmostEqual(ray_x[0, 5], 1.25)
+        self.assertAlmostEqual(ray_y[0, 0], 0.75)
+        self.assertAlmostEqual(ray_y[3, 0], -0.75)
+        self.assertIs(mcs.PointCloud.camera_rays(4, 6, 90)[0], ray_x)
+        ray_x, ray_y = mcs.PointCloud.camera_rays(4, 6, 90, 2)
+        self.assertEqual(ray_x.shape, (2, 3))
+        self.assertAlmostEqual(ray_x[0, 0], -0.75)
+
+    def test_from_depth(self):
+        depth_map = np.full((4, 6), 2.0)
+        depth_map[0, 0] = 0.0
+        depth_map[3, 5] = 15.0
+        cloud = mcs.PointCloud.from_depth(depth_map, 90, max_depth=15.0)
+        self.assertEqual(len(cloud), 22)
+        self.assertEqual((cloud.rows[0], cloud.columns[0]), (0, 1))
+        np.testing.assert_allclose(cloud.points[0], [-1.5, 1.5, 2.0])
+        self.assertIsNone(cloud.colors)
+        self.assertIsNone(cloud.uuids)
+
+        cloud = mcs.PointCloud.from_depth(depth_map, 90, stride=2)
+        self.assertEqual(len(cloud), 6)
+        self.assertEqual(list(cloud.rows), [1, 1, 1, 3, 3, 3])
+        self.assertEqual(list(cloud.columns), [1, 3, 5, 1, 3, 5])
+        self.assertEqual(cloud.points[-1][2], 15.0)
+
+    def test_from_depth_objects(self):
+        mask = np.zeros((4, 6, 3), dtype=np.uint8)
+        mask[:, 3:] = [10, 20, 30]
+        mask[0, 0] = [1, 2, 3]
+        object_list = [
+            mcs.ObjectMetadata(uuid='ball',
+                               color={'r': 10, 'g': 20, 'b': 30}),
+            mcs.ObjectMetadata(uuid='box', color={'r': 1, 'g': 2, 'b': 3})
+        ]
+        cloud = mcs.PointCloud.from_depth(
+            np.ones((4, 6)), 90, object_mask=mask, object_list=object_list)
+        self.assertEqual(list(cloud.colors[3]), [10, 20, 30])
+        self.assertEqual(cloud.uuids[0], 'box')
+        self.assertIsNone(cloud.uuids[1])
+        self.assertEqual(list(cloud.uuids[:6]),
+                         ['box', None, None, 'ball', 'ball', 'ball'])
+
+    def test_to_world(self):
+        cloud = mcs.PointCloud(np.array([[0.0, 0.0, 2.0], [1.0, 0.0, 2.0]]),
+                               np.zeros(2), np.zeros(2))
+        points = cloud.to_world({'x': 1.0, 'z': -1.0}, 0, 0, 0.5).points
+        np.testing.assert_allclose(points, [[1, 0.5, 1], [2, 0.5, 1]])
+        # Facing positive X, right is negative Z
+        points = cloud.to_world({'x': 1.0, 'z': -1.0}, 90, 0, 0.5).points
+        np.testing.assert_allclose(points, [[3, 0.5, -1], [3, 0.5, -2]],
+                                   atol=1e-9)
+        # Looking straight down
+        points = cloud.to_world({'x': 0.0, 'z': 0.0}, 0, 90, 2.0).points
+        np.testing.assert_allclose(points, [[0, 0, 0], [1, 0, 0]],
+                                   atol=1e-9)
+
+    def test_from_step(self):
+        step = mcs.StepMetadata(
+            camera_clipping_planes=(0.01, 15.0),
+            camera_field_of_view=90,
+            camera_height=0.5,
+            depth_map_list=[np.full((4, 6), 15.0), np.full((4, 6), 2.0)],
+            object_mask_list=[np.zeros((4, 6, 3), dtype=np.uint8)] * 2,
+            object_list=[mcs.ObjectMetadata(
+                uuid='wall', color={'r': 0, 'g': 0, 'b': 0})],
+            position={'x': 1.0, 'y': 0.0, 'z': 0.0},
+            rotation=0.0)
+        cloud = mcs.PointCloud.from_step(step)
+        self.assertEqual(len(cloud), 24)
+        self.assertTrue((cloud.points[:, 2] == 2.0).all())
+        self.assertTrue((cloud.uuids == 'wall').all())
+        self.assertEqual(len(mcs.PointCloud.from_step(step, index=0)), 0)
+        cloud = mcs.PointCloud.from_step(step, world=False,
+                                         with_objects=False)
+        self.assertIsNone(cloud.colors)
+        self.assertAlmostEqual(cloud.points[:, 0].mean(), 0.0)
+
+        step.position = None
+        with self.assertRaises(ValueError):
+            mcs.PointCloud.from_step(step)
+        cloud = mcs.PointCloud.from_step(
+            step, position={'x': 0.0, 'z': 5.0}, rotation=180)
+        np.testing.assert_allclose(cloud.points[:, 2], 3.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,91 @@
+import pathlib
+import shutil
+import tempfile
+import unittest
+
+import cv2
+import numpy as np
+import PIL
+
+from machine_common_sense.recorder import VideoRecorder
+
+
+class TestVideoRecorder(unittest.TestCase):
+
+    WIDTH = 64
+    HEIGHT = 48
+    FPS = 20
+
+    def setUp(self):
+        self.tmp_dir = pathlib.Path(tempfile.mkdtemp())
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def _create_recorder(self, name='test.mp4'):
+        return VideoRecorder(
+            vid_path=self.tmp_dir / name,
+            width=self.WIDTH,
+            height=self.HEIGHT,
+            fps=self.FPS,
+            timeout=0.01)
+
+    def _count_frames(self, path):
+        capture = cv2.VideoCapture(str(path))
+        count = 0
+        while True:
+            success, _ = capture.read()
+            if not success:
+                break
+            count += 1
+        capture.release()
+        return count
+
+    def test_to_bgr_rgb(self):
+        frame = np.zeros((2, 2, 3), dtype=np.uint8)
+        frame[:, :, 0] = 255
+        bgr = VideoRecorder._to_bgr(frame)
+        self.assertEqual(bgr.shape, (2, 2, 3))
+        self.assertTrue((bgr[:, :, 2] == 255).all())
+        self.assertTrue((bgr[:, :, 0] == 0).all())
+
+    def test_to_bgr_rgba(self):
+        frame = np.zeros((2, 2, 4), dtype=np.uint8)
+        frame[:, :, 2] = 255
+        bgr = VideoRecorder._to_bgr(frame)
+        self.assertEqual(bgr.shape, (2, 2, 3))
+        self.assertTrue((bgr[:, :, 0] == 255).all())
+
+    def test_to_bgr_single_channel(self):
+        frame = np.full((2, 2), 128, dtype=np.uint8)
+        bgr = VideoRecorder._to_bgr(frame)
+        self.assertEqual(bgr.shape, (2, 2, 3))
+        self.assertTrue((bgr == 128).all())
+
+    def test_add_numpy_frames(self):
+        recorder = self._create_recorder()
+        rgb = np.zeros((self.HEIGHT, self.WIDTH, 3), dtype=np.uint8)
+        depth = np.zeros((self.HEIGHT, self.WIDTH), dtype=np.uint8)
+        recorder.add(rgb)
+        recorder.add(depth)
+        recorder.finish()
+        self.assertTrue(recorder.path.exists())
+        self.assertEqual(self._count_frames(recorder.path), 2)
+
+    def test_add_pil_frames(self):
+        recorder = self._create_recorder()
+        image = PIL.Image.new('RGBA', (self.WIDTH, self.HEIGHT))
+        recorder.add(image)
+        recorder.add(image.convert('P'))
+        recorder.finish()
+        self.assertEqual(self._count_frames(recorder.path), 2)
+
+    def test_add_after_finish_ignored(self):
+        recorder = self._create_recorder()
+        recorder.finish()
+        recorder.add(np.zeros((self.HEIGHT, self.WIDTH, 3), dtype=np.uint8))
+        self.assertTrue(recorder.frame_queue.empty())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,148 @@
+import unittest
+
+import numpy as np
+from shapely import geometry
+
+import machine_common_sense as mcs
+from machine_common_sense.reward_geometry import RewardGeometry
+
+
+def create_object(object_id, x, z, width=1.0, depth=1.0, angle=0.0):
+    corners = []
+    cos, sin = np.cos(angle), np.sin(angle)
+    for y in (0.0, 1.0):
+        for dx, dz in ((-1, -1), (1, -1), (1, 1), (-1, 1)):
+            offset_x = dx * width / 2.0
+            offset_z = dz * depth / 2.0
+            corners.append({
+                'x': x + offset_x * cos - offset_z * sin,
+                'y': y,
+                'z': z + offset_x * sin + offset_z * cos
+            })
+    return {
+        'objectId': object_id,
+        'objectBounds': {'objectBoundsCorners': corners},
+        'position': {'x': x, 'y': 0.5, 'z': z}
+    }
+
+
+class TestRewardGeometry(unittest.TestCase):
+
+    def setUp(self):
+        RewardGeometry.clear_cache()
+        self.random = np.random.default_rng(1)
+
+    def random_object(self, object_id='obj'):
+        return create_object(
+            object_id,
+            *self.random.uniform(-3, 3, 2),
+            *self.random.uniform(0.01, 2, 2),
+            self.random.uniform(0, np.pi))
+
+    def test_object_index(self):
+        objects = [create_object('a', 0, 0), create_object('b', 1, 1),
+                   create_object('a', 2, 2)]
+        self.assertIs(RewardGeometry.get_object(objects, 'a'), objects[0])
+        self.assertIs(RewardGeometry.get_object(objects, 'b'), objects[1])
+        self.assertIsNone(RewardGeometry.get_object(objects, 'c'))
+        self.assertIs(RewardGeometry.object_index(objects),
+                      RewardGeometry.object_index(objects))
+        # Changed in place
+        objects[1] = create_object('c', 1, 1)
+        self.assertIs(RewardGeometry.get_object(objects, 'c'), objects[1])
+        self.assertIsNone(RewardGeometry.get_object(objects, 'b'))
+
+    def test_xz_hull_cache(self):
+        obj = create_object('a', 0, 0)
+        hull = RewardGeometry.xz_hull(obj)
+        self.assertEqual(hull.shape, (4, 2))
+        self.assertIs(RewardGeometry.xz_hull(create_object('b', 0, 0)), hull)
+        self.assertIsNot(RewardGeometry.xz_hull(create_object('a', 1, 0)),
+                         hull)
+
+    def test_convex_hull_matches_shapely(self):
+        for _ in range(50):
+            obj = self.random_object()
+            polygon = mcs.Reward._convert_object_to_planar_polygon(obj)
+            hull = RewardGeometry.xz_hull(obj)
+            self.assertAlmostEqual(
+                geometry.Polygon(hull).area, polygon.area, places=9)
+
+    def test_degenerate_hull(self):
+        obj = create_object('a', 0, 0, width=0.0, depth=0.0)
+        hull = RewardGeometry.xz_hull(obj)
+        self.assertEqual(hull.shape, (1, 2))
+        self.assertAlmostEqual(
+            RewardGeometry.point_distance((3, 4), hull), 5.0)
+        segment = RewardGeometry.xz_hull(create_object('b', 0, 0, depth=0.0))
+        self.assertEqual(segment.shape, (2, 2))
+        self.assertAlmostEqual(
+            RewardGeometry.point_distance((0, 2), segment), 2.0)
+
+    def test_point_distance_matches_shapely(self):
+        for _ in range(200):
+            obj = self.random_object()
+            point = self.random.uniform(-5, 5, 2)
+            expected = geometry.Point(*point).distance(
+                mcs.Reward._convert_object_to_planar_polygon(obj))
+            self.assertAlmostEqual(
+                RewardGeometry.point_distance(
+                    point, RewardGeometry.xz_hull(obj)),
+                expected, places=9)
+
+    def test_polygon_distance_matches_shapely(self):
+        intersecting = 0
+        for _ in range(200):
+            obj_a = self.random_object('a')
+            obj_b = self.random_object('b')
+            polygon_a = mcs.Reward._convert_object_to_planar_polygon(obj_a)
+            polygon_b = mcs.Reward._convert_object_to_planar_polygon(obj_b)
+            hull_a = RewardGeometry.xz_hull(obj_a)
+            hull_b = RewardGeometry.xz_hull(obj_b)
+            self.assertAlmostEqual(
+                RewardGeometry.polygon_distance(hull_a, hull_b),
+                polygon_a.distance(polygon_b), places=9)
+            self.assertEqual(RewardGeometry.intersects(hull_a, hull_b),
+                             polygon_a.intersects(polygon_b))
+            intersecting += polygon_a.intersects(polygon_b)
+        self.assertGreater(intersecting, 0)
+
+    def test_degenerate_polygon_distance(self):
+        segment_a = np.array([[0.0, 0.0], [1.0, 0.0]])
+        segment_b = np.array([[2.0, 0.0], [3.0, 0.0]])
+        segment_c = np.array([[0.5, -1.0], [0.5, 1.0]])
+        point = np.array([[1.0, 1.0]])
+        self.assertAlmostEqual(
+            RewardGeometry.polygon_distance(segment_a, segment_b), 1.0)
+        self.assertEqual(
+            RewardGeometry.polygon_distance(segment_a, segment_c), 0.0)
+        self.assertAlmostEqual(
+            RewardGeometry.polygon_distance(segment_a, point), 1.0)
+        square = RewardGeometry.xz_hull(create_object('a', 0, 0, 4, 4))
+        self.assertEqual(
+            RewardGeometry.polygon_distance(square, segment_a), 0.0)
+        self.assertAlmostEqual(
+            RewardGeometry.polygon_distance(square, segment_b), 0.0)
+        self.assertAlmostEqual(RewardGeometry.polygon_distance(
+            square, np.array([[5.0, 0.0], [6.0, 0.0]])), 3.0)
+
+    def test_points_distance(self):
+        obj = self.random_object()
+        polygon = mcs.Reward._convert_object_to_planar_polygon(obj)
+        points = self.random.uniform(-5, 5, (100, 2))
+        np.testing.assert_allclose(
+            RewardGeometry.points_distance(
+                points, RewardGeometry.xz_hull(obj)),
+            [geometry.Point(*point).distance(polygon) for point in points],
+            atol=1e-9)
+
+    def test_crossing_polygons(self):
+        # Overlapping without any vertex inside the other polygon
+        hull_a = RewardGeometry.xz_hull(create_object('a', 0, 0, 4, 1))
+        hull_b = RewardGeometry.xz_hull(create_object('b', 0, 0, 1, 4))
+        self.assertEqual(RewardGeometry.polygon_distance(hull_a, hull_b), 0)
+        self.assertTrue(RewardGeometry.intersects(hull_a, hull_b))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,152 @@
+import unittest
+
+import numpy as np
+
+import machine_common_sense as mcs
+from machine_common_sense.reward_geometry import RewardGeometry
+
+from .test_reward_geometry import create_object
+
+
+class TestRewardTrajectory(unittest.TestCase):
+
+    def setUp(self):
+        RewardGeometry.clear_cache()
+        self.random = np.random.default_rng(2)
+
+    def create_goal(self, category, relationship='next to'):
+        if category == mcs.GoalCategory.TRANSFERRAL.value:
+            return mcs.GoalMetadata(metadata={
+                'category': category,
+                'target_1': {'id': 'action'},
+                'target_2': {'id': 'goal'},
+                'relationship': ['action', relationship, 'goal']
+            })
+        return mcs.GoalMetadata(metadata={
+            'category': category,
+            'target': {'id': 'target'}
+        })
+
+    def random_events(self, object_ids, length=60):
+        event_list = []
+        # A few distinct positions, so that bounds repeat across steps
+        places = {object_id: [self.random.uniform(-1.5, 1.5, 2)
+                              for _ in range(3)]
+                  for object_id in object_ids}
+        for step_number in range(1, length + 1):
+            objects = []
+            for object_id in object_ids:
+                if self.random.random() < 0.1:
+                    # Out of the object list at this step
+                    continue
+                x, z = places[object_id][self.random.integers(3)]
+                obj = create_object(object_id, x, z, 1.0, 0.5)
+                obj['isPickedUp'] = bool(self.random.random() < 0.2)
+                obj['position']['y'] = float(self.random.uniform(0, 1))
+                objects.append(obj)
+            agent = {'position': {
+                'x': float(self.random.uniform(-2, 2)),
+                'y': 0.5,
+                'z': float(self.random.uniform(-2, 2))
+            }}
+            event_list.append((step_number, agent, objects))
+        return event_list
+
+    def check_rewards(self, goal, event_list):
+        trajectory = mcs.RewardTrajectory.from_events(goal, event_list)
+        self.assertEqual(len(trajectory), len(event_list))
+        expected = [
+            mcs.Reward.calculate_reward(goal, objects, agent, step_number)
+            for step_number, agent, objects in event_list
+        ]
+        np.testing.assert_allclose(trajectory.calculate_rewards(), expected)
+        return trajectory
+
+    def test_retrieval(self):
+        goal = self.create_goal(mcs.GoalCategory.RETRIEVAL.value)
+        trajectory = self.check_rewards(goal, self.random_events(['target']))
+        self.assertTrue(trajectory.goal_achieved().any())
+
+    def test_traversal(self):
+        goal = self.create_goal(mcs.GoalCategory.TRAVERSAL.value)
+        trajectory = self.check_rewards(goal, self.random_events(['target']))
+        self.assertTrue(trajectory.goal_achieved().any())
+        self.assertFalse(trajectory.goal_achieved().all())
+
+    def test_transferral_next_to(self):
+        goal = self.create_goal(mcs.GoalCategory.TRANSFERRAL.value)
+        trajectory = self.check_rewards(
+            goal, self.random_events(['action', 'goal', 'other'], 120))
+        self.assertTrue(trajectory.goal_achieved().any())
+
+    def test_transferral_on_top_of(self):
+        goal = self.create_goal(mcs.GoalCategory.TRANSFERRAL.value,
+                                'on top of')
+        trajectory = self.check_rewards(
+            goal, self.random_events(['action', 'goal'], 120))
+        self.assertTrue(trajectory.goal_achieved().any())
+
+    def test_no_goal(self):
+        trajectory = self.check_rewards(
+            mcs.GoalMetadata(), self.random_events(['target'], 5))
+        np.testing.assert_array_equal(trajectory.goal_achieved(), 0)
+
+    def test_missing_objects(self):
+        goal = self.create_goal(mcs.GoalCategory.TRAVERSAL.value)
+        trajectory = self.check_rewards(goal, self.random_events(['other']))
+        np.testing.assert_array_equal(trajectory.goal_achieved(), 0)
+
+    def test_step_penalty(self):
+        goal = self.create_goal(mcs.GoalCategory.RETRIEVAL.value)
+        trajectory = mcs.RewardTrajectory.from_events(
+            goal, self.random_events(['target'], 20))
+        achieved = trajectory.goal_achieved()
+        steps = np.arange(1, 21)
+        np.testing.assert_allclose(
+            trajectory.calculate_rewards(0.01),
+            np.where(achieved == 1, 1 - (steps - 1) * 0.01, -steps * 0.01))
+
+    def test_from_outputs(self):
+        goal = self.create_goal(mcs.GoalCategory.TRAVERSAL.value)
+        event_list = self.random_events(['target'], 20)
+        output_list = [
+            mcs.StepMetadata(
+                step_number=step_number,
+                goal=goal,
+                position=agent['position'],
+                object_list=[mcs.ObjectMetadata(
+                    uuid=obj['objectId'],
+                    dimensions=obj['objectBounds']['objectBoundsCorners'],
+                    held=obj['isPickedUp'],
+                    position=obj['position']
+                ) for obj in objects]
+            )
+            for step_number, agent, objects in event_list
+        ]
+        np.testing.assert_allclose(
+            mcs.RewardTrajectory.from_outputs(
+                None, output_list).calculate_rewards(),
+            mcs.RewardTrajectory.from_events(
+                goal, event_list).calculate_rewards())
+
+    def test_calculate_many(self):
+        trajectory_list = [
+            mcs.RewardTrajectory.from_events(
+                self.create_goal(category), self.random_events(
+                    ['target', 'action', 'goal'], 30))
+            for category in (mcs.GoalCategory.RETRIEVAL.value,
+                             mcs.GoalCategory.TRAVERSAL.value,
+                             mcs.GoalCategory.TRANSFERRAL.value)
+        ]
+        expected = [trajectory.calculate_rewards(0.002)
+                    for trajectory in trajectory_list]
+        for processes in (1, 2):
+            result = list(mcs.RewardTrajectory.calculate_many(
+                trajectory_list, 0.002, processes))
+            self.assertEqual(len(result), len(expected))
+            for rewards, expected_rewards in zip(result, expected):
+                np.testing.assert_allclose(rewards, expected_rewards)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,158 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from machine_common_sense.scoring import Scoring
+
+
+class TestScoring(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def write_scene(self, name, category, answer=None, violation_step=None):
+        scene = {'name': name, 'goal': {'category': category}, 'objects': []}
+        if answer:
+            scene['goal']['answer'] = {'choice': answer}
+        if violation_step:
+            scene['objects'].append({
+                'id': 'ball',
+                'teleports': [{'stepBegin': violation_step}]
+            })
+        path = os.path.join(self.directory, name + '_debug.json')
+        with open(path, 'w') as scene_file:
+            json.dump(scene, scene_file)
+        return path
+
+    def write_history(self, name, choice, confidence, steps=None,
+                      team='team', timestamp='20210101-000000',
+                      streaming=False):
+        info = {'name': name, 'team': team, 'metadata': 'oracle',
+                'timestamp': timestamp}
+        score = {'classification': choice, 'confidence': str(confidence)}
+        steps = steps or []
+        path = os.path.join(self.directory,
+                            f"{name.replace('/', '_')}-{team}-{timestamp}")
+        if streaming:
+            path += '.jsonl'
+            with open(path, 'w') as history_file:
+                history_file.write(json.dumps(
+                    {'type': 'info', 'info': info}) + '\n')
+                for step in steps:
+                    history_file.write(json.dumps(
+                        {'type': 'step', 'step': step}) + '\n')
+                history_file.write(json.dumps(
+                    {'type': 'score', 'score': score}) + '\n')
+        else:
+            path += '.json'
+            with open(path, 'w') as history_file:
+                json.dump({'info': info, 'steps': steps, 'score': score},
+                          history_file)
+        return path
+
+    def test_auc(self):
+        self.assertEqual(Scoring.auc([True, False], [0.9, 0.1]), 1.0)
+        self.assertEqual(Scoring.auc([True, False], [0.1, 0.9]), 0.0)
+        self.assertEqual(Scoring.auc([True, False], [0.5, 0.5]), 0.5)
+        self.assertAlmostEqual(
+            Scoring.auc([True, True, False, False], [0.8, 0.4, 0.6, 0.2]),
+            0.75)
+        self.assertIsNone(Scoring.auc([True, True], [0.1, 0.2]))
+
+    def test_load_ground_truth(self):
+        truth = Scoring.load_ground_truth(self.write_scene(
+            'physics_01', 'intuitive physics', 'implausible', 12))
+        self.assertEqual(truth['scene'], 'physics_01')
+        self.assertEqual(truth['answer'], 'implausible')
+        self.assertEqual(truth['violation_step'], 12)
+        path = os.path.join(self.directory, 'bad.json')
+        with open(path, 'w') as bad_file:
+            bad_file.write('{')
+        self.assertIsNone(Scoring.load_ground_truth(path))
+
+    def test_load_result(self):
+        steps = [
+            {'step': 1, 'output': {'reward': -0.001}},
+            {'step': 2, 'violations_xy_list': [{'x': 1, 'y': 2}],
+             'output': {'reward': 0.999}},
+            {'step': 3, 'output': {'reward': -0.003}}
+        ]
+        for streaming in (False, True):
+            result = Scoring.load_result(self.write_history(
+                'prefix/scene', 'plausible', 0.75, steps,
+                streaming=streaming))
+            self.assertEqual(result['scene'], 'scene')
+            self.assertEqual(result['confidence'], 0.75)
+            self.assertEqual(result['step_count'], 3)
+            self.assertEqual(result['final_reward'], -0.003)
+            self.assertEqual(result['best_reward'], 0.999)
+            self.assertEqual(result['report_step'], 2)
+
+    def test_score(self):
+        scene_list = [
+            self.write_scene('a', 'intuitive physics', 'plausible'),
+            self.write_scene('b', 'intuitive physics', 'implausible', 5),
+            self.write_scene('c', 'agents', 'expected'),
+            self.write_scene('d', 'retrieval'),
+            self.write_scene('e', 'retrieval')
+        ]
+        history_list = [
+            self.write_history('a', 'plausible', 0.9),
+            self.write_history('b', 'implausible', 0.8, [
+                {'step': step, 'classification': (
+                    'implausible' if step >= 7 else 'plausible')}
+                for step in range(1, 10)
+            ], streaming=True),
+            # Only the latest history of a scene counts
+            self.write_history('c', 'plausible', 1.0,
+                               timestamp='20200101-000000'),
+            self.write_history('c', 'unexpected', 0.6),
+            self.write_history('d', '', '', [
+                {'step': 1, 'output': {'reward': -0.001}},
+                {'step': 2, 'output': {'reward': 0.999}}
+            ]),
+            self.write_history('e', '', '', [
+                {'step': 1, 'output': {'reward': -0.001}}
+            ]),
+            self.write_history('other', 'plausible', 1),
+            self.write_history('a', 'implausible', 1, team='other team')
+        ]
+        report = Scoring.score(scene_list, history_list, processes=2)
+        self.assertEqual(report['unmatched'], 1)
+        self.assertEqual(report['unreadable'], 0)
+        self.assertEqual(len(report['runs']), 2)
+        run = report['runs'][0]
+        self.assertEqual(run['team'], 'other team')
+        self.assertEqual(run['scenes'], 1)
+        self.assertEqual(run['missing'], 4)
+        self.assertEqual(run['passive']['overall']['accuracy'], 0)
+
+        run = report['runs'][1]
+        self.assertEqual(run['team'], 'team')
+        self.assertEqual(run['scenes'], 5)
+        overall = run['passive']['overall']
+        self.assertEqual(overall['scenes'], 3)
+        self.assertEqual(overall['correct'], 2)
+        self.assertEqual(overall['auc'], 1.0)
+        physics = run['passive']['categories']['intuitive physics']
+        self.assertEqual(physics['accuracy'], 1.0)
+        self.assertEqual(run['passive']['categories']['agents']['correct'],
+                         0)
+        self.assertEqual(run['localization']['localized'], 1)
+        self.assertEqual(run['localization']['mean_latency'], 2)
+        retrieval = run['interactive']['retrieval']
+        self.assertEqual(retrieval['scenes'], 2)
+        self.assertEqual(retrieval['success_rate'], 0.5)
+        self.assertAlmostEqual(retrieval['mean_reward'], 0.499)
+        self.assertEqual(retrieval['mean_steps'], 1.5)
+
+        self.assertEqual(
+            Scoring.score(scene_list, history_list, processes=1),
+            report)
+
+
+if __name__ == '__main__':
+    unittest.main()
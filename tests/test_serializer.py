@@ -1,8 +1,15 @@
+import copy
+import json
+import shutil
+import tempfile
 import unittest
 
+import msgpack
 import numpy as np
+import PIL.Image
 
 import machine_common_sense as mcs
+from machine_common_sense.compression import Compression
 
 
 class TestSerializer(unittest.TestCase):
@@ -33,6 +40,295 @@ class TestSerializer(unittest.TestCase):
         self.assertEqual(unpacked_metadata.reward, 0.0)
         self.assertEqual(unpacked_metadata.rotation, 0.0)
 
+    def test_serialization_json_base64(self):
+        unpacked_metadata = TestSerializer._helper_get_step_metadata()
+
+        serializer = mcs.SerializerJson()
+        json_dump = serializer.serialize(
+            unpacked_metadata, array_encoding=serializer.ARRAY_ENCODING_BASE64)
+        raw = json.loads(json_dump)
+        self.assertEqual(raw['depth_map_list'][0]['shape'], [400, 600])
+        self.assertEqual(raw['image_list'][0]['mode'], 'RGB')
+        self.assertEqual(raw['reward'], 0.0)
+
+        repacked_metadata = serializer.deserialize(json_dump)
+        np.testing.assert_array_equal(repacked_metadata.depth_map_list[0],
+                                      unpacked_metadata.depth_map_list[0])
+        self.assertEqual(repacked_metadata.depth_map_list[0].dtype,
+                         unpacked_metadata.depth_map_list[0].dtype)
+        np.testing.assert_array_equal(
+            np.asarray(repacked_metadata.image_list[0]),
+            np.asarray(unpacked_metadata.image_list[0]))
+        self.assertEqual(repacked_metadata.rotation, 0.0)
+
+    def test_serialization_json_npy(self):
+        unpacked_metadata = TestSerializer._helper_get_step_metadata()
+        sidecar_directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, sidecar_directory)
+
+        serializer = mcs.SerializerJson()
+        json_dump = serializer.serialize(
+            unpacked_metadata,
+            array_encoding=serializer.ARRAY_ENCODING_NPY,
+            sidecar_directory=sidecar_directory)
+        raw = json.loads(json_dump)
+        self.assertTrue(raw['depth_map_list'][0]['__npy__'].endswith('.npy'))
+
+        repacked_metadata = serializer.deserialize(
+            json_dump, sidecar_directory=sidecar_directory)
+        np.testing.assert_array_equal(repacked_metadata.depth_map_list[0],
+                                      unpacked_metadata.depth_map_list[0])
+        np.testing.assert_array_equal(
+            np.asarray(repacked_metadata.image_list[0]),
+            np.asarray(unpacked_metadata.image_list[0]))
+
+        with self.assertRaises(ValueError):
+            serializer.serialize(
+                unpacked_metadata,
+                array_encoding=serializer.ARRAY_ENCODING_NPY)
+
+    def test_serialization_msgpack_version(self):
+        unpacked_metadata = TestSerializer._helper_get_step_metadata()
+        serializer = mcs.SerializerMsgPack()
+        packed_bytes = serializer.serialize(unpacked_metadata)
+        envelope = msgpack.unpackb(packed_bytes)
+        self.assertEqual(envelope['mcs_serializer_version'],
+                         serializer.version())
+        self.assertNotEqual(serializer.version(), serializer.LEGACY_VERSION)
+
+        repacked_metadata = serializer.deserialize(packed_bytes)
+        self.assertIsInstance(repacked_metadata, mcs.StepMetadata)
+        self.assertEqual(repacked_metadata.reward, 0.0)
+        self.assertEqual(repacked_metadata.camera_clipping_planes,
+                         unpacked_metadata.camera_clipping_planes)
+        self.assertEqual(vars(repacked_metadata.goal),
+                         vars(unpacked_metadata.goal))
+        self.assertEqual(
+            [vars(obj) for obj in repacked_metadata.object_list],
+            [vars(obj) for obj in unpacked_metadata.object_list])
+
+        depth_map = repacked_metadata.depth_map_list[0]
+        np.testing.assert_array_equal(
+            depth_map, unpacked_metadata.depth_map_list[0])
+        # Decoded without copying from the packed bytes
+        self.assertFalse(depth_map.flags.owndata)
+        self.assertFalse(depth_map.flags.writeable)
+
+        image = repacked_metadata.image_list[0]
+        self.assertIsInstance(image, PIL.Image.Image)
+        np.testing.assert_array_equal(
+            np.asarray(image), np.asarray(unpacked_metadata.image_list[0]))
+
+    def test_serialization_msgpack_arrays(self):
+        serializer = mcs.SerializerMsgPack()
+        payload = {
+            'float': np.arange(6, dtype='>f4').reshape(2, 3),
+            'strided': np.arange(12, dtype=np.int16)[::3],
+            'empty': np.zeros((0, 2), dtype=np.uint8),
+            'scalar': np.float32(1.5),
+            'mask': PIL.Image.new('L', (3, 2), 7),
+            'pair': (1, 'a')
+        }
+        unpacked = serializer.deserialize(serializer.serialize(payload))
+        for key in ('float', 'strided', 'empty'):
+            np.testing.assert_array_equal(unpacked[key], payload[key])
+            self.assertEqual(unpacked[key].dtype, payload[key].dtype)
+        self.assertEqual(unpacked['scalar'], 1.5)
+        self.assertEqual(unpacked['mask'].mode, 'L')
+        self.assertEqual(unpacked['mask'].size, (3, 2))
+        self.assertEqual(unpacked['pair'], (1, 'a'))
+
+    def test_serialization_compressed(self):
+        unpacked_metadata = TestSerializer._helper_get_step_metadata()
+        compression = Compression('zlib', 1)
+
+        packed_bytes = mcs.SerializerMsgPack.serialize(
+            unpacked_metadata, compression=compression)
+        self.assertEqual(Compression.detect(packed_bytes), 'zlib')
+        repacked_metadata = mcs.SerializerMsgPack.deserialize(packed_bytes)
+        np.testing.assert_array_equal(repacked_metadata.depth_map_list[0],
+                                      unpacked_metadata.depth_map_list[0])
+
+        json_bytes = mcs.SerializerJson.serialize(
+            unpacked_metadata, array_encoding='base64',
+            compression=compression)
+        self.assertIsInstance(json_bytes, bytes)
+        repacked_metadata = mcs.SerializerJson.deserialize(json_bytes)
+        np.testing.assert_array_equal(repacked_metadata.depth_map_list[0],
+                                      unpacked_metadata.depth_map_list[0])
+
+    def test_serialization_occupancy_grid(self):
+        unpacked_metadata = TestSerializer._helper_get_step_metadata()
+        grid = np.full((3, 4), -1, dtype=np.int8)
+        grid[1, 2] = 1
+        unpacked_metadata.occupancy_grid = grid
+
+        repacked_metadata = mcs.SerializerMsgPack.deserialize(
+            mcs.SerializerMsgPack.serialize(unpacked_metadata))
+        np.testing.assert_array_equal(repacked_metadata.occupancy_grid, grid)
+        self.assertEqual(repacked_metadata.occupancy_grid.dtype, np.int8)
+
+        for array_encoding in ('list', 'base64'):
+            repacked_metadata = mcs.SerializerJson.deserialize(
+                mcs.SerializerJson.serialize(
+                    unpacked_metadata, array_encoding=array_encoding))
+            np.testing.assert_array_equal(
+                repacked_metadata.occupancy_grid, grid)
+            self.assertEqual(repacked_metadata.occupancy_grid.dtype,
+                             np.int8)
+
+        # JSON without the grid, like from earlier versions
+        raw = json.loads(mcs.SerializerJson.serialize(unpacked_metadata))
+        del raw['occupancy_grid']
+        self.assertIsNone(
+            mcs.SerializerJson.deserialize(raw).occupancy_grid)
+
+    def test_serialization_msgpack_legacy(self):
+        unpacked_metadata = TestSerializer._helper_get_step_metadata()
+        serializer = mcs.SerializerMsgPack()
+        packed_bytes = serializer.serialize(
+            unpacked_metadata, version=serializer.LEGACY_VERSION)
+        self.assertIsInstance(msgpack.unpackb(packed_bytes), msgpack.ExtType)
+        repacked_metadata = serializer.deserialize(packed_bytes)
+        self.assertEqual(repacked_metadata.depth_map_list[0].shape,
+                         (400, 600))
+
+        with self.assertRaises(ValueError):
+            serializer.serialize(unpacked_metadata, version='9.9.9')
+        with self.assertRaises(ValueError):
+            serializer.deserialize(msgpack.packb({
+                'mcs_serializer_version': '9.9.9', 'payload': None
+            }))
+
+
+class TestSerializerDeltaStream(unittest.TestCase):
+
+    @staticmethod
+    def _helper_get_steps(count):
+        first_step = TestSerializer._helper_get_step_metadata()
+        image = np.array(first_step.image_list[0])
+        depth_map = np.array(first_step.depth_map_list[0])
+        steps = []
+        for index in range(count):
+            step = copy.copy(first_step)
+            step.step_number = index
+            # A small object moving across the (otherwise still) view
+            moved_image = image.copy()
+            moved_image[100:120, 10 * index:10 * index + 20] = 255
+            step.image_list = [PIL.Image.fromarray(moved_image)]
+            moved_depth_map = depth_map.copy()
+            moved_depth_map[100:120, 10 * index:10 * index + 20] = 1.0
+            step.depth_map_list = [moved_depth_map]
+            step.object_list = [copy.copy(obj)
+                                for obj in first_step.object_list]
+            step.object_list[0].position = {'x': index, 'y': 0, 'z': 0}
+            steps.append(step)
+        return steps
+
+    def assert_steps_equal(self, expected, actual):
+        self.assertIsInstance(actual, mcs.StepMetadata)
+        self.assertEqual(actual.step_number, expected.step_number)
+        self.assertEqual(vars(actual.goal), vars(expected.goal))
+        np.testing.assert_array_equal(
+            np.asarray(actual.image_list[0]),
+            np.asarray(expected.image_list[0]))
+        np.testing.assert_array_equal(
+            actual.depth_map_list[0], expected.depth_map_list[0])
+        self.assertEqual([vars(obj) for obj in actual.object_list],
+                         [vars(obj) for obj in expected.object_list])
+        self.assertEqual(
+            [obj.uuid for obj in actual.structural_object_list],
+            [obj.uuid for obj in expected.structural_object_list])
+
+    def test_round_trip(self):
+        steps = self._helper_get_steps(7)
+        encoder = mcs.SerializerDeltaStream(keyframe_interval=5)
+        decoder = mcs.SerializerDeltaStream()
+        frames = [encoder.serialize(step) for step in steps]
+        for step, frame in zip(steps, frames):
+            self.assert_steps_equal(step, decoder.deserialize(frame))
+
+        encoder = mcs.SerializerDeltaStream(
+            compression=Compression('gzip', 1))
+        decoder = mcs.SerializerDeltaStream()
+        for step in steps:
+            self.assert_steps_equal(
+                step, decoder.deserialize(encoder.serialize(step)))
+
+        keyframes = [msgpack.unpackb(frame, strict_map_key=False,
+                                     ext_hook=lambda code, data: None)
+                     ['keyframe'] for frame in frames]
+        self.assertEqual(keyframes, [True, False, False, False, False,
+                                     True, False])
+        # Delta frames are a small fraction of the keyframes
+        self.assertLess(len(frames[1]) * 20, len(frames[0]))
+
+    def test_removed_object(self):
+        steps = self._helper_get_steps(2)
+        steps[1].object_list = steps[1].object_list[1:]
+        steps[1].image_list = []
+        encoder = mcs.SerializerDeltaStream()
+        decoder = mcs.SerializerDeltaStream()
+        decoder.deserialize(encoder.serialize(steps[0]))
+        step = decoder.deserialize(encoder.serialize(steps[1]))
+        self.assertEqual([obj.uuid for obj in step.object_list],
+                         [obj.uuid for obj in steps[1].object_list])
+        self.assertEqual(step.image_list, [])
+
+    def test_goal_target_image(self):
+        steps = self._helper_get_steps(3)
+        target_image = np.arange(12, dtype=np.uint8).reshape((2, 2, 3))
+        for step in steps:
+            # Equal but distinct goals, like deserialized or replayed output
+            step.goal = mcs.GoalMetadata(metadata={
+                'target': {'id': 'a', 'image': target_image.copy()}
+            })
+        steps[2].goal.metadata['target']['image'][0, 0, 0] = 100
+        encoder = mcs.SerializerDeltaStream()
+        decoder = mcs.SerializerDeltaStream()
+        for step in steps:
+            output = decoder.deserialize(encoder.serialize(step))
+            self.assertEqual(output.step_number, step.step_number)
+            np.testing.assert_array_equal(
+                output.goal.metadata['target']['image'],
+                step.goal.metadata['target']['image'])
+
+    def test_occupancy_grid(self):
+        steps = self._helper_get_steps(4)
+        grid = np.full((20, 20), -1, dtype=np.int8)
+        for index, step in enumerate(steps[:3]):
+            grid = grid.copy()
+            grid[index, :5] = 0
+            step.occupancy_grid = grid
+        encoder = mcs.SerializerDeltaStream()
+        decoder = mcs.SerializerDeltaStream()
+        frames = [encoder.serialize(step) for step in steps]
+        for step, frame in zip(steps, frames):
+            output = decoder.deserialize(frame)
+            if step.occupancy_grid is None:
+                self.assertIsNone(output.occupancy_grid)
+            else:
+                np.testing.assert_array_equal(output.occupancy_grid,
+                                              step.occupancy_grid)
+        # Only the changed cells of the grid
+        fields = msgpack.unpackb(
+            frames[1], strict_map_key=False,
+            ext_hook=mcs.SerializerMsgPack._ext_hook)['fields']
+        self.assertEqual(list(fields['occupancy_grid']['__patch__']),
+                         list(range(20, 25)))
+
+    def test_out_of_order(self):
+        steps = self._helper_get_steps(3)
+        encoder = mcs.SerializerDeltaStream()
+        decoder = mcs.SerializerDeltaStream()
+        frames = [encoder.serialize(step) for step in steps]
+        decoder.deserialize(frames[0])
+        with self.assertRaises(ValueError):
+            decoder.deserialize(frames[2])
+        decoder.reset()
+        with self.assertRaises(ValueError):
+            decoder.deserialize(frames[1])
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,147 @@
+import math
+import unittest
+
+import numpy as np
+
+import machine_common_sense as mcs
+from machine_common_sense.reward_geometry import RewardGeometry
+
+from .test_reward_geometry import create_object
+
+
+def create_metadata(object_id, x, z, width=1.0, depth=1.0, angle=0.0):
+    return mcs.ObjectMetadata(
+        uuid=object_id,
+        dimensions=create_object(
+            object_id, x, z, width, depth, angle
+        )['objectBounds']['objectBoundsCorners'])
+
+
+class TestSpatialIndex(unittest.TestCase):
+
+    def setUp(self):
+        RewardGeometry.clear_cache()
+        self.index = mcs.SpatialIndex()
+        self.index.update(
+            [create_metadata('box', 0, 2),
+             create_metadata('ball', 3, 0, 0.2, 0.2)],
+            [create_metadata('wall', 0, 5, 10, 0.2)])
+
+    def test_update_incremental(self):
+        self.assertEqual(len(self.index), 3)
+        hull = self.index.hull('box')
+        changed = self.index.update(
+            [create_metadata('box', 0, 2),
+             create_metadata('ball', 3, 1, 0.2, 0.2)],
+            [create_metadata('wall', 0, 5, 10, 0.2)])
+        self.assertEqual(changed, ['ball'])
+        self.assertIs(self.index.hull('box'), hull)
+        self.assertEqual(self.index.objects_at((3, 1)), ['ball'])
+        self.assertEqual(self.index.objects_at((3, 0)), [])
+
+        changed = self.index.update([create_metadata('box', 0, 2)])
+        self.assertEqual(sorted(changed), ['ball', 'wall'])
+        self.assertNotIn('wall', self.index)
+        self.assertEqual(self.index.objects_at((0, 5)), [])
+        self.assertEqual(set(self.index._cells),
+                         set(self.index._entries['box'][2]))
+
+    def test_update_from_step(self):
+        index = mcs.SpatialIndex()
+        index.update_from_step(mcs.StepMetadata(
+            object_list=[create_metadata('box', 0, 2)],
+            structural_object_list=[create_metadata('wall', 0, 5, 10, 0.2)]))
+        self.assertTrue(index.is_structural('wall'))
+        self.assertFalse(index.is_structural('box'))
+
+    def test_update_from_metadata(self):
+        index = mcs.SpatialIndex()
+        index.update_from_metadata(
+            [create_object('box', 0, 2), create_object('box', 9, 9),
+             {'objectId': 'unbounded', 'objectBounds': None}],
+            [create_object('wall', 0, 5, 10, 0.2)])
+        self.assertEqual(len(index), 2)
+        self.assertAlmostEqual(index.distance('box', (0, 0)), 1.5)
+        self.assertIsNone(index.distance('unbounded', (0, 0)))
+
+    def test_objects_within(self):
+        self.assertEqual(self.index.objects_within((0, 0), 1.0), [])
+        found = self.index.objects_within((0, 0), 3.0)
+        self.assertEqual([uuid for uuid, _ in found], ['box', 'ball'])
+        self.assertAlmostEqual(found[0][1], 1.5)
+        self.assertAlmostEqual(found[1][1], 2.9)
+        self.assertEqual(
+            self.index.objects_within((0, 0), 5.0, structural=True)[0][0],
+            'wall')
+
+    def test_objects_at(self):
+        self.assertEqual(self.index.objects_at((4.9, 5.05)), ['wall'])
+        self.assertEqual(self.index.objects_at((4.9, 5.05), False), [])
+        self.assertEqual(self.index.objects_at((5.1, 5.05)), [])
+
+    def test_nearest(self):
+        self.assertEqual(self.index.nearest((0, 0))[0], 'box')
+        self.assertEqual(self.index.nearest((0, 0), ignore=['box'])[0],
+                         'ball')
+        self.assertEqual(self.index.nearest((40, 40))[0], 'wall')
+        self.assertIsNone(mcs.SpatialIndex().nearest((0, 0)))
+
+    def test_raycast(self):
+        uuid, distance = self.index.raycast((0, 0), 0, 10)
+        self.assertEqual(uuid, 'box')
+        self.assertAlmostEqual(distance, 1.5)
+        uuid, distance = self.index.raycast((0, 0), 0, 10, ignore=['box'])
+        self.assertEqual(uuid, 'wall')
+        self.assertAlmostEqual(distance, 4.9)
+        uuid, distance = self.index.raycast((0, 0), 90, 10)
+        self.assertEqual(uuid, 'ball')
+        self.assertAlmostEqual(distance, 2.9)
+        self.assertIsNone(self.index.raycast((0, 0), 90, 2))
+        self.assertIsNone(self.index.raycast((0, 0), 180, 10))
+        self.assertEqual(self.index.raycast((0, 2), 45, 10), ('box', 0.0))
+        uuid, distance = self.index.raycast((-2, 0), 45, 10)
+        self.assertEqual(uuid, 'box')
+        self.assertAlmostEqual(distance, 1.5 * math.sqrt(2))
+
+    def test_random_against_brute_force(self):
+        random = np.random.default_rng(3)
+        index = mcs.SpatialIndex(0.5)
+        object_list = [
+            create_metadata(f'obj{number}', *random.uniform(-5, 5, 2),
+                            *random.uniform(0.05, 1.5, 2),
+                            random.uniform(0, np.pi))
+            for number in range(40)
+        ]
+        index.update(object_list)
+        for point in random.uniform(-6, 6, (50, 2)):
+            expected = sorted(
+                (RewardGeometry.point_distance(
+                    point, RewardGeometry.corners_hull(obj.dimensions)),
+                 obj.uuid)
+                for obj in object_list)
+            found = index.objects_within(point, 1.0)
+            self.assertEqual(
+                [uuid for uuid, _ in found],
+                [uuid for distance, uuid in expected if distance <= 1.0])
+            self.assertEqual(index.nearest(point)[0], expected[0][1])
+
+    def test_reward_with_index(self):
+        goal = mcs.GoalMetadata(metadata={
+            'category': mcs.GoalCategory.TRANSFERRAL.value,
+            'target_1': {'id': 'action'},
+            'target_2': {'id': 'goal'},
+            'relationship': ['action', 'next to', 'goal']
+        })
+        objects = [create_object('action', 0, 0), create_object('goal', 1, 0)]
+        agent = {'position': {'x': 0, 'y': 0, 'z': 0}}
+        index = mcs.SpatialIndex()
+        index.update_from_metadata(objects)
+        self.assertEqual(
+            mcs.Reward.calculate_reward(goal, objects, agent, 1, index),
+            mcs.Reward.calculate_reward(goal, objects, agent, 1))
+        self.assertEqual(
+            mcs.Reward.calculate_reward(goal, objects, agent, 1, index), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -27,6 +27,7 @@ class TestStepMetadata(unittest.TestCase):
         "image_list": [],
         "object_list": [],
         "object_mask_list": [],
+        "occupancy_grid": null,
         "pose": "UNDEFINED",
         "position": {},
         "return_status": "UNDEFINED",
@@ -113,6 +114,10 @@ class TestStepMetadata(unittest.TestCase):
         self.assertEqual(self.step_metadata.step_number, 0)
         self.assertIsInstance(self.step_metadata.step_number, int)
 
+    def test_occupancy_grid(self):
+        self.assertIsNone(self.step_metadata.occupancy_grid)
+        self.assertIn('occupancy_grid', dict(self.step_metadata))
+
     def test_structural_object_list(self):
         self.assertFalse(self.step_metadata.structural_object_list)
         self.assertIsInstance(
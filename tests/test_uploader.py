@@ -0,0 +1,270 @@
+import json
+import pathlib
+import shutil
+import tempfile
+import unittest
+from unittest.mock import MagicMock, patch
+
+import PIL
+
+from machine_common_sense.uploader import (
+    LocalUploader,
+    S3Uploader,
+    Uploader,
+    UploadManager,
+    fcntl
+)
+
+
+class TestLocalUploader(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = pathlib.Path(tempfile.mkdtemp())
+        self.uploader = LocalUploader(self.tmp_dir / 'bucket_root', 'bucket')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def test_upload_history(self):
+        history_path = self.tmp_dir / 'history.json'
+        history_path.write_text('{}')
+        self.uploader.upload_history(history_path, 'folder/history.json')
+        uploaded = self.tmp_dir / 'bucket_root/bucket/folder/history.json'
+        self.assertEqual(uploaded.read_text(), '{}')
+        self.assertFalse(uploaded.with_name('history.json.partial').exists())
+
+    def test_upload_image(self):
+        self.uploader.upload_image(PIL.Image.new('RGB', (2, 2)), 'image.png')
+        uploaded = self.tmp_dir / 'bucket_root/bucket/image.png'
+        self.assertEqual(PIL.Image.open(uploaded).size, (2, 2))
+
+
+class TestS3Uploader(unittest.TestCase):
+
+    def test_upload_video(self):
+        client = MagicMock()
+        uploader = S3Uploader('bucket', client=client)
+        uploader.upload_video(pathlib.Path('video.mp4'), 'folder/video.mp4')
+        client.upload_file.assert_called_once()
+        args, kwargs = client.upload_file.call_args
+        self.assertEqual(args, ('video.mp4', 'bucket', 'folder/video.mp4'))
+        self.assertEqual(kwargs['ExtraArgs']['ContentType'], 'video/mp4')
+        self.assertIs(kwargs['Config'], S3Uploader.TRANSFER_CONFIG)
+        self.assertNotIn('ContentEncoding', kwargs['ExtraArgs'])
+
+    @patch('machine_common_sense.uploader._s3_client', None)
+    @patch('machine_common_sense.uploader._s3_client_pool_size', 0)
+    @patch('boto3.client')
+    def test_connection_pool_size(self, client):
+        S3Uploader('bucket', max_workers=4)
+        config = client.call_args[1]['config']
+        self.assertEqual(config.max_pool_connections,
+                         4 * S3Uploader.TRANSFER_CONFIG.max_concurrency)
+        # The shared client is reused while its pool is big enough
+        S3Uploader('bucket', max_workers=2)
+        self.assertEqual(client.call_count, 1)
+        S3Uploader('bucket', max_workers=8)
+        self.assertEqual(client.call_count, 2)
+
+    def test_upload_compressed_history(self):
+        client = MagicMock()
+        uploader = S3Uploader('bucket', client=client)
+        uploader.upload_history(pathlib.Path('history.json.gz'),
+                                'folder/history.json.gz')
+        args, kwargs = client.upload_file.call_args
+        self.assertEqual(kwargs['ExtraArgs']['ContentType'],
+                         'application/json')
+        self.assertEqual(kwargs['ExtraArgs']['ContentEncoding'], 'gzip')
+
+        uploader.upload_history(pathlib.Path('history.json.xz'),
+                                'folder/history.json.xz')
+        args, kwargs = client.upload_file.call_args
+        self.assertEqual(kwargs['ExtraArgs']['ContentType'],
+                         'application/x-xz')
+        self.assertNotIn('ContentEncoding', kwargs['ExtraArgs'])
+
+
+class TestUploadManager(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = pathlib.Path(tempfile.mkdtemp())
+        self.journal_path = self.tmp_dir / 'journal.jsonl'
+        self.uploader = LocalUploader(self.tmp_dir / 'bucket_root', 'bucket')
+        self.file_list = []
+        for index in range(3):
+            path = self.tmp_dir / f'file_{index}.json'
+            path.write_text(str(index))
+            self.file_list.append(path)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def test_submit(self):
+        manager = UploadManager(self.uploader, self.journal_path)
+        futures = [
+            manager.submit(path, 'folder/' + path.name, 'application/json')
+            for path in self.file_list
+        ]
+        for future in futures:
+            future.result(timeout=10)
+        manager.shutdown()
+
+        for path in self.file_list:
+            uploaded = self.tmp_dir / 'bucket_root/bucket/folder' / path.name
+            self.assertEqual(uploaded.read_text(), path.read_text())
+        self.assertEqual(manager.pending(), [])
+
+    def test_failed_upload_stays_pending(self):
+        manager = UploadManager(self.uploader, self.journal_path)
+        missing_path = self.tmp_dir / 'missing.json'
+        future = manager.submit(missing_path, 'missing.json', 'video/mp4')
+        self.assertIsInstance(future.exception(timeout=10), IOError)
+        manager.shutdown()
+
+        pending = manager.pending()
+        self.assertEqual(len(pending), 1)
+        self.assertEqual(pending[0]['filepath'], str(missing_path))
+
+    def test_resume(self):
+        # Simulate a crash: uploads were journaled but never finished.
+        crashed = UploadManager(self.uploader, self.journal_path)
+        for path in self.file_list:
+            crashed._append_journal(UploadManager.JOURNAL_PENDING, {
+                'id': path.stem,
+                'bucket': 'bucket',
+                'filepath': str(path),
+                's3_filename': path.name,
+                'mimetype': 'application/json'
+            })
+        crashed._append_journal(UploadManager.JOURNAL_DONE, {'id': 'file_0'})
+        crashed.shutdown()
+        with open(self.journal_path, 'a') as journal_file:
+            journal_file.write('{"status": "pend')
+
+        manager = UploadManager(self.uploader, self.journal_path)
+        self.assertEqual(len(manager.pending()), 2)
+        futures = manager.resume()
+        self.assertEqual(len(futures), 2)
+        for future in futures:
+            future.result(timeout=10)
+
+        # The journal was compacted on resume.
+        with open(self.journal_path) as journal_file:
+            records = [json.loads(line) for line in journal_file]
+        self.assertEqual(len(records), 4)
+        manager.shutdown()
+
+        bucket_dir = self.tmp_dir / 'bucket_root/bucket'
+        self.assertFalse((bucket_dir / 'file_0.json').exists())
+        self.assertTrue((bucket_dir / 'file_1.json').exists())
+        self.assertTrue((bucket_dir / 'file_2.json').exists())
+        self.assertEqual(manager.pending(), [])
+        # And again on shutdown.
+        self.assertEqual(self.journal_path.read_text(), '')
+
+    def test_resume_skips_missing_files(self):
+        manager = UploadManager(self.uploader, self.journal_path)
+        manager._append_journal(UploadManager.JOURNAL_PENDING, {
+            'id': 'gone',
+            'bucket': 'bucket',
+            'filepath': str(self.tmp_dir / 'gone.json'),
+            's3_filename': 'gone.json',
+            'mimetype': 'application/json'
+        })
+        self.assertEqual(manager.resume(), [])
+        self.assertEqual(manager.pending(), [])
+        manager.shutdown()
+
+    def journal_entry(self, path, bucket='bucket'):
+        return {
+            'id': path.stem,
+            'bucket': bucket,
+            'filepath': str(path),
+            's3_filename': path.name,
+            'mimetype': 'application/json'
+        }
+
+    def test_resume_keeps_other_buckets(self):
+        crashed = UploadManager(self.uploader, self.journal_path)
+        crashed._append_journal(UploadManager.JOURNAL_PENDING,
+                                self.journal_entry(self.file_list[0]),
+                                crashed.owner)
+        crashed._append_journal(UploadManager.JOURNAL_PENDING,
+                                self.journal_entry(self.file_list[1],
+                                                   'other_bucket'),
+                                crashed.owner)
+        crashed.shutdown()
+
+        manager = UploadManager(self.uploader, self.journal_path)
+        futures = manager.resume()
+        self.assertEqual(len(futures), 1)
+        futures[0].result(timeout=10)
+        manager.shutdown()
+        self.assertEqual([entry['bucket'] for entry in manager.pending()],
+                         ['other_bucket'])
+
+    def test_resume_skips_running_managers(self):
+        running = UploadManager(self.uploader, self.journal_path)
+        running._append_journal(UploadManager.JOURNAL_PENDING,
+                                self.journal_entry(self.file_list[0]),
+                                running.owner)
+        crashed = UploadManager(self.uploader, self.journal_path)
+        crashed._append_journal(UploadManager.JOURNAL_PENDING,
+                                self.journal_entry(self.file_list[1]),
+                                crashed.owner)
+        crashed.shutdown()
+
+        manager = UploadManager(self.uploader, self.journal_path)
+        other_manager = UploadManager(self.uploader, self.journal_path)
+        futures = manager.resume()
+        # The uploads taken over by the first manager are not taken again
+        self.assertEqual(other_manager.resume(), [])
+        self.assertEqual(len(futures), 1)
+        futures[0].result(timeout=10)
+        for upload_manager in (manager, other_manager, running):
+            upload_manager.shutdown()
+
+        bucket_dir = self.tmp_dir / 'bucket_root/bucket'
+        self.assertFalse((bucket_dir / 'file_0.json').exists())
+        self.assertTrue((bucket_dir / 'file_1.json').exists())
+        self.assertEqual([entry['id'] for entry in manager.pending()],
+                         ['file_0'])
+
+    @unittest.skipIf(fcntl is None, 'needs fcntl')
+    def test_resume_skips_other_processes(self):
+        # Stand in for a manager running in another process
+        manager = UploadManager(self.uploader, self.journal_path)
+        owner_lock_path = manager.lock_directory / 'other_process.lock'
+        with open(owner_lock_path, 'w') as owner_lock_file:
+            fcntl.flock(owner_lock_file, fcntl.LOCK_EX)
+            manager._append_journal(UploadManager.JOURNAL_PENDING,
+                                    self.journal_entry(self.file_list[0]),
+                                    'other_process')
+            self.assertEqual(manager.resume(), [])
+        # Once the other process exits, its uploads are taken over
+        self.assertEqual(len(manager.resume()), 1)
+        manager.shutdown()
+        self.assertEqual(manager.pending(), [])
+        self.assertFalse(owner_lock_path.exists())
+
+    def test_compact_past_size(self):
+        manager = UploadManager(self.uploader, self.journal_path)
+        manager.COMPACT_SIZE = 1000
+        for index in range(20):
+            manager.submit(self.file_list[index % 3], f'file_{index}.json',
+                           'application/json').result(timeout=10)
+            self.assertLess(self.journal_path.stat().st_size, 1500)
+        self.assertEqual(manager.pending(), [])
+        manager.shutdown()
+
+    def test_abstract_uploader(self):
+        class FileOnlyUploader(Uploader):
+            def _upload_file(self, filepath, bucket, s3_filename, mimetype):
+                pass
+
+        with self.assertRaises(TypeError):
+            FileOnlyUploader('bucket')
+
+
+if __name__ == '__main__':
+    unittest.main()